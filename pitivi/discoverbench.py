@@ -0,0 +1,245 @@
+# PiTiVi , Non-linear video editor
+#
+#       discoverbench.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+"""
+Headless benchmark of the discovery of media files, used by the
+pitivi-discover command.
+"""
+
+from gettext import gettext as _
+from optparse import OptionParser
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import gobject
+gobject.threads_init()
+import gst
+
+try:
+    import json
+except ImportError:
+    json = None
+
+from pitivi.discoverer import Discoverer, ConcurrentDiscoverer
+from pitivi.mediacache import MediaInfoCache
+from pitivi.threads import PathWalker
+from pitivi.utils import quote_uri
+
+# the error set by the discoverer when a file takes too long to analyze
+TIMEOUT_ERROR = _('Timeout while analyzing file.')
+
+SAMPLE_PIPELINES = [
+        ("videotestsrc num-buffers=%(buffers)d ! "
+            "video/x-raw-yuv, width=320, height=240, framerate=25/1 ! "
+            "theoraenc ! oggmux ! filesink location=%(location)s", "ogg"),
+        ("audiotestsrc num-buffers=%(buffers)d samplesperbuffer=1764 ! "
+            "audio/x-raw-int, rate=44100 ! audioconvert ! wavenc ! "
+            "filesink location=%(location)s", "wav")]
+
+
+class DiscoveryBenchmark(object):
+    """
+    Discovers a list of URIs and records the time taken by each one.
+
+    When several files are discovered at once, the time of a file is the time
+    since the previous result, that is the throughput rather than the
+    analysis time of the file.
+
+    @ivar results: The URI, the time taken in seconds, the outcome, C{done},
+    C{error} or C{timeout}, and the error of each discovered file, in the
+    order of the results.
+    @type results: C{list} of C{dict}
+    """
+
+    def __init__(self, uris, concurrency=1, media_cache=None):
+        self.uris = uris
+        if concurrency > 1:
+            self.discoverer = ConcurrentDiscoverer(concurrency, ordered=False,
+                    media_cache=media_cache)
+        else:
+            self.discoverer = Discoverer(media_cache=media_cache)
+        self.discoverer.connect("discovery-done", self._discoveryDoneCb)
+        self.discoverer.connect("discovery-error", self._discoveryErrorCb)
+        self.discoverer.connect("ready", self._readyCb)
+        self.results = []
+        self.start = None
+        self.end = None
+        self._last = None
+        self._loop = None
+
+    def run(self):
+        """
+        Discover the files, blocking until they are all analyzed.
+        """
+        self.start = self._last = time.time()
+        if self.uris:
+            self._loop = gobject.MainLoop()
+            self.discoverer.addUris(self.uris)
+            self._loop.run()
+        self.end = time.time()
+
+    def getSummary(self):
+        """
+        @return: The number of discovered files, errors and timeouts, the
+        total time and the number of files discovered per second.
+        @rtype: C{dict}
+        """
+        elapsed = self.end - self.start
+        errors = [result for result in self.results
+                if result["result"] != "done"]
+        timeouts = [result for result in errors
+                if result["result"] == "timeout"]
+        if elapsed > 0:
+            rate = len(self.results) / elapsed
+        else:
+            rate = 0.0
+        return {"files": len(self.results),
+                "errors": len(errors) - len(timeouts),
+                "timeouts": len(timeouts),
+                "time": elapsed,
+                "files_per_second": rate}
+
+    def _addResult(self, uri, result, error=None):
+        now = time.time()
+        self.results.append({"uri": uri, "time": now - self._last,
+                "result": result, "error": error})
+        self._last = now
+
+    def _discoveryDoneCb(self, discoverer, uri, factory):
+        self._addResult(uri, "done")
+
+    def _discoveryErrorCb(self, discoverer, uri, error, detail):
+        if error == TIMEOUT_ERROR:
+            result = "timeout"
+        else:
+            result = "error"
+        self._addResult(uri, result, error)
+
+    def _readyCb(self, discoverer):
+        self._loop.quit()
+
+
+def generate_samples(directory, count, duration=1):
+    """
+    Write C{count} files of C{duration} seconds in C{directory}, alternately
+    video and audio, generated with videotestsrc and audiotestsrc.
+
+    @return: The URIs of the files.
+    @rtype: C{list} of C{str}
+    """
+    uris = []
+    for index in xrange(count):
+        description, extension = SAMPLE_PIPELINES[index % len(SAMPLE_PIPELINES)]
+        location = os.path.join(directory, "sample-%04d.%s" % (index,
+                extension))
+        pipeline = gst.parse_launch(description % {"buffers": duration * 25,
+                "location": location})
+        pipeline.set_state(gst.STATE_PLAYING)
+        try:
+            message = pipeline.get_bus().timed_pop_filtered(
+                    gst.CLOCK_TIME_NONE, gst.MESSAGE_EOS | gst.MESSAGE_ERROR)
+        finally:
+            pipeline.set_state(gst.STATE_NULL)
+        if message.type == gst.MESSAGE_ERROR:
+            raise RuntimeError("couldn't generate %s: %s" % (location,
+                    message.parse_error()[0].message))
+        uris.append(quote_uri("file://" + location))
+    return uris
+
+
+def _parse_options(argv):
+    parser = OptionParser(usage=_("""
+    %prog [options] [DIRECTORY_OR_FILE ...]
+
+Discovers the media files of the given directories without starting the
+editor, and prints the time taken by each file."""))
+    parser.add_option("-j", "--jobs", type="int", default=1,
+            help=_("Number of files discovered at once."))
+    parser.add_option("-c", "--cache", action="store_true", default=False,
+            help=_("Use the media information cache."))
+    parser.add_option("-g", "--generate", type="int", default=0,
+            metavar="COUNT",
+            help=_("Also discover COUNT generated audio and video files."))
+    parser.add_option("--json", action="store_true", default=False,
+            help=_("Print the results as JSON."))
+    options, args = parser.parse_args(argv[1:])
+    if not args and not options.generate:
+        parser.error(_("No directory or file to discover."))
+    if options.json and json is None:
+        parser.error(_("JSON output requires Python 2.6 or later."))
+    return options, args
+
+
+def main(argv):
+    options, args = _parse_options(argv)
+
+    directory = tempfile.mkdtemp(prefix="pitivi-discover-")
+    try:
+        uris = []
+        if options.generate:
+            uris.extend(generate_samples(directory, options.generate))
+
+        walk_start = time.time()
+        paths = [os.path.abspath(path) for path in args]
+        files = [path for path in paths if not os.path.isdir(path)]
+        uris.extend([quote_uri("file://" + path) for path in files])
+        PathWalker([path for path in paths if path not in files],
+                uris.extend).process()
+        walk_time = time.time() - walk_start
+
+        media_cache = None
+        if options.cache:
+            media_cache = MediaInfoCache(os.path.join(directory, "media"))
+        benchmark = DiscoveryBenchmark(uris, options.jobs, media_cache)
+        benchmark.run()
+        if options.cache:
+            # the second run is served from the cache
+            cached = DiscoveryBenchmark(uris, options.jobs, media_cache)
+            cached.run()
+    finally:
+        shutil.rmtree(directory, True)
+
+    summary = benchmark.getSummary()
+    summary["walk_time"] = walk_time
+    if options.cache:
+        summary["cached"] = cached.getSummary()
+
+    if options.json:
+        summary["results"] = benchmark.results
+        json.dump(summary, sys.stdout, indent=2)
+        print
+        return 0
+
+    for result in benchmark.results:
+        line = "%8.3fs  %-7s  %s" % (result["time"], result["result"],
+                result["uri"])
+        if result["error"]:
+            line += "  (%s)" % result["error"]
+        print line
+    print
+    print _("Walked the directories in %.3fs") % walk_time
+    print _("%(files)d files, %(errors)d errors, %(timeouts)d timeouts "
+            "in %(time).3fs: %(files_per_second).2f files/s") % summary
+    if options.cache:
+        print _("From the cache: %(time).3fs, "
+                "%(files_per_second).2f files/s") % summary["cached"]
+    return 0
@@ -39,6 +39,7 @@ from pitivi.stream import get_stream_for_pad
 from pitivi.signalinterface import Signallable
 from pitivi.stream import VideoStream, TextStream
 from pitivi.settings import xdg_cache_home
+from pitivi.utils import cpu_count
 
 # FIXME: We need to store more information regarding streams
 # i.e. remember the path took to get to a raw stream, and figure out
@@ -95,6 +96,10 @@ class Discoverer(Signallable, Loggable):
     The "discovery-done" signal is emitted an uri is finished being analyzed.
     The "discovery-error" signal is emitted if an error is encountered while
     analyzing an uri.
+
+    When a L{MediaInfoCache} is given, the files which didn't change since
+    they were discovered are not analyzed again, and the files discovered
+    without errors are added to it.
     """
 
     __signals__ = {
@@ -104,8 +109,9 @@ class Discoverer(Signallable, Loggable):
         "starting": None,
         "missing-plugins": ["uri", "detail", "description"]}
 
-    def __init__(self):
+    def __init__(self, media_cache=None):
         Loggable.__init__(self)
+        self.media_cache = media_cache
         self.queue = []
         self.working = False
         self.timeout_id = 0
@@ -229,6 +235,10 @@ class Discoverer(Signallable, Loggable):
     def _emitDone(self, factory):
         self.emit("discovery-done", self.current_uri, factory)
 
+    def _cacheResult(self, factory):
+        if self.media_cache is not None:
+            self.media_cache.put(factory)
+
     def _emitResult(self):
         missing_plugins = bool(self.missing_plugin_details)
         # we got a gst error, error out ASAP
@@ -268,6 +278,7 @@ class Discoverer(Signallable, Loggable):
                 self._emitError()
                 return True
 
+            self._cacheResult(factory)
             self._emitDone(factory)
             return True
 
@@ -414,6 +425,14 @@ class Discoverer(Signallable, Loggable):
                 self._finishAnalysis("File does not exist or is not readable by the current user")
                 return False
 
+        if self.media_cache is not None:
+            factory = self.media_cache.getFactory(self.current_uri)
+            if factory is not None:
+                self.info("Found %s in the media cache", self.current_uri)
+                self._emitDone(factory)
+                self._finishAnalysisAfterResult()
+                return False
+
         # setup graph and start analyzing
         self.pipeline = gst.Pipeline("Discoverer-%s" % self.current_uri)
 
@@ -730,10 +749,156 @@ class Discoverer(Signallable, Loggable):
 
         return stream
 
+
+class DiscoveryJob(object):
+
+    """
+    The discovery of an URI by a L{ConcurrentDiscoverer}.
+
+    @ivar uri: The URI.
+    @type uri: C{str}
+    @ivar finished: Whether the discovery is finished.
+    @type finished: C{bool}
+    @ivar result: The signal to emit with its arguments, C{discovery-done} or
+    C{discovery-error}, or C{None}.
+    @type result: C{tuple}
+    """
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.finished = False
+        self.result = None
+
+
+class ConcurrentDiscoverer(Signallable, Loggable):
+    """
+    Queues requests to discover information about given files, with the same
+    interface as L{Discoverer}, and analyzes several files at once. Each file
+    being analyzed has its own L{Discoverer} and pipeline.
+
+    When C{ordered} is set, the results are emitted in the order the files
+    were added, the result of a file waits for the previous files to be
+    analyzed. Otherwise they are emitted as soon as they are known.
+
+    @ivar concurrency: The maximum number of files analyzed at once.
+    @type concurrency: C{int}
+    @ivar queue: The URIs waiting to be analyzed.
+    @type queue: C{list}
+    @ivar jobs: The URIs being analyzed or whose result wasn't emitted yet,
+    in order.
+    @type jobs: C{list} of L{DiscoveryJob}
+    """
+
+    __signals__ = Discoverer.__signals__
+
+    discovererClass = Discoverer
+
+    def __init__(self, concurrency=None, ordered=True, media_cache=None):
+        """
+        @param concurrency: The maximum number of files analyzed at once,
+        one per processor if C{None}.
+        @type concurrency: C{int}
+        @param media_cache: The cache used by the discoverers.
+        @type media_cache: L{MediaInfoCache}
+        """
+        Loggable.__init__(self)
+        self.media_cache = media_cache
+        if concurrency is None:
+            concurrency = cpu_count()
+        self.concurrency = max(1, concurrency)
+        self.ordered = ordered
+        self.queue = []
+        self.jobs = []
+        self.working = False
+        self.discoverers = []
+        self._idle = []
+        # discoverer => job
+        self._running = {}
+
+    def addUri(self, uri):
+        """ queue a filename to be discovered """
+        self.addUris([uri])
+
+    def addUris(self, uris):
+        """ queue a list of filenames to be discovered """
+        self.info("filenames : %s", uris)
+        if not uris:
+            return
+
+        self.queue.extend(uris)
+        if not self.working:
+            self.working = True
+            self.emit("starting")
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.queue:
+            discoverer = self._getDiscoverer()
+            if discoverer is None:
+                break
+
+            job = DiscoveryJob(self.queue.pop(0))
+            self.jobs.append(job)
+            self._running[discoverer] = job
+            discoverer.addUri(job.uri)
+
+    def _getDiscoverer(self):
+        if self._idle:
+            return self._idle.pop()
+
+        if len(self.discoverers) >= self.concurrency:
+            return None
+
+        discoverer = self.discovererClass(media_cache=self.media_cache)
+        discoverer.connect("discovery-done", self._discoveryDoneCb)
+        discoverer.connect("discovery-error", self._discoveryErrorCb)
+        discoverer.connect("missing-plugins", self._missingPluginsCb)
+        discoverer.connect("ready", self._discovererReadyCb)
+        self.discoverers.append(discoverer)
+        return discoverer
+
+    def _emitResults(self):
+        finished = []
+        for job in self.jobs:
+            if job.finished:
+                finished.append(job)
+            elif self.ordered:
+                break
+
+        # the handlers can add files
+        for job in finished:
+            self.jobs.remove(job)
+            if job.result is not None:
+                self.emit(*job.result)
+
+        if self.working and not self.jobs and not self.queue:
+            self.working = False
+            self.info("discoverer is now ready again")
+            self.emit("ready")
+
+    def _discoveryDoneCb(self, discoverer, uri, factory):
+        self._running[discoverer].result = ("discovery-done", uri, factory)
+
+    def _discoveryErrorCb(self, discoverer, uri, error, detail):
+        self._running[discoverer].result = ("discovery-error", uri, error,
+                detail)
+
+    def _missingPluginsCb(self, discoverer, *args):
+        # the result of the handlers is needed right away
+        return self.emit("missing-plugins", *args)
+
+    def _discovererReadyCb(self, discoverer):
+        job = self._running.pop(discoverer)
+        job.finished = True
+        self._idle.append(discoverer)
+        self._dispatch()
+        self._emitResults()
+
+
 if __name__ == '__main__':
     import sys
 
-    discoverer = Discoverer()
+    discoverer = ConcurrentDiscoverer()
     discoverer.addUris(['file://%s' % i  for i in sys.argv[1:]])
     loop = gobject.MainLoop()
     loop.run()
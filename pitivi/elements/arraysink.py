@@ -28,6 +28,7 @@ import gst
 import gtk
 import array
 from pitivi.utils import native_endianness
+from pitivi.peaks import PeakBuilder, extrema
 
 
 class ArraySink(gst.BaseSink):
@@ -79,3 +80,100 @@ class ArraySink(gst.BaseSink):
         return self.do_render(buf)
 
 gobject.type_register(ArraySink)
+
+
+class PeakSink(ArraySink):
+
+    """
+    Computes the peaks of the audio samples as they arrive instead of storing
+    them, so that whole streams can be processed in one pass.
+
+    @ivar builder: Computes the peaks, created when the caps are known.
+    @type builder: L{PeakBuilder}
+    """
+
+    def __init__(self):
+        ArraySink.__init__(self)
+        self.builder = None
+
+    def do_set_caps(self, caps):
+        if not ArraySink.do_set_caps(self, caps):
+            return False
+        if self.builder is None:
+            self.builder = PeakBuilder(self.rate, self.channels)
+        return True
+
+    def do_render(self, buf):
+        samples = array.array('f')
+        samples.fromstring(buf)
+        self.builder.addSamples(samples)
+        self.duration += buf.duration
+        return gst.FLOW_OK
+
+gobject.type_register(PeakSink)
+
+
+class WaveformSink(ArraySink):
+
+    """
+    Reduces the audio samples to the minimum and maximum of each column of a
+    waveform as they arrive instead of storing them, so that only a few
+    values per column are kept.
+
+    @ivar mins: The minimums of the columns, interleaved by channel.
+    @type mins: C{array.array} of C{'f'}
+    @ivar maxs: The maximums of the columns, interleaved by channel.
+    @type maxs: C{array.array} of C{'f'}
+    """
+
+    def __init__(self):
+        self._column_duration = 0
+        ArraySink.__init__(self)
+
+    def reset(self):
+        ArraySink.reset(self)
+        self.mins = array.array('f')
+        self.maxs = array.array('f')
+        # the samples of the last, incomplete column
+        self._pending = array.array('f')
+
+    def setColumns(self, duration, columns):
+        """
+        Set the duration of the segment which is going to be decoded and the
+        number of columns of its waveform, and forget the previous samples.
+        """
+        self.reset()
+        self._column_duration = duration / columns
+
+    def finish(self):
+        """
+        Add the last, incomplete column, at the end of the segment.
+        """
+        if self._pending:
+            self._addColumns(self._pending, len(self._pending))
+            self._pending = array.array('f')
+
+    def do_render(self, buf):
+        samples = array.array('f')
+        samples.fromstring(buf)
+        if self._pending:
+            self._pending.extend(samples)
+            samples = self._pending
+
+        block = self._getSamplesPerColumn() * self.channels
+        end = len(samples) - (len(samples) % block)
+        if end:
+            self._addColumns(samples[:end], block)
+        self._pending = samples[end:]
+        self.duration += buf.duration
+        return gst.FLOW_OK
+
+    def _getSamplesPerColumn(self):
+        return max(1, int(self.rate * self._column_duration / gst.SECOND))
+
+    def _addColumns(self, samples, block):
+        mins, maxs = extrema(samples, self.channels, block / self.channels)
+        self.mins.extend(mins)
+        self.maxs.extend(maxs)
+
+gobject.type_register(WaveformSink)
@@ -22,10 +22,11 @@
 GdkPixbuf thumbnail sink
 """
 
+import threading
+
 import gobject
 import gst
 import cairo
-import array
 from pitivi.utils import big_to_cairo_alpha_mask, big_to_cairo_red_mask, big_to_cairo_green_mask, big_to_cairo_blue_mask
 
 
@@ -33,7 +34,12 @@ class CairoSurfaceThumbnailSink(gst.BaseSink):
     """
     GStreamer thumbnailing sink element.
 
-    Can be used in pipelines to generates gtk.gdk.Pixbuf automatically.
+    Can be used in pipelines to generates cairo surfaces automatically.
+
+    The frames are copied into surfaces taken from a pool of surfaces of the
+    size of the thumbnails. The receivers of the C{thumbnail} signal should
+    give back the surfaces they don't keep with L{releaseSurface}, so that
+    they are reused for the next frames.
     """
 
     __gsignals__ = {
@@ -62,39 +68,90 @@ class CairoSurfaceThumbnailSink(gst.BaseSink):
                                      big_to_cairo_blue_mask)))
         )
 
-    def __init__(self):
+    def __init__(self, pool_size=4):
+        """
+        @param pool_size: The maximum number of unused surfaces kept for the
+        next frames.
+        @type pool_size: C{int}
+        """
         gst.BaseSink.__init__(self)
-        self._width = 1
-        self._height = 1
+        self.width = 1
+        self.height = 1
+        self.pool_size = pool_size
         self.set_sync(False)
+        # the surfaces are given back from the main thread
+        self._lock = threading.Lock()
+        self._free = []
+
+    def releaseSurface(self, surface):
+        """
+        Give back a surface emitted with the C{thumbnail} signal, it's reused
+        for a next frame. The surface must not be used anymore by the caller.
+        """
+        self._lock.acquire()
+        try:
+            if len(self._free) < self.pool_size and \
+                    surface.get_width() == self.width and \
+                    surface.get_height() == self.height and \
+                    not [free for free in self._free if free is surface]:
+                self._free.append(surface)
+        finally:
+            self._lock.release()
 
     def do_set_caps(self, caps):
         self.log("caps %s" % caps.to_string())
         self.log("padcaps %s" % self.get_pad("sink").get_caps().to_string())
-        self.width = caps[0]["width"]
-        self.height = caps[0]["height"]
         if not caps[0].get_name() == "video/x-raw-rgb":
             return False
+
+        self.width = caps[0]["width"]
+        self.height = caps[0]["height"]
+        self._lock.acquire()
+        try:
+            self._free = []
+        finally:
+            self._lock.release()
         return True
 
     def do_render(self, buf):
         self.log("buffer %s %d" % (gst.TIME_ARGS(buf.timestamp),
-                                   len(buf.data)))
-        b = array.array("b")
-        b.fromstring(buf)
-        pixb = cairo.ImageSurface.create_for_data(b,
-            # We don't use FORMAT_ARGB32 because Cairo uses premultiplied
-            # alpha, and gstreamer does not.  Discarding the alpha channel
-            # is not ideal, but the alternative would be to compute the
-            # conversion in python (slow!).
-            cairo.FORMAT_RGB24,
-            self.width,
-            self.height,
-            self.width * 4)
-
-        self.emit('thumbnail', pixb, buf.timestamp)
+                                   buf.size))
+        surface = self._getSurface()
+        self._copyFrame(buf, surface)
+        self.emit('thumbnail', surface, buf.timestamp)
         return gst.FLOW_OK
 
+    def _getSurface(self):
+        self._lock.acquire()
+        try:
+            if self._free:
+                return self._free.pop()
+        finally:
+            self._lock.release()
+        return self._makeSurface()
+
+    def _makeSurface(self):
+        # We don't use FORMAT_ARGB32 because Cairo uses premultiplied
+        # alpha, and gstreamer does not.  Discarding the alpha channel
+        # is not ideal, but the alternative would be to compute the
+        # conversion in python (slow!).
+        return cairo.ImageSurface(cairo.FORMAT_RGB24, self.width,
+                self.height)
+
+    def _copyFrame(self, buf, surface):
+        # copy the frame straight into the memory of the surface
+        row = self.width * 4
+        stride = surface.get_stride()
+        data = surface.get_data()
+        surface.flush()
+        if stride == row:
+            size = row * self.height
+            data[0:size] = buffer(buf, 0, size)
+        else:
+            for y in xrange(self.height):
+                data[y * stride:y * stride + row] = buffer(buf, y * row, row)
+        surface.mark_dirty()
+
     def do_preroll(self, buf):
         return self.do_render(buf)
 
@@ -36,7 +36,7 @@ from pitivi.timeline.timeline import TimelineObject
 from pitivi.formatters.base import Formatter, FormatterError
 from pitivi.utils import get_filesystem_encoding
 from pitivi.settings import ExportSettings
-from pitivi.stream import match_stream_groups_map
+from pitivi.stream import match_stream_groups_map, VideoStream
 
 version = "0.1"
 
@@ -74,8 +74,19 @@ class ElementTreeFormatterLoadContext(ElementTreeFormatterContext):
 
 
 class ElementTreeFormatter(Formatter):
+    """
+    Loads and saves projects as XML.
+
+    @cvar trust_streams: Whether projects are loaded from the saved
+    description of the streams of their sources, the files being checked in
+    the background, instead of discovering the sources again before filling
+    the timeline.
+    @type trust_streams: C{bool}
+    """
+
     _element_id = 0
     _our_properties = ["id", "type"]
+    trust_streams = True
 
     def __init__(self, avalaible_effects, *args, **kwargs):
         Formatter.__init__(self, avalaible_effects, *args, **kwargs)
@@ -122,6 +133,10 @@ class ElementTreeFormatter(Formatter):
         element.attrib["type"] = qual(stream.__class__)
         element.attrib["caps"] = str(stream.caps)
         element.attrib["name"] = str(stream.pad_name)
+        if isinstance(stream, VideoStream):
+            element.attrib["is_image"] = str(int(stream.is_image))
+            if stream.thumbnail is not None:
+                element.attrib["thumbnail"] = stream.thumbnail
 
         self._context.streams[stream] = element
 
@@ -132,7 +147,12 @@ class ElementTreeFormatter(Formatter):
         klass = namedAny(element.attrib["type"])
         caps = gst.Caps(element.attrib["caps"])
 
-        stream = klass(caps, element.attrib.get("name", None))
+        if issubclass(klass, VideoStream):
+            is_image = bool(int(element.attrib.get("is_image", 0)))
+            stream = klass(caps, element.attrib.get("name", None), is_image)
+            stream.thumbnail = element.attrib.get("thumbnail", None)
+        else:
+            stream = klass(caps, element.attrib.get("name", None))
 
         self._context.streams[id_] = stream
 
@@ -410,18 +430,43 @@ class ElementTreeFormatter(Formatter):
         element.append(curves)
 
     def _loadTrackObject(self, track, element):
+        track_object = self._newTrackObject(element)
+        track.addTrackObject(track_object)
+        self._loadTrackObjectContents(track_object, element)
+        return track_object
+
+    def _newTrackObject(self, element):
+        """
+        Create the track object described by C{element} without adding it to
+        a track.
+
+        Once the object is in its track, L{_loadTrackObjectContents} must be
+        called to load what needs the object's gstreamer element.
+        """
         self.debug("%r", element)
         klass = namedAny(element.attrib["type"])
         if klass is TrackEffect:
-            track_object = self._loadEffectTrackObject(element, klass, track)
+            track_object = self._newEffectTrackObject(element, klass)
         else:
-            track_object = self._loadSourceTrackObject(element, klass, track)
+            track_object = self._newSourceTrackObject(element, klass)
+
+        for name, value_string in self._filterElementProperties(element):
+            value = self._parsePropertyValue(value_string)
+            setattr(track_object, name, value)
+
         return track_object
 
-    def _loadEffectTrackObject(self, element, klass, track):
+    def _loadTrackObjectContents(self, track_object, element):
+        if isinstance(track_object, TrackEffect):
+            self._loadEffectProperties(track_object, element)
+        else:
+            self._loadCurves(track_object, element)
+
+        self._context.track_objects[element.attrib["id"]] = track_object
+
+    def _newEffectTrackObject(self, element, klass):
         effect_element = element.find('effect')
         factory_name = effect_element.find('factory').attrib['name']
-        properties_elem = effect_element.find('gst-element-properties')
         try:
             factory = self.avalaible_effects.getFactoryFromName(factory_name)
         except KeyError:
@@ -433,41 +478,30 @@ class ElementTreeFormatter(Formatter):
         if not input_stream:
             raise FormatterError("cant find effect factory input stream")
         input_stream = input_stream[0]
-        track_object = klass(factory, input_stream)
-        track.addTrackObject(track_object)
-
-        for name, value_string in self._filterElementProperties(element):
-            value = self._parsePropertyValue(value_string)
-            setattr(track_object, name, value)
+        return klass(factory, input_stream)
 
+    def _loadEffectProperties(self, track_object, element):
+        properties_elem = element.find('effect').find('gst-element-properties')
         effect_gst_element = track_object.getElement()
         for name, value in properties_elem.attrib.iteritems():
             value = self._parsePropertyValue(value)
             effect_gst_element.set_property(name, value)
 
-        self._context.track_objects[element.attrib["id"]] = track_object
-        return track_object
-
-    def _loadSourceTrackObject(self, element, klass, track):
+    def _newSourceTrackObject(self, element, klass):
         factory_ref = element.find("factory-ref")
         factory = self._loadFactoryRef(factory_ref)
 
         stream_ref = element.find("stream-ref")
         stream = self._loadStreamRef(stream_ref)
 
-        track_object = klass(factory, stream)
-        for name, value_string in self._filterElementProperties(element):
-            value = self._parsePropertyValue(value_string)
-            setattr(track_object, name, value)
-        track.addTrackObject(track_object)
+        return klass(factory, stream)
+
+    def _loadCurves(self, track_object, element):
         curves_element = element.find("curves")
         if curves_element is not None:
             for curve in curves_element.getchildren():
                 self._loadInterpolator(curve, track_object)
 
-        self._context.track_objects[element.attrib["id"]] = track_object
-        return track_object
-
     def _saveInterpolator(self, interpolator, prop):
         typename = prop.value_type.name
         element = Element("curve", property=prop.name, type=typename,
@@ -576,9 +610,16 @@ class ElementTreeFormatter(Formatter):
 
         track = Track(stream)
 
+        # add all the track objects to the track in one go, then load what
+        # needs their gstreamer elements
         track_objects_element = element.find("track-objects")
-        for track_object_element in track_objects_element:
-            self._loadTrackObject(track, track_object_element)
+        track_object_elements = list(track_objects_element)
+        track_objects = [self._newTrackObject(track_object_element)
+                for track_object_element in track_object_elements]
+        track.addTrackObjects(track_objects)
+        for track_object, track_object_element in \
+                zip(track_objects, track_object_elements):
+            self._loadTrackObjectContents(track_object, track_object_element)
 
         return track
 
@@ -674,11 +715,10 @@ class ElementTreeFormatter(Formatter):
             timeline.addTrack(track)
 
         # add the timeline objects
-        for timeline_object in timeline_objects:
-            # NOTE: this is a low-level routine that simply appends the
-            # timeline object to the timeline list. It doesn't ensure all the
-            # child track objects have been added to their respective tracks.
-            timeline.addTimelineObject(timeline_object)
+        # NOTE: this is a low-level routine that simply appends the
+        # timeline objects to the timeline list. It doesn't ensure all the
+        # child track objects have been added to their respective tracks.
+        timeline.addTimelineObjects(timeline_objects)
 
         return timeline
 
@@ -734,6 +774,10 @@ class ElementTreeFormatter(Formatter):
             self.emit("new-project-failed", project_uri, e)
             return
 
+        if self.trust_streams and self._haveStreams(sources):
+            self._loadProjectFromStreams(project, sources)
+            return
+
         uris = [source.uri for source in sources]
         project.sources.nb_file_to_import = len(uris)
         discoverer = project.sources.discoverer
@@ -749,6 +793,22 @@ class ElementTreeFormatter(Formatter):
         source = sources[0]
         discoverer.addUri(source.uri)
 
+    def _haveStreams(self, sources):
+        for source in sources:
+            if not source.getOutputStreams():
+                return False
+        return True
+
+    def _loadProjectFromStreams(self, project, sources):
+        project.sources.nb_file_to_import = len(sources)
+        for source in sources:
+            project.sources.addFactory(source)
+        self._finishLoadingProject(project)
+
+        # the clips whose files changed are updated or reported later
+        project.sources.validateFactories([source for source in sources
+                if isinstance(source, FileSourceFactory)])
+
     def _findFactoryContextKey(self, old_factory):
         key = None
         for k, old_factory1 in self._context.factories.iteritems():
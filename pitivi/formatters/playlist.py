@@ -88,9 +88,8 @@ class PlaylistFormatter(LoadOnlyFormatter):
         audio = AudioStream(gst.Caps('audio/x-raw-int; audio/x-raw-float'))
         track = Track(audio)
         self.project.timeline.addTrack(track)
-        for uri in self._uris:
-            factory = self.project.sources.getUri(uri)
-            self.project.timeline.addSourceFactory(factory)
+        factories = [self.project.sources.getUri(uri) for uri in self._uris]
+        self.project.timeline.addSourceFactories(factories)
 
     @classmethod
     def canHandle(cls, uri):
@@ -0,0 +1,302 @@
+# PiTiVi , Non-linear video editor
+#
+#       mediacache.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+"""
+Persistent cache of the information discovered about media files.
+
+The information about a file is stored in an XML file named after its URI,
+along with the size and modification time of the file when it was
+discovered, so that stale entries are detected with a single stat.
+"""
+
+import errno
+import hashlib
+import os
+from xml.etree.ElementTree import Element, SubElement, tostring, parse
+from xml.parsers.expat import ExpatError
+
+import gobject
+import gst
+
+from pitivi.log.loggable import Loggable
+from pitivi.reflect import qual, namedAny
+from pitivi.factories.file import FileSourceFactory
+from pitivi.stream import VideoStream, AudioStream, TextStream
+from pitivi.settings import xdg_cache_home
+from pitivi.discoverer import ConcurrentDiscoverer
+from pitivi.threads import PathWalker
+
+MEDIA_SUFFIX = ".xml"
+
+# the stream classes which can be read from the cache, by qualified name
+STREAM_TYPES = dict([(qual(klass), klass)
+        for klass in (VideoStream, AudioStream, TextStream)])
+
+
+def _stat_uri(uri):
+    """
+    @return: The size and modification time of the file of C{uri}, or
+    C{None} if it's not a local file or it can't be accessed.
+    """
+    if not gst.uri_is_valid(uri) or gst.uri_get_protocol(uri) != "file":
+        return None
+    try:
+        stat = os.stat(gst.uri_get_location(uri))
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+class MediaInfo(object):
+
+    """
+    The information discovered about a file, from which its factory is
+    rebuilt.
+
+    @ivar uri: The URI of the file.
+    @type uri: C{str}
+    @ivar factory_type: The class of the factory of the file.
+    @type factory_type: C{type}
+    @ivar duration: The duration of the file.
+    @type duration: C{long}
+    @ivar streams: The description of the output streams of the factory:
+    their class, caps, pad name, and for video streams whether they are
+    images and their thumbnail.
+    @type streams: C{list} of C{dict}
+    """
+
+    def __init__(self, uri, factory_type, duration, streams):
+        self.uri = uri
+        self.factory_type = factory_type
+        self.duration = duration
+        self.streams = streams
+
+    def makeFactory(self):
+        """
+        Return a new factory of the file with the cached streams.
+
+        @rtype: L{FileSourceFactory}
+        """
+        factory = self.factory_type(self.uri)
+        factory.duration = self.duration
+        for description in self.streams:
+            klass = description["type"]
+            caps = gst.Caps(description["caps"])
+            if issubclass(klass, VideoStream):
+                stream = klass(caps, description["name"],
+                        description["is_image"])
+                stream.thumbnail = description["thumbnail"]
+            else:
+                stream = klass(caps, description["name"])
+            factory.addOutputStream(stream)
+        return factory
+
+
+class MediaInfoCache(Loggable):
+
+    """
+    A directory of the information discovered about media files, see
+    L{Discoverer}.
+    """
+
+    def __init__(self, directory):
+        Loggable.__init__(self)
+        self.directory = directory
+
+    def getFilename(self, uri):
+        """
+        @return: The file storing the information about C{uri}.
+        @rtype: C{str}
+        """
+        return os.path.join(self.directory,
+                hashlib.md5(uri).hexdigest() + MEDIA_SUFFIX)
+
+    def get(self, uri):
+        """
+        Return the cached information about C{uri}, C{None} if there's none
+        or if the file changed since it was discovered.
+
+        @rtype: L{MediaInfo}
+        """
+        stat = _stat_uri(uri)
+        if stat is None:
+            return None
+
+        filename = self.getFilename(uri)
+        try:
+            root = parse(filename).getroot()
+            if root.attrib["uri"] != uri or \
+                    long(root.attrib["size"]) != stat[0] or \
+                    float(root.attrib["mtime"]) != stat[1]:
+                self.debug("stale media info for %s", uri)
+                self.invalidate(uri)
+                return None
+            info = self._loadMediaInfo(root)
+        except IOError:
+            return None
+        except (ExpatError, SyntaxError, KeyError, ValueError,
+                AttributeError, TypeError, ImportError), e:
+            self.warning("invalid media info for %s: %s", uri, e)
+            self.invalidate(uri)
+            return None
+
+        # the thumbnails of the discoverer can be cleaned up separately
+        for description in info.streams:
+            thumbnail = description.get("thumbnail")
+            if thumbnail is not None and not os.path.exists(thumbnail):
+                self.invalidate(uri)
+                return None
+
+        return info
+
+    def getFactory(self, uri):
+        """
+        @return: A new factory of C{uri} built from the cache, or C{None} if
+        the file has to be discovered.
+        @rtype: L{FileSourceFactory}
+        """
+        info = self.get(uri)
+        if info is None:
+            return None
+        return info.makeFactory()
+
+    def put(self, factory):
+        """
+        Store the information about the file of C{factory}.
+        """
+        uri = factory.uri
+        stat = _stat_uri(uri)
+        if stat is None:
+            return
+
+        root = Element("media")
+        root.attrib["uri"] = uri
+        root.attrib["size"] = str(stat[0])
+        root.attrib["mtime"] = repr(stat[1])
+        root.attrib["type"] = qual(factory.__class__)
+        root.attrib["duration"] = str(factory.duration)
+        for stream in factory.getOutputStreams():
+            element = SubElement(root, "stream")
+            element.attrib["type"] = qual(stream.__class__)
+            element.attrib["caps"] = str(stream.caps)
+            if stream.pad_name is not None:
+                element.attrib["name"] = stream.pad_name
+            if isinstance(stream, VideoStream):
+                element.attrib["is_image"] = str(int(stream.is_image))
+                if stream.thumbnail is not None:
+                    element.attrib["thumbnail"] = stream.thumbnail
+
+        filename = self.getFilename(uri)
+        tmp = filename + ".tmp"
+        try:
+            try:
+                os.makedirs(self.directory)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+            mediafile = open(tmp, "w")
+            try:
+                mediafile.write(tostring(root))
+            finally:
+                mediafile.close()
+            os.rename(tmp, filename)
+        except (IOError, OSError), e:
+            self.warning("couldn't save media info to %s: %s", filename, e)
+
+    def invalidate(self, uri=None):
+        """
+        Remove the information about C{uri}, or about all the files if
+        C{uri} is C{None}.
+        """
+        if uri is not None:
+            filenames = [self.getFilename(uri)]
+        else:
+            try:
+                filenames = [os.path.join(self.directory, name)
+                        for name in os.listdir(self.directory)
+                        if name.endswith(MEDIA_SUFFIX)]
+            except OSError:
+                return
+
+        for filename in filenames:
+            try:
+                os.unlink(filename)
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    self.warning("couldn't remove %s: %s", filename, e)
+
+    def warm(self, directories):
+        """
+        Discover the files of C{directories} which aren't cached yet, in the
+        background. The directories are walked by a thread and the files
+        are discovered without blocking the main loop.
+
+        @return: The discoverer of the files, it emits C{ready} when it's
+        idle.
+        @rtype: L{ConcurrentDiscoverer}
+        """
+        discoverer = ConcurrentDiscoverer(ordered=False, media_cache=self)
+
+        def found(uris):
+            # called from the walker thread
+            gobject.idle_add(self._warmUris, discoverer, uris)
+
+        walker = PathWalker(directories, found)
+        walker.setDaemon(True)
+        walker.start()
+        return discoverer
+
+    def _warmUris(self, discoverer, uris):
+        discoverer.addUris([uri for uri in uris if self.get(uri) is None])
+        return False
+
+    def _loadMediaInfo(self, root):
+        streams = []
+        for element in root.findall("stream"):
+            is_image = element.attrib.get("is_image")
+            streams.append({
+                "type": STREAM_TYPES[element.attrib["type"]],
+                "caps": element.attrib["caps"],
+                "name": element.attrib.get("name"),
+                "is_image": bool(int(is_image or 0)),
+                "thumbnail": element.attrib.get("thumbnail")})
+
+        factory_type = namedAny(root.attrib["type"])
+        if not isinstance(factory_type, type) or \
+                not issubclass(factory_type, FileSourceFactory):
+            raise ValueError("not a file factory: %s" % root.attrib["type"])
+
+        return MediaInfo(root.attrib["uri"], factory_type,
+                long(root.attrib["duration"]), streams)
+
+
+media_info_cache = None
+
+
+def get_media_info_cache():
+    """
+    Return the media information cache shared by the discoverers.
+
+    @rtype: L{MediaInfoCache}
+    """
+    global media_info_cache
+    if media_info_cache is None:
+        media_info_cache = MediaInfoCache(os.path.join(xdg_cache_home(),
+                "pitivi", "media"))
+    return media_info_cache
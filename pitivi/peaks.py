@@ -0,0 +1,402 @@
+# PiTiVi , Non-linear video editor
+#
+#       peaks.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+"""
+Multi-resolution waveform peaks of audio streams.
+
+The peaks of a stream are the minimum and maximum sample values of each
+block of samples, computed at several block sizes (samples per peak) so that
+waveforms can be drawn at any zoom ratio without decoding the stream. The
+values are quantized to signed bytes, which is plenty for drawing.
+
+A peak file is a header followed by the levels, each level storing the
+minimums then the maximums of its blocks, interleaved by channel:
+
+    magic | rate, channels, levels | (spp, count) * levels | data
+"""
+
+import array
+import errno
+import math
+import os
+import struct
+
+try:
+    import numpy
+except ImportError:
+    HAVE_NUMPY = False
+else:
+    HAVE_NUMPY = True
+
+from pitivi.thumbnailstore import file_cache_key
+from pitivi.threads import CallbackThread
+from pitivi.log.loggable import Loggable
+
+PEAKS_MAGIC = "PTVPEAK1"
+PEAKS_SUFFIX = ".peaks"
+
+# rate, channels, number of levels
+PEAKS_HEADER = struct.Struct("!III")
+# samples per peak, number of peaks
+LEVEL_HEADER = struct.Struct("!II")
+
+# each level is 4 times coarser than the previous one, at 48kHz the finest
+# level has 187.5 peaks per second and the coarsest one less than a peak per
+# second
+DEFAULT_LEVELS = (256, 1024, 4096, 16384, 65536)
+
+
+def quantize(value):
+    """
+    Convert a sample value between -1.0 and 1.0 to a signed byte.
+    """
+    value = int(round(value * 127))
+    return max(-127, min(127, value))
+
+
+def quantize_all(values):
+    """
+    Convert sample values between -1.0 and 1.0 to signed bytes, like
+    L{quantize}.
+
+    @type values: C{array.array} of C{'f'}
+    @rtype: C{array.array} of C{'b'}
+    """
+    if not HAVE_NUMPY:
+        return array.array("b", map(quantize, values))
+
+    values = numpy.frombuffer(values, numpy.float32).astype(numpy.float64)
+    # round half away from zero, like round()
+    values = numpy.sign(values) * numpy.floor(numpy.abs(values) * 127 + 0.5)
+    values = numpy.clip(values, -127, 127).astype(numpy.int8)
+    return array.array("b", values.tostring())
+
+
+def extrema(samples, channels, spp):
+    """
+    Return the minimum and maximum of each block of C{spp} samples of each
+    channel, the last block may be shorter.
+
+    The reduction is vectorized with NumPy when it's available.
+
+    @param samples: Samples interleaved by channel.
+    @type samples: C{array.array}
+    @return: The minimums and maximums, interleaved by channel, with the
+    type of C{samples}.
+    @rtype: C{tuple} of two C{array.array}
+    """
+    typecode = samples.typecode
+    frames = len(samples) / channels
+    if not frames:
+        return array.array(typecode), array.array(typecode)
+
+    if not HAVE_NUMPY:
+        mins = array.array(typecode)
+        maxs = array.array(typecode)
+        end = frames * channels
+        block = spp * channels
+        for i in xrange(0, end, block):
+            for chan in xrange(channels):
+                hunk = samples[i + chan:min(i + block, end):channels]
+                mins.append(min(hunk))
+                maxs.append(max(hunk))
+        return mins, maxs
+
+    data = numpy.frombuffer(samples, numpy.dtype(typecode))
+    data = data[:frames * channels].reshape(frames, channels)
+    columns = frames / spp
+    # reduce the complete blocks along the samples axis
+    blocks = data[:columns * spp].reshape(columns, spp, channels)
+    mins = blocks.min(axis=1)
+    maxs = blocks.max(axis=1)
+    if columns * spp < frames:
+        rest = data[columns * spp:]
+        mins = numpy.vstack((mins, rest.min(axis=0)))
+        maxs = numpy.vstack((maxs, rest.max(axis=0)))
+
+    return (array.array(typecode, mins.tostring()),
+            array.array(typecode, maxs.tostring()))
+
+
+class PeakLevel(object):
+
+    """
+    The peaks of a stream at one resolution.
+
+    @ivar spp: The number of samples per peak.
+    @type spp: C{int}
+    @ivar mins: The quantized minimums, interleaved by channel.
+    @type mins: C{array.array} of C{'b'}
+    @ivar maxs: The quantized maximums, interleaved by channel.
+    @type maxs: C{array.array} of C{'b'}
+    """
+
+    def __init__(self, spp, mins, maxs):
+        self.spp = spp
+        self.mins = mins
+        self.maxs = maxs
+
+
+class Peaks(object):
+
+    """
+    The peak pyramid of a stream, see L{PeakBuilder}.
+
+    @ivar rate: The sample rate of the stream.
+    @type rate: C{int}
+    @ivar channels: The number of channels of the stream.
+    @type channels: C{int}
+    @ivar levels: The levels, from the finest to the coarsest.
+    @type levels: C{list} of L{PeakLevel}
+    """
+
+    def __init__(self, rate, channels, levels):
+        self.rate = rate
+        self.channels = channels
+        self.levels = levels
+
+    def getCount(self, level):
+        """
+        @return: The number of peaks of each channel in C{level}.
+        @rtype: C{int}
+        """
+        return len(level.mins) / self.channels
+
+    def getLevel(self, spp):
+        """
+        Return the level whose resolution is the nearest to C{spp} samples
+        per peak, or C{None} if C{spp} is too fine for all the levels, in
+        which case the samples have to be decoded.
+
+        @type spp: C{float}
+        @rtype: L{PeakLevel}
+        """
+        if not self.levels or spp < self.levels[0].spp / 2.0:
+            return None
+
+        # levels are spaced geometrically, compare the ratios
+        spp = math.log(max(spp, 1))
+        best = None
+        for level in self.levels:
+            distance = abs(math.log(level.spp) - spp)
+            if best is None or distance < best_distance:
+                best = level
+                best_distance = distance
+        return best
+
+    def save(self, filename):
+        """
+        Write the peaks to C{filename}, atomically so that readers never see
+        a partial file.
+        """
+        tmp = filename + ".tmp"
+        peakfile = open(tmp, "wb")
+        try:
+            peakfile.write(PEAKS_MAGIC)
+            peakfile.write(PEAKS_HEADER.pack(self.rate, self.channels,
+                    len(self.levels)))
+            for level in self.levels:
+                peakfile.write(LEVEL_HEADER.pack(level.spp,
+                        self.getCount(level)))
+            for level in self.levels:
+                level.mins.tofile(peakfile)
+                level.maxs.tofile(peakfile)
+        finally:
+            peakfile.close()
+        os.rename(tmp, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read peaks written by L{save}.
+
+        @return: The peaks, or C{None} if the file is missing or invalid.
+        @rtype: L{Peaks}
+        """
+        try:
+            peakfile = open(filename, "rb")
+        except IOError:
+            return None
+
+        try:
+            if peakfile.read(len(PEAKS_MAGIC)) != PEAKS_MAGIC:
+                return None
+            try:
+                rate, channels, n_levels = PEAKS_HEADER.unpack(
+                        peakfile.read(PEAKS_HEADER.size))
+                headers = [LEVEL_HEADER.unpack(
+                        peakfile.read(LEVEL_HEADER.size))
+                        for i in xrange(n_levels)]
+            except struct.error:
+                return None
+            if not channels:
+                return None
+
+            levels = []
+            for spp, count in headers:
+                mins = array.array("b")
+                maxs = array.array("b")
+                try:
+                    mins.fromfile(peakfile, count * channels)
+                    maxs.fromfile(peakfile, count * channels)
+                except EOFError:
+                    return None
+                levels.append(PeakLevel(spp, mins, maxs))
+        finally:
+            peakfile.close()
+
+        return cls(rate, channels, levels)
+
+
+class PeakBuilder(object):
+
+    """
+    Computes the L{Peaks} of a stream in one pass, from the samples fed in
+    order with L{addSamples}.
+
+    Only the finest level is computed from the samples, each coarser level is
+    computed from the finest one when the stream is finished.
+    """
+
+    def __init__(self, rate, channels, levels=DEFAULT_LEVELS):
+        """
+        @param levels: The samples per peak of each level, multiples of the
+        first one in increasing order.
+        @type levels: C{list} of C{int}
+        """
+        self.rate = rate
+        self.channels = channels
+        self.spps = list(levels)
+        self.mins = array.array("b")
+        self.maxs = array.array("b")
+        # the samples of the last, incomplete block
+        self._pending = array.array("f")
+
+    def addSamples(self, samples):
+        """
+        Add the next samples of the stream.
+
+        @param samples: Samples interleaved by channel.
+        @type samples: C{array.array} of C{'f'}
+        """
+        if self._pending:
+            self._pending.extend(samples)
+            samples = self._pending
+
+        block = self.spps[0] * self.channels
+        end = len(samples) - (len(samples) % block)
+        if end:
+            self._addBlocks(samples[:end])
+        self._pending = samples[end:]
+
+    def finish(self):
+        """
+        Add the last, incomplete block and compute the coarser levels.
+
+        @rtype: L{Peaks}
+        """
+        if self._pending:
+            self._addBlocks(self._pending)
+            self._pending = array.array("f")
+
+        fine = PeakLevel(self.spps[0], self.mins, self.maxs)
+        levels = [fine]
+        for spp in self.spps[1:]:
+            levels.append(self._reduce(fine, spp / fine.spp))
+
+        return Peaks(self.rate, self.channels, levels)
+
+    def _addBlocks(self, samples):
+        mins, maxs = extrema(samples, self.channels, self.spps[0])
+        self.mins.extend(quantize_all(mins))
+        self.maxs.extend(quantize_all(maxs))
+
+    def _reduce(self, fine, factor):
+        mins = extrema(fine.mins, self.channels, factor)[0]
+        maxs = extrema(fine.maxs, self.channels, factor)[1]
+        return PeakLevel(fine.spp * factor, mins, maxs)
+
+
+class PeakStore(Loggable):
+
+    """
+    A directory of peak files, named after the URI, size and modification
+    time of the files they describe.
+    """
+
+    def __init__(self, directory):
+        Loggable.__init__(self)
+        self.directory = directory
+
+    def getFilename(self, uri, path):
+        """
+        @return: The peak file of the given file, or C{None} if the file
+        can't be accessed.
+        @rtype: C{str}
+        """
+        key = file_cache_key(uri, path)
+        if key is None:
+            return None
+        return os.path.join(self.directory, key + PEAKS_SUFFIX)
+
+    def load(self, uri, path):
+        """
+        @return: The peaks of the given file, or C{None} if they were never
+        saved.
+        @rtype: L{Peaks}
+        """
+        filename = self.getFilename(uri, path)
+        if filename is None:
+            return None
+        return Peaks.load(filename)
+
+    def read(self, uri, path, callback):
+        """
+        Load the peaks of the given file from a background thread, see
+        L{load}. The callback is called from that thread with the peaks.
+        """
+        thread = CallbackThread(self._read, uri, path, callback)
+        thread.setDaemon(True)
+        thread.start()
+
+    def save(self, uri, path, peaks):
+        """
+        Save the peaks of the given file from a background thread.
+        """
+        filename = self.getFilename(uri, path)
+        if filename is None:
+            return
+
+        thread = CallbackThread(self._save, peaks, filename)
+        thread.setDaemon(True)
+        thread.start()
+
+    def _read(self, uri, path, callback):
+        callback(self.load(uri, path))
+
+    def _save(self, peaks, filename):
+        try:
+            try:
+                os.makedirs(self.directory)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+            peaks.save(filename)
+        except (IOError, OSError), e:
+            self.warning("couldn't save peaks to %s: %s", filename, e)
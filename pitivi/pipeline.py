@@ -64,6 +64,9 @@ class FactoryEntry(object):
 
 
 class StreamEntry(object):
+    __slots__ = ('factory_entry', 'stream', 'bin', 'bin_use_count', 'tee',
+            'tee_use_count', 'queue', 'queue_use_count', 'parent')
+
     def __init__(self, factory_entry, stream, parent=None):
         self.factory_entry = factory_entry
         self.stream = stream
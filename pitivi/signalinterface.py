@@ -29,7 +29,24 @@
 Interfaces for event-based programming
 """
 
-from random import randint
+from itertools import islice
+
+# the signals of each Signallable class, shared by all the instances
+_class_signals = {}
+
+
+def _getClassSignals(cls, refresh=False):
+    if not refresh:
+        try:
+            return _class_signals[cls]
+        except KeyError:
+            pass
+
+    # PropertyChangeTracker adds signals to __signals__ at runtime, so the
+    # cached copy is refreshed when an unknown signal is looked up
+    siglist = cls.get_signals()
+    _class_signals[cls] = siglist
+    return siglist
 
 
 class Signallable(object):
@@ -42,57 +59,91 @@ class Signallable(object):
     @type __signals__: Dictionnary of L{str} : List of L{str}
     """
 
-    class SignalGroup:
+    class SignalGroup(object):
         # internal
+        __slots__ = ('signallable_class', 'last_id', 'ids', 'callback_ids',
+                'emission_lists', 'dead', 'emitting')
+
         def __init__(self, signallable):
-            self.siglist = signallable.get_signals()
-            # self.ids is a dictionnary of
-            # key: signal name (string)
-            # value: list of:
-            #    (callback (callable),
-            #     args (list),
-            #     kwargs (dictionnary))
+            self.signallable_class = type(signallable)
+            # ids are handed out in increasing order, appending handlers to
+            # the emission lists keeps the connection order
+            self.last_id = 0
+            # self.ids is a dictionnary, only containing the connected
+            # handlers, of
+            # key: signal id
+            # value: the entry of the handler in its emission list
             self.ids = {}
+            # self.callback_ids is a dictionnary of
+            # key: callback (callable)
+            # value: the signal id if the callback is connected once (the
+            #        common case, saves a set per callback), else a set of
+            #        signal ids
             self.callback_ids = {}
-            # self.handlers is a dictionnary of callback ids per
-            # signals.
-            self.handlers = {}
-            for signame in self.siglist.keys():
-                self.handlers[signame] = []
+            # self.emission_lists is a dictionnary, only containing the
+            # signals that have handlers, of
+            # key: signal name (string)
+            # value: list of (signal id, signal name (string),
+            #        callback (callable), args (tuple), kwargs (dictionnary))
+            #        in connection order
+            # The entries of the disconnected handlers are left in the list
+            # and removed by the next emission, so that disconnecting
+            # doesn't need to look them up.
+            self.emission_lists = {}
+            # the number of disconnected entries in each emission list
+            self.dead = {}
+            # the number of emissions in progress of each signal, their
+            # emission list is only appended to meanwhile
+            self.emitting = {}
 
         def connect(self, signame, cb, args, kwargs):
             """ connect """
-            # get a unique id
-            if not signame in self.handlers.keys():
-                raise Exception("Signal %s is not one of %s" % (signame,
-                ",\n\t".join(self.handlers.keys())))
+            self._checkSignal(signame)
             if not callable(cb):
                 raise Exception("Provided callable '%r' is not callable" % cb)
 
-            uuid = randint(0, 2 ** 64)
-            while uuid in self.ids:
-                uuid = randint(0, 2 ** 64)
+            self.last_id += 1
+            sigid = self.last_id
+            sig_ids = self.callback_ids.get(cb)
+            if not sig_ids:
+                self.callback_ids[cb] = sigid
+            elif isinstance(sig_ids, set):
+                sig_ids.add(sigid)
+            else:
+                self.callback_ids[cb] = set((sig_ids, sigid))
 
-            self.ids[uuid] = (cb, args, kwargs)
-            self.callback_ids.setdefault(cb, []).append(uuid)
-            self.handlers[signame].append(uuid)
-            return uuid
+            entry = (sigid, signame, cb, args, kwargs)
+            self.ids[sigid] = entry
+            emission_list = self.emission_lists.get(signame)
+            if emission_list is None:
+                self.emission_lists[signame] = [entry]
+            else:
+                emission_list.append(entry)
+            return sigid
 
         def disconnect(self, sigid):
             """ disconnect """
             try:
-                cb = self.ids[sigid][0]
-                del self.ids[sigid]
+                unused_sigid, signame, cb, unused_args, unused_kwargs = \
+                        self.ids.pop(sigid)
             except KeyError:
                 raise Exception("unknown signal id")
 
-            for lists in self.handlers.itervalues():
-                try:
-                    lists.remove(sigid)
-                except ValueError:
-                    continue
+            dead = self.dead.get(signame, 0) + 1
+            if dead == len(self.emission_lists[signame]) and \
+                    signame not in self.emitting:
+                # the last handler, no need to wait for an emission
+                del self.emission_lists[signame]
+                self.dead.pop(signame, None)
+            else:
+                self.dead[signame] = dead
 
-                self.callback_ids.get(cb, []).remove(sigid)
+            sig_ids = self.callback_ids[cb]
+            if isinstance(sig_ids, set):
+                sig_ids.discard(sigid)
+            else:
+                # keep the callback around, like with several signal ids
+                self.callback_ids[cb] = ()
 
         def disconnect_by_function(self, function):
             try:
@@ -100,32 +151,83 @@ class Signallable(object):
             except KeyError:
                 raise Exception("function is not a known callback")
 
-            for sigid in list(sig_ids):
+            if isinstance(sig_ids, set):
+                sig_ids = list(sig_ids)
+            elif sig_ids:
+                sig_ids = [sig_ids]
+
+            for sigid in sig_ids:
                 self.disconnect(sigid)
 
             del self.callback_ids[function]
 
+        def _checkSignal(self, signame):
+            siglist = _getClassSignals(self.signallable_class)
+            if signame not in siglist:
+                siglist = _getClassSignals(self.signallable_class,
+                        refresh=True)
+                if signame not in siglist:
+                    raise Exception("Signal %s is not one of %s" % (signame,
+                    ",\n\t".join(siglist.keys())))
+
         def emit(self, signame, *args, **kwargs):
             """ emit """
             # emits the signal,
             # will concatenate the given args/kwargs with
             # the ones supplied in .connect()
             res = None
-            # Create a copy because if the handler being executed disconnects,
-            # the next handler will not be called.
-            signame_handlers = list(self.handlers[signame])
-            for sigid in signame_handlers:
-                if sigid not in self.handlers[signame]:
-                    # The handler has been disconnected in the meantime!
-                    continue
-                # cb: callable
-                cb, orar, kwar = self.ids[sigid]
-                ar = args[:] + orar
-                kw = kwargs.copy()
-                kw.update(kwar)
-                res = cb(*ar, **kw)
+            try:
+                emission_list = self.emission_lists[signame]
+            except KeyError:
+                self._checkSignal(signame)
+                return res
+
+            emitting = self.emitting
+            if signame in self.dead and signame not in emitting:
+                emission_list = self._compact(signame, emission_list)
+                if not emission_list:
+                    return res
+
+            # Handlers connected while emitting are appended to the list and
+            # only called on the next emission.
+            emitting[signame] = emitting.get(signame, 0) + 1
+            try:
+                ids = self.ids
+                for sigid, unused_signame, cb, orar, kwar in \
+                        islice(emission_list, len(emission_list)):
+                    if sigid not in ids:
+                        # The handler has been disconnected in the meantime!
+                        continue
+
+                    if not orar and not kwar:
+                        # common case, no need to build new args/kwargs
+                        res = cb(*args, **kwargs)
+                        continue
+
+                    kw = kwargs.copy()
+                    kw.update(kwar)
+                    res = cb(*(args + orar), **kw)
+            finally:
+                depth = emitting[signame] - 1
+                if depth:
+                    emitting[signame] = depth
+                else:
+                    del emitting[signame]
             return res
 
+        def _compact(self, signame, emission_list):
+            # drop the entries of the disconnected handlers, each one is only
+            # looked at once
+            del self.dead[signame]
+            ids = self.ids
+            emission_list = [entry for entry in emission_list
+                    if entry[0] in ids]
+            if emission_list:
+                self.emission_lists[signame] = emission_list
+            else:
+                del self.emission_lists[signame]
+            return emission_list
+
     # key : name (string)
     # value : signature (list of any strings)
     __signals__ = {}
@@ -25,9 +25,13 @@ Handles the list of source for a project
 """
 
 import urllib
-from pitivi.discoverer import Discoverer
+from gettext import gettext as _
+
+from pitivi.discoverer import ConcurrentDiscoverer
+from pitivi.mediacache import get_media_info_cache
 from pitivi.signalinterface import Signallable
 from pitivi.log.loggable import Loggable
+from pitivi.stream import match_stream_groups_map
 
 
 class SourceListError(Exception):
@@ -35,13 +39,16 @@ class SourceListError(Exception):
 
 
 class SourceList(Signallable, Loggable):
-    discovererClass = Discoverer
+    discovererClass = ConcurrentDiscoverer
 
     """
     Contains the sources for a project, stored as SourceFactory objects.
 
     @ivar discoverer: The discoverer object used internally
-    @type discoverer: L{Discoverer}
+    @type discoverer: L{ConcurrentDiscoverer}
+    @ivar validator: The discoverer checking the sources added without
+    being discovered, see L{validateFactories}.
+    @type validator: L{ConcurrentDiscoverer}
     @ivar nb_file_to_import: The number of URIs on the last addUris call.
     @type nb_file_to_import: int
     @ivar nb_imported_files: The number of URIs loaded since the last addUris
@@ -54,6 +61,8 @@ class SourceList(Signallable, Loggable):
      - C{missing-plugins} : A source has been discovered but some plugins are
        missing in order to decode all of its streams.
      - C{discovery-error} : The given uri is not a media file.
+     - C{source-changed} : The file of a validated source changed or can't
+       be read anymore.
      - C{ready} : No more files are being discovered/added.
      - C{starting} : Some files are being discovered/added.
     """
@@ -65,6 +74,7 @@ class SourceList(Signallable, Loggable):
         "source-added": ["factory"],
         "source-removed": ["uri"],
         "discovery-error": ["uri", "reason"],
+        "source-changed": ["uri", "reason"],
         }
 
     def __init__(self):
@@ -76,8 +86,11 @@ class SourceList(Signallable, Loggable):
         self._ordered_sources = []
         self.nb_file_to_import = 1
         self.nb_imported_files = 0
+        # A (URI -> SourceFactory) map of the sources being validated.
+        self._validating = {}
 
-        self.discoverer = self.discovererClass()
+        self.discoverer = self.discovererClass(
+                media_cache=get_media_info_cache())
         self.discoverer.connect("discovery-error", self._discoveryErrorCb)
         self.discoverer.connect("discovery-done", self._discoveryDoneCb)
         self.discoverer.connect("starting", self._discovererStartingCb)
@@ -85,6 +98,13 @@ class SourceList(Signallable, Loggable):
         self.discoverer.connect("missing-plugins",
                 self._discovererMissingPluginsCb)
 
+        # the sources are validated in the background, without the import
+        # progress and errors
+        self.validator = self.discovererClass(
+                media_cache=get_media_info_cache())
+        self.validator.connect("discovery-error", self._validationErrorCb)
+        self.validator.connect("discovery-done", self._validationDoneCb)
+
     def addUri(self, uri):
         """
         Add c{uri} to the source list.
@@ -147,6 +167,22 @@ class SourceList(Signallable, Loggable):
         self.nb_imported_files += 1
         self.emit("source-added", factory)
 
+    def validateFactories(self, factories):
+        """
+        Check in the background that the files of C{factories}, added
+        without being discovered, didn't change.
+
+        The factories of the files which got longer are updated. The files
+        which are shorter than before or whose streams changed emit
+        C{source-changed}, their factories are kept unchanged.
+        """
+        uris = []
+        for factory in factories:
+            if factory.uri not in self._validating:
+                self._validating[factory.uri] = factory
+                uris.append(factory.uri)
+        self.validator.addUris(uris)
+
     def getSources(self):
         """ Returns the list of sources used.
 
@@ -156,6 +192,46 @@ class SourceList(Signallable, Loggable):
         """
         return self._ordered_sources
 
+    def _validateFactory(self, factory, new_factory):
+        streams = factory.getOutputStreams()
+        new_streams = new_factory.getOutputStreams()
+        stream_map = match_stream_groups_map(streams, new_streams)
+        if len(streams) != len(new_streams) or \
+                len(stream_map) != len(streams):
+            return _("The streams of the file changed.")
+
+        for stream, new_stream in stream_map.iteritems():
+            if stream.caps != new_stream.caps:
+                return _("The format of the file changed.")
+        if new_factory.duration < factory.duration:
+            return _("The file is shorter than it was.")
+
+        # the file is still usable, update the factory
+        for stream, new_stream in stream_map.iteritems():
+            if getattr(new_stream, "thumbnail", None) is not None:
+                stream.thumbnail = new_stream.thumbnail
+        if new_factory.duration > factory.duration:
+            self.info("duration of %s changed from %s to %s", factory.uri,
+                    factory.duration, new_factory.duration)
+            factory.duration = new_factory.duration
+
+        return None
+
+    def _validationDoneCb(self, validator, uri, factory):
+        old_factory = self._validating.pop(uri, None)
+        if old_factory is None:
+            return
+
+        error = self._validateFactory(old_factory, factory)
+        if error is not None:
+            self.emit("source-changed", uri, error,
+                    _("The file changed since the project was saved."))
+
+    def _validationErrorCb(self, validator, uri, reason, extra):
+        if self._validating.pop(uri, None) is not None:
+            # keep the source, the project still uses it
+            self.emit("source-changed", uri, reason, extra)
+
     def _discoveryDoneCb(self, discoverer, uri, factory):
         """Handles the success of a URI info gathering operation."""
         if factory.uri not in self._sources:
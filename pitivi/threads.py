@@ -22,9 +22,12 @@
 Threading support
 """
 
+import os
 import threading
+from urllib import unquote
 from pitivi.signalinterface import Signallable
 from pitivi.log.loggable import Loggable
+from pitivi.utils import quote_uri
 
 #
 # Following code was freely adapted by code from:
@@ -75,6 +78,37 @@ class CallbackThread(Thread):
         self.callback(*self.args, **self.kwargs)
 
 
+class PathWalker(Thread):
+    """
+    Thread for recursively searching in a list of directories
+    """
+
+    def __init__(self, paths, callback):
+        Thread.__init__(self)
+        self.log("New PathWalker for %s" % paths)
+        self.paths = paths
+        self.callback = callback
+        self.stopme = threading.Event()
+
+    def process(self):
+        for folder in self.paths:
+            self.log("folder %s" % folder)
+            if folder.startswith("file://"):
+                folder = unquote(folder[len("file://"):])
+            for path, dirs, files in os.walk(folder):
+                if self.stopme.isSet():
+                    return
+                uris = []
+                for afile in files:
+                    uris.append(quote_uri("file://%s" %
+                            os.path.join(path, afile)))
+                if uris:
+                    self.callback(uris)
+
+    def abort(self):
+        self.stopme.set()
+
+
 class ThreadMaster(Loggable):
     """
     Controls all thread existing in pitivi
@@ -23,20 +23,79 @@
 Dictionary-Like object for caching of thumbnails.
 """
 
-import collections
+# the fields of the nodes of the LRU list
+PREV, NEXT, KEY, VALUE, NBYTES, OWNER, QUALITY = range(7)
+
+
+def surface_size(value):
+    """
+    Return the size in bytes of a cached value: the pixel data of cairo image
+    surfaces, summed for sequences of surfaces, 0 for anything else.
+    """
+    try:
+        return value.get_stride() * value.get_height()
+    except AttributeError:
+        pass
+
+    if isinstance(value, (list, tuple)):
+        return sum([surface_size(item) for item in value])
+
+    return 0
 
 
 class ThumbnailCache(object):
 
-    """Caches thumbnails by key using LRU policy, implemented with heapq"""
+    """
+    Caches thumbnails by key using a LRU policy.
+
+    The cache is bounded by the total size in bytes of the cached values
+    and, optionally, by a number of entries. The entries are kept in a doubly
+    linked list ordered from the least to the most recently used, so that
+    lookups, insertions and evictions take constant time.
+
+    Entries can be accounted to an owner, usually the factory whose
+    thumbnails are cached, see L{getView}. This lets a single cache be shared
+    by all the previewers of the application.
+
+    Entries can be tagged with a quality, so that a thumbnail approximated
+    quickly is replaced by the exact one when it's available, but not the
+    other way around.
 
-    def __init__(self, size=100):
+    @ivar hits: The number of successful lookups.
+    @ivar misses: The number of failed lookups.
+    @ivar evictions: The number of entries evicted to stay within bounds.
+    @ivar bytes: The total size of the cached values.
+    @ivar owner_bytes: The total size of the cached values of each owner.
+    @type owner_bytes: C{dict} of owner => C{int}
+    """
+
+    def __init__(self, size=None, max_bytes=None, sizeof=surface_size):
+        """
+        @param size: The maximum number of entries, or C{None}.
+        @type size: C{int}
+        @param max_bytes: The maximum total size of the values, or C{None}.
+        @type max_bytes: C{int}
+        @param sizeof: Returns the size in bytes of a value.
+        @type sizeof: C{callable}
+        """
         object.__init__(self)
-        self.queue = collections.deque()
         self.cache = {}
+        self.size = size
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.owner_bytes = {}
+        self.owner_keys = {}
         self.hits = 0
         self.misses = 0
-        self.size = size
+        self.evictions = 0
+        # sentinel of the circular LRU list, root[NEXT] is the least recently
+        # used node and root[PREV] the most recently used one
+        self._root = root = []
+        root[:] = [root, root, None, None, 0, None, None]
+
+    def __len__(self):
+        return len(self.cache)
 
     def __contains__(self, key):
         if key in self.cache:
@@ -46,19 +105,203 @@ class ThumbnailCache(object):
         return False
 
     def __getitem__(self, key):
-        if key in self.cache:
-            # I guess this is why LRU is considered expensive
-            self.queue.remove(key)
-            self.queue.append(key)
-            return self.cache[key]
-        raise KeyError(key)
+        node = self.cache[key]
+        self._touch(node)
+        return node[VALUE]
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for C{key}, or C{default} if there's none.
+
+        Unlike a C{in} test followed by a lookup, this only looks the key up
+        once.
+        """
+        try:
+            node = self.cache[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._touch(node)
+        return node[VALUE]
 
     def __setitem__(self, key, value):
-        self.cache[key] = value
-        self.queue.append(key)
-        if len(self.cache) > self.size:
-            self.ejectLRU()
+        self.put(key, value)
+
+    def put(self, key, value, owner=None, quality=None):
+        """
+        Cache C{value} for C{key}, replacing the previous value if any, and
+        evict the least recently used entries if the cache is too big.
+
+        @param owner: The object the entry is accounted to.
+        @param quality: The quality of the value, the higher the better, or
+        C{None}. A value doesn't replace a previous value of a higher quality.
+        @type quality: C{int}
+        @return: Whether the value was cached.
+        @rtype: C{bool}
+        """
+        node = self.cache.get(key)
+        if node is not None and quality is not None and \
+                node[QUALITY] is not None and quality < node[QUALITY]:
+            return False
+
+        nbytes = self.sizeof(value)
+        if node is None:
+            root = self._root
+            last = root[PREV]
+            node = [last, root, key, value, nbytes, owner, quality]
+            last[NEXT] = root[PREV] = node
+            self.cache[key] = node
+        else:
+            self._unaccount(node)
+            node[VALUE] = value
+            node[NBYTES] = nbytes
+            node[OWNER] = owner
+            node[QUALITY] = quality
+            self._touch(node)
+        self._account(node)
+
+        self._shrink()
+        return True
+
+    def getQuality(self, key):
+        """
+        @return: The quality of the value cached for C{key}, C{None} if
+        there's none or if it wasn't given one.
+        @rtype: C{int}
+        """
+        node = self.cache.get(key)
+        if node is None:
+            return None
+        return node[QUALITY]
+
+    def __delitem__(self, key):
+        node = self.cache.pop(key)
+        self._unlink(node)
+        self._unaccount(node)
 
     def ejectLRU(self):
-        key = self.queue.popleft()
-        del self.cache[key]
+        """
+        Evict the least recently used entry.
+        """
+        node = self._root[NEXT]
+        del self[node[KEY]]
+        self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all the entries, the counters are kept.
+        """
+        root = self._root
+        root[:] = [root, root, None, None, 0, None, None]
+        self.cache.clear()
+        self.bytes = 0
+        self.owner_bytes.clear()
+        self.owner_keys.clear()
+
+    def removeOwner(self, owner):
+        """
+        Remove all the entries of C{owner}.
+        """
+        for key in list(self.owner_keys.get(owner, ())):
+            del self[key]
+
+    def getOwnerBytes(self, owner):
+        """
+        @return: The total size of the cached values of C{owner}.
+        @rtype: C{int}
+        """
+        return self.owner_bytes.get(owner, 0)
+
+    def getView(self, owner, namespace=None):
+        """
+        Return a dictionary-like view of the entries of C{owner} in the given
+        namespace.
+
+        @rtype: L{ThumbnailCacheView}
+        """
+        return ThumbnailCacheView(self, owner, namespace)
+
+    def _touch(self, node):
+        # move node to the most recently used end of the list
+        root = self._root
+        if root[PREV] is node:
+            return
+
+        self._unlink(node)
+        last = root[PREV]
+        node[PREV] = last
+        node[NEXT] = root
+        last[NEXT] = root[PREV] = node
+
+    def _unlink(self, node):
+        prev, next = node[PREV], node[NEXT]
+        prev[NEXT] = next
+        next[PREV] = prev
+
+    def _account(self, node):
+        owner = node[OWNER]
+        nbytes = node[NBYTES]
+        self.bytes += nbytes
+        self.owner_bytes[owner] = self.owner_bytes.get(owner, 0) + nbytes
+        self.owner_keys.setdefault(owner, set()).add(node[KEY])
+
+    def _unaccount(self, node):
+        owner = node[OWNER]
+        self.bytes -= node[NBYTES]
+        keys = self.owner_keys[owner]
+        keys.discard(node[KEY])
+        if keys:
+            self.owner_bytes[owner] -= node[NBYTES]
+        else:
+            del self.owner_keys[owner]
+            del self.owner_bytes[owner]
+
+    def _shrink(self):
+        # the most recently added entry is kept even if it's over budget on
+        # its own
+        while len(self.cache) > 1 and \
+                ((self.size is not None and len(self.cache) > self.size) or
+                (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            self.ejectLRU()
+
+
+class ThumbnailCacheView(object):
+
+    """
+    The entries of an owner in a L{ThumbnailCache}, with the same
+    dictionary-like interface as the cache.
+
+    The keys are prefixed with the owner and the namespace of the view so
+    that views of different owners or namespaces never collide.
+    """
+
+    def __init__(self, cache, owner, namespace=None):
+        self.cache = cache
+        self.owner = owner
+        self.namespace = namespace
+
+    def _key(self, key):
+        return (self.owner, self.namespace, key)
+
+    def __contains__(self, key):
+        return self._key(key) in self.cache
+
+    def __getitem__(self, key):
+        return self.cache[self._key(key)]
+
+    def get(self, key, default=None):
+        return self.cache.get(self._key(key), default)
+
+    def __setitem__(self, key, value):
+        self.cache.put(self._key(key), value, self.owner)
+
+    def put(self, key, value, quality=None):
+        return self.cache.put(self._key(key), value, self.owner, quality)
+
+    def getQuality(self, key):
+        return self.cache.getQuality(self._key(key))
+
+    def __delitem__(self, key):
+        del self.cache[self._key(key)]
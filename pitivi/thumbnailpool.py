@@ -0,0 +1,204 @@
+# PiTiVi , Non-linear video editor
+#
+#       thumbnailpool.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+"""
+Pool of thumbnailing workers shared by the previewers.
+"""
+
+import time
+
+from pitivi.utils import cpu_count
+
+
+class ThumbnailWorkerPool(object):
+
+    """
+    Runs the pending requests of a L{ThumbnailScheduler} on a bounded number
+    of workers, usually thumbnailing pipelines, so that thumbnails of several
+    files, or of several segments of a file, are generated in parallel.
+
+    The requesters are registered with L{addOwner}: the previewers, and the
+    peak computations of the audio previewers, so that all the preview
+    pipelines are bounded by the pool. They must provide a C{makeWorker()}
+    method returning a new worker and a C{worker_bytes} attribute estimating
+    the memory used by a worker. Each worker has an C{owner} attribute, a
+    C{start(segment)} method starting to process a segment and returning
+    whether it could, and a C{destroy()} method. The owner must call
+    L{release} when a worker finished its segment, or remove itself with
+    L{removeOwner}. A worker whose C{start()} fails is destroyed.
+
+    The workers of an owner are kept when they are done, and reused for its
+    next requests. When the pool is full, the least recently used idle
+    workers of other owners are destroyed to make room. The workers idle for
+    too long can be destroyed with L{collect}, they are created again when
+    needed.
+
+    @ivar max_workers: The maximum number of workers.
+    @type max_workers: C{int}
+    @ivar max_workers_per_owner: The maximum number of workers of an owner,
+    that is the maximum number of segments of a file processed in parallel.
+    @type max_workers_per_owner: C{int}
+    @ivar max_bytes: The maximum memory used by the workers, or C{None}.
+    @type max_bytes: C{int}
+    @ivar bytes: The estimated memory used by the workers.
+    @type bytes: C{int}
+    """
+
+    def __init__(self, scheduler, max_workers=None, max_workers_per_owner=2,
+            max_bytes=None, clock=time.time):
+        if max_workers is None:
+            max_workers = cpu_count()
+        self.scheduler = scheduler
+        self.clock = clock
+        self.max_workers = max_workers
+        self.max_workers_per_owner = max_workers_per_owner
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        # owner => list of workers
+        self.workers = {}
+        self.busy = set()
+        # least recently used first
+        self.idle = []
+
+    def addOwner(self, owner):
+        """
+        Register C{owner}, its requests are processed by the pool.
+        """
+        self.workers.setdefault(owner, [])
+
+    def removeOwner(self, owner):
+        """
+        Destroy the workers of C{owner} and stop processing its requests.
+        """
+        for worker in self.workers.pop(owner, []):
+            self.busy.discard(worker)
+            if worker in self.idle:
+                self.idle.remove(worker)
+            self._destroy(worker)
+
+    def getWorkerCount(self, owner=None):
+        """
+        @return: The number of workers of C{owner}, or of all the owners.
+        @rtype: C{int}
+        """
+        if owner is None:
+            return sum([len(workers) for workers in self.workers.itervalues()])
+        return len(self.workers.get(owner, ()))
+
+    def dispatch(self):
+        """
+        Start processing the most urgent pending requests of the owners on
+        the available workers.
+        """
+        for owner in self.scheduler.getRequesters():
+            if owner not in self.workers:
+                continue
+
+            while self.scheduler.hasRequests(owner):
+                worker = self._getWorker(owner)
+                if worker is None:
+                    break
+
+                # the request stays pending until a worker accepts it
+                segment = self.scheduler.peek(owner)
+                self.busy.add(worker)
+                if worker.start(segment):
+                    self.scheduler.cancel(owner, segment)
+                    continue
+
+                # a broken worker is not reused, the segment is retried on a
+                # new worker unless a new one failed, then it's the segment
+                # which can't be processed
+                self.busy.discard(worker)
+                self._removeWorker(worker)
+                if worker.idle_since is None:
+                    self.scheduler.cancel(owner, segment)
+
+            if len(self.busy) >= self.max_workers:
+                break
+
+    def release(self, worker):
+        """
+        Mark C{worker} as idle and process the next requests.
+        """
+        if worker not in self.busy:
+            return
+
+        self.busy.remove(worker)
+        self._setIdle(worker)
+        self.dispatch()
+
+    def collect(self, max_idle):
+        """
+        Destroy the workers which have been idle for more than C{max_idle}
+        seconds.
+
+        @return: The number of destroyed workers.
+        @rtype: C{int}
+        """
+        limit = self.clock() - max_idle
+        count = 0
+        # the least recently used workers come first
+        while self.idle and self.idle[0].idle_since < limit:
+            self._removeWorker(self.idle.pop(0))
+            count += 1
+        return count
+
+    def _setIdle(self, worker):
+        worker.idle_since = self.clock()
+        self.idle.append(worker)
+
+    def _getWorker(self, owner):
+        workers = self.workers[owner]
+        for worker in self.idle:
+            if worker.owner is owner:
+                self.idle.remove(worker)
+                return worker
+
+        if len(workers) >= self.max_workers_per_owner:
+            return None
+
+        # make room by destroying idle workers of other owners, the pool
+        # always accepts a first worker so that the requests are processed
+        # even if a single worker is over the memory limit
+        nbytes = owner.worker_bytes
+        while self.busy or self.idle:
+            count = len(self.busy) + len(self.idle)
+            if count < self.max_workers and (self.max_bytes is None or
+                    self.bytes + nbytes <= self.max_bytes):
+                break
+            if not self.idle:
+                return None
+            self._removeWorker(self.idle.pop(0))
+
+        worker = owner.makeWorker()
+        workers.append(worker)
+        self.bytes += nbytes
+        worker.nbytes = nbytes
+        # set once the worker finished a segment
+        worker.idle_since = None
+        return worker
+
+    def _removeWorker(self, worker):
+        self.workers[worker.owner].remove(worker)
+        self._destroy(worker)
+
+    def _destroy(self, worker):
+        self.bytes -= worker.nbytes
+        worker.destroy()
@@ -0,0 +1,223 @@
+# PiTiVi , Non-linear video editor
+#
+#       thumbnailscheduler.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+"""
+Scheduling of thumbnail requests.
+"""
+
+
+class ThumbnailScheduler(object):
+
+    """
+    Orders the pending thumbnail requests of the previewers by their
+    distance to the visible part of the timeline, then by their distance to
+    the playhead.
+
+    Requests are made by a requester, usually a previewer, for a segment
+    which is displayed over a range of the timeline. A segment requested
+    several times, for example by several clips of the same file, is only
+    pending once, at its best position. Requests which are scrolled out of
+    view are cancelled, they are made again when they are drawn.
+
+    Background requests, for example the refinement of thumbnails which are
+    already displayed, come after all the other requests.
+
+    @ivar viewport: The visible range of the timeline, or C{None} if it's
+    unknown.
+    @type viewport: C{tuple} of (C{long}, C{long})
+    @ivar playhead: The position of the playhead.
+    @type playhead: C{long}
+    @ivar pending: The pending requests of each requester, as a dictionary
+    of segment => range of the timeline.
+    @type pending: C{dict} of requester => C{dict}
+    @ivar background: The segments of the pending background requests of
+    each requester.
+    @type background: C{dict} of requester => C{set}
+    @ivar cancelled: The number of requests cancelled so far.
+    @type cancelled: C{int}
+    """
+
+    def __init__(self):
+        self.viewport = None
+        self.playhead = 0
+        self.pending = {}
+        self.background = {}
+        self.cancelled = 0
+
+    def setViewport(self, start, end):
+        """
+        Set the visible range of the timeline and cancel the pending requests
+        outside of it.
+        """
+        self.viewport = (start, end)
+        for requester, requests in self.pending.items():
+            for segment, span in requests.items():
+                if not self._isVisible(span):
+                    self._remove(requester, segment)
+                    self.cancelled += 1
+
+    def setPlayhead(self, position):
+        """
+        Set the position of the playhead.
+        """
+        self.playhead = position
+
+    def request(self, requester, segment, start, end, max_requests=None,
+            background=False):
+        """
+        Request the thumbnail of C{segment}, displayed from C{start} to
+        C{end} in the timeline.
+
+        @param max_requests: The maximum number of pending requests of
+        C{requester}, the least urgent ones are cancelled.
+        @type max_requests: C{int}
+        @param background: Whether the request comes after the other ones.
+        @type background: C{bool}
+        """
+        span = (start, end)
+        requests = self.pending.setdefault(requester, {})
+        old = requests.get(segment)
+        rank = (background,) + self._rank(span)
+        if old is None or rank < self._requestRank(requester, segment, old):
+            requests[segment] = span
+            if background:
+                self.background.setdefault(requester, set()).add(segment)
+            else:
+                self._discardBackground(requester, segment)
+
+        if max_requests is not None:
+            while len(requests) > max_requests:
+                self._remove(requester, self._worst(requester))
+                self.cancelled += 1
+
+    def cancel(self, requester, segment=None):
+        """
+        Cancel the pending request of C{requester} for C{segment}, or all
+        its pending requests if C{segment} is C{None}.
+        """
+        if segment is None:
+            self.pending.pop(requester, None)
+            self.background.pop(requester, None)
+            return
+
+        requests = self.pending.get(requester)
+        if requests is not None and segment in requests:
+            self._remove(requester, segment)
+
+    def hasRequests(self, requester):
+        """
+        @return: Whether C{requester} has pending requests.
+        @rtype: C{bool}
+        """
+        return requester in self.pending
+
+    def getPending(self, requester):
+        """
+        @return: The segments of the pending requests of C{requester}.
+        @rtype: C{list}
+        """
+        return list(self.pending.get(requester, ()))
+
+    def getRequesters(self):
+        """
+        @return: The requesters with pending requests, sorted by the urgency
+        of their most urgent request.
+        @rtype: C{list}
+        """
+        ranked = []
+        for requester, requests in self.pending.iteritems():
+            rank = min([self._requestRank(requester, segment, span)
+                    for segment, span in requests.iteritems()])
+            ranked.append((rank, requester))
+        ranked.sort(key=lambda item: item[0])
+        return [requester for rank, requester in ranked]
+
+    def peek(self, requester):
+        """
+        @return: The segment of the most urgent pending request of
+        C{requester}, or C{None} if there's none.
+        """
+        requests = self.pending.get(requester)
+        if not requests:
+            return None
+
+        best = None
+        for segment, span in requests.iteritems():
+            rank = self._requestRank(requester, segment, span)
+            if best is None or rank < best_rank:
+                best = segment
+                best_rank = rank
+        return best
+
+    def pop(self, requester):
+        """
+        Remove the most urgent pending request of C{requester}.
+
+        @return: The segment of the request, or C{None} if there's none.
+        """
+        best = self.peek(requester)
+        if best is not None:
+            self._remove(requester, best)
+        return best
+
+    def _remove(self, requester, segment):
+        requests = self.pending[requester]
+        del requests[segment]
+        if not requests:
+            del self.pending[requester]
+        self._discardBackground(requester, segment)
+
+    def _discardBackground(self, requester, segment):
+        background = self.background.get(requester)
+        if background is not None:
+            background.discard(segment)
+            if not background:
+                del self.background[requester]
+
+    def _isVisible(self, span):
+        start, end = self.viewport
+        return span[1] >= start and span[0] <= end
+
+    def _distance(self, span, position):
+        if position < span[0]:
+            return span[0] - position
+        if position > span[1]:
+            return position - span[1]
+        return 0
+
+    def _rank(self, span):
+        if self.viewport is None:
+            visible = 0
+        else:
+            start, end = self.viewport
+            visible = max(0, span[0] - end, start - span[1])
+        return visible, self._distance(span, self.playhead)
+
+    def _requestRank(self, requester, segment, span):
+        background = segment in self.background.get(requester, ())
+        return (background,) + self._rank(span)
+
+    def _worst(self, requester):
+        worst = None
+        for segment, span in self.pending[requester].iteritems():
+            rank = self._requestRank(requester, segment, span)
+            if worst is None or rank > worst_rank:
+                worst = segment
+                worst_rank = rank
+        return worst
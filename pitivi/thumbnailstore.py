@@ -0,0 +1,486 @@
+# PiTiVi , Non-linear video editor
+#
+#       thumbnailstore.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+"""
+Persistent on-disk storage of thumbnails.
+
+The thumbnails of a file are packed in a single file of the store directory,
+named after the URI, size and modification time of the file and the height of
+the thumbnails, so that a modified file never hits stale thumbnails. A pack
+is a header followed by records, each record being a fixed size header and
+the zlib compressed pixel data of one thumbnail:
+
+    magic | timestamp, width, height, stride, length | data | ...
+
+Records are only ever appended. The packs are read and written by a
+background thread, so that the main loop never waits for the disk. The total
+size of the packs is bounded, the least recently used packs are deleted
+first.
+"""
+
+import errno
+import hashlib
+import os
+import struct
+import threading
+import zlib
+from Queue import Queue
+
+from pitivi.threads import Thread
+from pitivi.log.loggable import Loggable
+
+PACK_MAGIC = "PTVTHMB1"
+PACK_SUFFIX = ".thumbs"
+
+# timestamp, width, height, stride, length of the compressed data
+RECORD_HEADER = struct.Struct("!QIIII")
+
+
+def file_cache_key(uri, path, *args):
+    """
+    Return a key identifying the current contents of a file, for naming the
+    cache files of the file.
+
+    @param uri: The URI of the file.
+    @type uri: C{str}
+    @param path: The local path of the file, used to check whether it was
+    modified.
+    @type path: C{str}
+    @param args: Other values the cached data depends on.
+    @return: The key, or C{None} if the file can't be accessed.
+    @rtype: C{str}
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    md5sum = hashlib.md5()
+    md5sum.update("\0".join([uri, str(stat.st_size), str(int(stat.st_mtime))] +
+            [str(arg) for arg in args]))
+    return md5sum.hexdigest()
+
+
+class ThumbnailPack(object):
+
+    """
+    The thumbnails of one file at one height, see L{ThumbnailStore.getPack}.
+
+    The index of the records is read from the disk on the first lookup, then
+    each lookup reads and uncompresses a single record. The main loop should
+    use L{load}, which does the lookup on the thread of the store.
+
+    @ivar filename: The path of the pack.
+    @type filename: C{str}
+    """
+
+    def __init__(self, store, filename):
+        self.store = store
+        self.filename = filename
+        # timestamp => (offset, width, height, stride, length) of the record
+        self.index = None
+        # the offset of the end of the last complete record
+        self.end = 0
+        self._touched = False
+
+    def __contains__(self, timestamp):
+        self._load()
+        self.store.lock.acquire()
+        try:
+            return self.index is not None and timestamp in self.index
+        finally:
+            self.store.lock.release()
+
+    def load(self, timestamp, callback):
+        """
+        Read the thumbnail stored for C{timestamp} in the background.
+
+        @param callback: Called from the thread of the store with
+        C{timestamp} and the result of L{get}.
+        """
+        self.store.read(self, timestamp, callback)
+
+    def get(self, timestamp):
+        """
+        Read the thumbnail stored for C{timestamp}. The lock of the store
+        isn't held while reading the disk.
+
+        @return: The width, height, stride and pixel data of the thumbnail,
+        or C{None} if it's not stored.
+        @rtype: C{tuple} of (C{int}, C{int}, C{int}, C{str})
+        """
+        self._load()
+        self.store.lock.acquire()
+        try:
+            if self.index is None:
+                return None
+            try:
+                offset, width, height, stride, length = self.index[timestamp]
+            except KeyError:
+                return None
+        finally:
+            self.store.lock.release()
+
+        try:
+            pack = open(self.filename, "rb")
+            try:
+                pack.seek(offset)
+                data = pack.read(length)
+            finally:
+                pack.close()
+        except IOError:
+            # pruned meanwhile
+            self.store.lock.acquire()
+            try:
+                self.reset()
+            finally:
+                self.store.lock.release()
+            return None
+
+        if not self._touched:
+            # the modification time of the packs orders them for pruning
+            self._touched = True
+            self.store.touch(self)
+
+        try:
+            data = zlib.decompress(data)
+        except zlib.error:
+            return None
+        if len(data) != stride * height:
+            return None
+
+        return width, height, stride, data
+
+    def put(self, timestamp, width, height, stride, data):
+        """
+        Store a thumbnail, the pack is written in the background.
+
+        @param data: The pixel data of the thumbnail, C{stride * height}
+        bytes.
+        @type data: C{str}
+        """
+        self.store.write(self, timestamp, width, height, stride, data)
+
+    def reset(self):
+        """
+        Forget the index, it's read again on the next lookup. Must be called
+        with the lock of the store held.
+        """
+        self.index = None
+        self.end = 0
+
+    def _load(self):
+        self.store.lock.acquire()
+        try:
+            if self.index is not None:
+                return
+        finally:
+            self.store.lock.release()
+
+        index, end = self._readIndex()
+
+        self.store.lock.acquire()
+        try:
+            if self.index is None:
+                self.index = index
+                self.end = end
+        finally:
+            self.store.lock.release()
+
+    def _readIndex(self):
+        index = {}
+        end = 0
+        try:
+            pack = open(self.filename, "rb")
+        except IOError:
+            return index, end
+
+        try:
+            if pack.read(len(PACK_MAGIC)) != PACK_MAGIC:
+                return index, end
+
+            size = os.fstat(pack.fileno()).st_size
+            offset = len(PACK_MAGIC)
+            while True:
+                header = pack.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                timestamp, width, height, stride, length = \
+                        RECORD_HEADER.unpack(header)
+                offset += RECORD_HEADER.size
+                # a truncated record, the end of the pack is overwritten by
+                # the next record
+                if offset + length > size:
+                    break
+                pack.seek(offset + length)
+                index[timestamp] = (offset, width, height, stride, length)
+                offset += length
+                end = offset
+        finally:
+            pack.close()
+
+        return index, end
+
+    def _append(self, timestamp, width, height, stride, data):
+        # called from the thread of the store, which is the only one
+        # changing the packs, the lock only protects the index
+        self._load()
+        self.store.lock.acquire()
+        try:
+            if timestamp in self.index:
+                return 0
+            start = self.end
+        finally:
+            self.store.lock.release()
+
+        try:
+            pack = open(self.filename, "r+b")
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+            pack = open(self.filename, "wb")
+
+        end = start
+        try:
+            if end == 0:
+                pack.write(PACK_MAGIC)
+                end = len(PACK_MAGIC)
+            else:
+                pack.seek(end)
+            header = RECORD_HEADER.pack(timestamp, width, height, stride,
+                    len(data))
+            pack.write(header + data)
+            pack.truncate()
+        finally:
+            pack.close()
+
+        offset = end + RECORD_HEADER.size
+        self.store.lock.acquire()
+        try:
+            if self.index is not None:
+                self.index[timestamp] = (offset, width, height, stride,
+                        len(data))
+                self.end = offset + len(data)
+        finally:
+            self.store.lock.release()
+        return offset + len(data) - start
+
+
+class ThumbnailStore(Loggable):
+
+    """
+    A directory of L{ThumbnailPack}s bounded by size.
+
+    The packs are read with L{ThumbnailPack.load}, written and pruned by a
+    L{ThumbnailStoreWriter} started on the first access.
+
+    @ivar directory: The directory of the packs.
+    @type directory: C{str}
+    @ivar max_bytes: The maximum total size of the packs, or C{None}.
+    @type max_bytes: C{int}
+    @ivar lock: Protects the indexes of the packs, it's never held while
+    accessing the disk.
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        Loggable.__init__(self)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.packs = {}
+        # the total size of the packs, computed by the writer
+        self.bytes = None
+        self._writer = None
+
+    def getPack(self, uri, path, height, kind="video"):
+        """
+        Return the pack of the thumbnails of the given file.
+
+        @param uri: The URI of the file.
+        @type uri: C{str}
+        @param path: The local path of the file, used to check whether it was
+        modified.
+        @type path: C{str}
+        @param height: The height of the thumbnails.
+        @type height: C{int}
+        @param kind: Distinguishes the packs of different kinds of
+        thumbnails of a file.
+        @type kind: C{str}
+        @return: The pack, or C{None} if the file can't be accessed.
+        @rtype: L{ThumbnailPack}
+        """
+        key = file_cache_key(uri, path, height, kind)
+        if key is None:
+            return None
+        name = key + PACK_SUFFIX
+
+        self.lock.acquire()
+        try:
+            pack = self.packs.get(name)
+            if pack is None:
+                pack = ThumbnailPack(self, os.path.join(self.directory, name))
+                self.packs[name] = pack
+        finally:
+            self.lock.release()
+
+        return pack
+
+    def write(self, pack, timestamp, width, height, stride, data):
+        """
+        Queue a thumbnail to be appended to C{pack}.
+        """
+        self._getWriter().queue.put(
+                (self._append, (pack, timestamp, width, height, stride, data)))
+
+    def read(self, pack, timestamp, callback):
+        """
+        Queue the lookup of the thumbnail of C{pack} at C{timestamp}, see
+        L{ThumbnailPack.load}.
+        """
+        self._getWriter().queue.put((self._read, (pack, timestamp, callback)))
+
+    def touch(self, pack):
+        """
+        Mark C{pack} as the most recently used one.
+        """
+        self._getWriter().queue.put((self._touch, (pack,)))
+
+    def flush(self):
+        """
+        Wait until all the queued writes are done.
+        """
+        if self._writer is not None:
+            self._writer.queue.join()
+
+    def close(self):
+        """
+        Write the queued thumbnails and stop the writer.
+        """
+        if self._writer is not None:
+            self._writer.stop()
+            self._writer.join()
+            self._writer = None
+
+    def _getWriter(self):
+        if self._writer is None:
+            self._writer = ThumbnailStoreWriter(self)
+            self._writer.start()
+        return self._writer
+
+    def _makeDirectory(self):
+        try:
+            os.makedirs(self.directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _append(self, pack, timestamp, width, height, stride, data):
+        data = zlib.compress(data)
+        if self.bytes is None:
+            self._makeDirectory()
+            self.bytes = sum([size for mtime, size, name in self._listPacks()])
+
+        self.bytes += pack._append(timestamp, width, height, stride, data)
+
+        if self.max_bytes is not None and self.bytes > self.max_bytes:
+            self._prune(pack)
+
+    def _read(self, pack, timestamp, callback):
+        callback(timestamp, pack.get(timestamp))
+
+    def _touch(self, pack):
+        try:
+            os.utime(pack.filename, None)
+        except OSError:
+            pass
+
+    def _listPacks(self):
+        packs = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(PACK_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            packs.append((stat.st_mtime, stat.st_size, name))
+        return packs
+
+    def _prune(self, keep):
+        # delete the least recently used packs until the store is a bit
+        # smaller than the limit, so that pruning doesn't happen on each
+        # write
+        packs = self._listPacks()
+        packs.sort()
+        self.bytes = sum([size for mtime, size, name in packs])
+        target = self.max_bytes * 3 / 4
+        for mtime, size, name in packs:
+            if self.bytes <= target:
+                break
+            filename = os.path.join(self.directory, name)
+            if filename == keep.filename:
+                continue
+
+            try:
+                os.unlink(filename)
+            except OSError:
+                continue
+            self.lock.acquire()
+            try:
+                pack = self.packs.get(name)
+                if pack is not None:
+                    pack.reset()
+            finally:
+                self.lock.release()
+            self.bytes -= size
+            self.debug("pruned thumbnail pack %s", name)
+
+
+class ThumbnailStoreWriter(Thread):
+
+    """
+    Runs the reads and writes of a L{ThumbnailStore} in the background.
+
+    @ivar queue: The pending jobs, (callable, args) tuples.
+    @type queue: C{Queue.Queue}
+    """
+
+    def __init__(self, store):
+        Thread.__init__(self)
+        self.store = store
+        self.queue = Queue()
+        # don't keep the application running to fill a cache
+        self.setDaemon(True)
+
+    def process(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                callback, args = job
+                try:
+                    callback(*args)
+                except (IOError, OSError), e:
+                    self.warning("couldn't access thumbnails: %s", e)
+            finally:
+                self.queue.task_done()
+
+    def abort(self):
+        self.queue.put(None)
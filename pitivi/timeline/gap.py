@@ -23,6 +23,8 @@ from pitivi.utils import infinity
 
 
 class Gap(object):
+    __slots__ = ('left_object', 'right_object', 'start', 'initial_duration')
+
     def __init__(self, left_object, right_object, start, duration):
         self.left_object = left_object
         self.right_object = right_object
@@ -0,0 +1,502 @@
+# PiTiVi , Non-linear video editor
+#
+#       pitivi/timeline/index.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+"""
+Indexes used to answer time-range queries on a L{Timeline} without scanning
+all of its objects.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from heapq import merge
+from random import random
+
+
+class TimelineIndexError(Exception):
+    pass
+
+
+class _Node(object):
+    __slots__ = ('key', 'start', 'end', 'obj', 'weight',
+            'left', 'right', 'max_end', 'min_end')
+
+    def __init__(self, key, start, end, obj):
+        self.key = key
+        self.start = start
+        self.end = end
+        self.obj = obj
+        self.weight = random()
+        self.left = None
+        self.right = None
+        self.max_end = end
+        self.min_end = end
+
+    def update(self):
+        max_end = min_end = self.end
+        left = self.left
+        if left is not None:
+            if left.max_end > max_end:
+                max_end = left.max_end
+            if left.min_end < min_end:
+                min_end = left.min_end
+        right = self.right
+        if right is not None:
+            if right.max_end > max_end:
+                max_end = right.max_end
+            if right.min_end < min_end:
+                min_end = right.min_end
+        self.max_end = max_end
+        self.min_end = min_end
+
+
+def _merge(a, b):
+    # every key in a is smaller than every key in b
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.weight > b.weight:
+        a.right = _merge(a.right, b)
+        a.update()
+        return a
+    b.left = _merge(a, b.left)
+    b.update()
+    return b
+
+
+def _insert(node, new):
+    if node is None:
+        return new
+    if new.weight > node.weight:
+        new.left, new.right = _split(node, new.key)
+        new.update()
+        return new
+    if new.key < node.key:
+        node.left = _insert(node.left, new)
+    else:
+        node.right = _insert(node.right, new)
+    node.update()
+    return node
+
+
+def _split(node, key):
+    # returns (keys < key, keys >= key)
+    if node is None:
+        return None, None
+    if node.key < key:
+        left, right = _split(node.right, key)
+        node.right = left
+        node.update()
+        return node, right
+    left, right = _split(node.left, key)
+    node.left = right
+    node.update()
+    return left, node
+
+
+def _remove(node, key):
+    if node is None:
+        raise TimelineIndexError("key %r not in tree" % (key,))
+    if key == node.key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        node.left = _remove(node.left, key)
+    else:
+        node.right = _remove(node.right, key)
+    node.update()
+    return node
+
+
+class IntervalTree(object):
+    """
+    A randomized balanced binary tree of [start, end] intervals ordered by
+    start, augmented with the minimum and maximum end of every subtree so
+    that overlap and containment queries only visit matching branches.
+
+    Keys are C{(start, seq)} tuples where C{seq} is a unique number chosen by
+    the caller, used to keep a stable order between intervals with the same
+    start.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, key, end, obj):
+        self.root = _insert(self.root, _Node(key, key[0], end, obj))
+        self.count += 1
+
+    def remove(self, key):
+        self.root = _remove(self.root, key)
+        self.count -= 1
+
+    def iterAll(self):
+        """Yield C{(key, obj)} for every interval, in key order."""
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node.key, node.obj
+                node = node.right
+
+    def stab(self, time, closed=False):
+        """
+        Yield C{(key, obj)} for the intervals containing C{time}, in key order.
+
+        @param closed: If C{True} intervals that start or end exactly at
+        C{time} are included.
+        """
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            if node is not None:
+                if node.max_end < time or (not closed and node.max_end == time):
+                    node = None
+                    continue
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                if node.start > time or (not closed and node.start == time):
+                    # everything on the right starts even later
+                    node = None
+                    continue
+                if node.end > time or (closed and node.end == time):
+                    yield node.key, node.obj
+                node = node.right
+
+    def starting(self, low=None, high=None, max_end=None):
+        """
+        Yield C{(key, obj)} for the intervals with C{low <= start <= high} and
+        C{end <= max_end}, in key order. C{None} disables a bound.
+        """
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            if node is not None:
+                if max_end is not None and node.min_end > max_end:
+                    node = None
+                    continue
+                stack.append(node)
+                if low is not None and node.start < low:
+                    # the left subtree only has smaller starts, visit this
+                    # node and then go right
+                    node = None
+                else:
+                    node = node.left
+            else:
+                node = stack.pop()
+                if high is not None and node.start > high:
+                    node = None
+                    continue
+                if (low is None or node.start >= low) and \
+                        (max_end is None or node.end <= max_end):
+                    yield node.key, node.obj
+                node = node.right
+
+
+class TimelineIndex(object):
+    """
+    Keeps the objects of a timeline in one L{IntervalTree} per priority so
+    that time-range queries cost O(log n + k) and can be restricted to a
+    range of layers without post-filtering.
+
+    The index reads C{start}, C{duration} and C{priority} from the objects
+    and must be told about changes through L{updateObject}.
+    """
+
+    def __init__(self):
+        self.layers = {}
+        self.by_object = {}
+        self._seq = 0
+
+    def __len__(self):
+        return len(self.by_object)
+
+    def __contains__(self, obj):
+        return obj in self.by_object
+
+    def _nextSeq(self):
+        self._seq += 1
+        return self._seq
+
+    def _insert(self, obj, key, end, priority):
+        try:
+            tree = self.layers[priority]
+        except KeyError:
+            tree = self.layers[priority] = IntervalTree()
+        tree.add(key, end, obj)
+        self.by_object[obj] = (key, end, priority)
+
+    def _remove(self, obj):
+        key, end, priority = self.by_object.pop(obj)
+        tree = self.layers[priority]
+        tree.remove(key)
+        if not tree:
+            del self.layers[priority]
+        return key
+
+    def addObject(self, obj):
+        if obj in self.by_object:
+            raise TimelineIndexError("object already indexed")
+
+        start = obj.start
+        self._insert(obj, (start, self._nextSeq()), start + obj.duration,
+                obj.priority)
+
+    def removeObject(self, obj):
+        if obj not in self.by_object:
+            raise TimelineIndexError("object not indexed")
+
+        self._remove(obj)
+
+    def updateObject(self, obj, reorder=False):
+        """
+        Refresh the position of C{obj} after its start, duration or priority
+        changed.
+
+        @param reorder: If C{True} the object is placed after the other
+        objects with the same start, like a fresh insertion.
+        """
+        key = self._remove(obj)
+        start = obj.start
+        if reorder or key[0] != start:
+            key = (start, self._nextSeq())
+        self._insert(obj, key, start + obj.duration, obj.priority)
+
+    def _trees(self, min_priority=None, max_priority=None):
+        return [tree for priority, tree in self.layers.iteritems()
+                if (min_priority is None or priority >= min_priority) and
+                (max_priority is None or priority <= max_priority)]
+
+    def _collect(self, iterators):
+        if len(iterators) == 1:
+            return [obj for key, obj in iterators[0]]
+        return [obj for key, obj in merge(*iterators)]
+
+    def getObjsAtTime(self, time, min_priority=None, max_priority=None,
+            closed=False):
+        """
+        Return the objects overlapping C{time}, ordered by start.
+
+        @param closed: If C{True} objects that start or end exactly at
+        C{time} are included.
+        """
+        return self._collect([tree.stab(time, closed)
+                for tree in self._trees(min_priority, max_priority)])
+
+    def getObjsStartingBetween(self, low=None, high=None, max_end=None,
+            min_priority=None, max_priority=None):
+        """
+        Return the objects with C{low <= start <= high} that end no later than
+        C{max_end}, ordered by start.
+        """
+        return self._collect([tree.starting(low, high, max_end)
+                for tree in self._trees(min_priority, max_priority)])
+
+
+class SortedTimes(object):
+    """
+    A sorted set of times where every time has a reference count, so the
+    same time can be added several times and is only dropped once it has
+    been removed as many times.
+
+    Distinct times are stored in blocks of at most 2 * L{BLOCK_SIZE} sorted
+    items, so adding or removing a time only moves the items of one block
+    instead of the whole list.
+    """
+
+    BLOCK_SIZE = 512
+
+    def __init__(self, times=()):
+        self._blocks = []
+        self._maxes = []
+        self._counts = {}
+        self._len = 0
+        if times:
+            self.update(times)
+
+    def __len__(self):
+        """The number of distinct times."""
+        return self._len
+
+    def __contains__(self, time):
+        return time in self._counts
+
+    def __iter__(self):
+        for block in self._blocks:
+            for time in block:
+                yield time
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._len
+        if index < 0 or index >= self._len:
+            raise IndexError("SortedTimes index out of range")
+
+        for block in self._blocks:
+            if index < len(block):
+                return block[index]
+            index -= len(block)
+
+    def count(self, time):
+        return self._counts.get(time, 0)
+
+    def update(self, times):
+        """
+        Add all the given times, rebuilding the blocks with a single sort.
+        """
+        counts = self._counts
+        for time in times:
+            counts[time] = counts.get(time, 0) + 1
+
+        values = sorted(counts)
+        size = self.BLOCK_SIZE
+        self._blocks = [values[i:i + size]
+                for i in xrange(0, len(values), size)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(values)
+
+    def clear(self):
+        self._blocks = []
+        self._maxes = []
+        self._counts = {}
+        self._len = 0
+
+    def add(self, time):
+        counts = self._counts
+        count = counts.get(time, 0)
+        counts[time] = count + 1
+        if count:
+            return
+
+        self._len += 1
+        maxes = self._maxes
+        if not maxes:
+            self._blocks.append([time])
+            maxes.append(time)
+            return
+
+        index = bisect_left(maxes, time)
+        if index == len(maxes):
+            index -= 1
+            self._blocks[index].append(time)
+            maxes[index] = time
+        else:
+            insort(self._blocks[index], time)
+
+        block = self._blocks[index]
+        if len(block) > 2 * self.BLOCK_SIZE:
+            half = block[self.BLOCK_SIZE:]
+            del block[self.BLOCK_SIZE:]
+            self._blocks.insert(index + 1, half)
+            maxes[index] = block[-1]
+            maxes.insert(index + 1, half[-1])
+
+    def remove(self, time):
+        """
+        Drop one reference to C{time}.
+
+        @raises KeyError: If C{time} isn't in the set.
+        """
+        counts = self._counts
+        count = counts[time]
+        if count > 1:
+            counts[time] = count - 1
+            return
+
+        del counts[time]
+        self._len -= 1
+        index = bisect_left(self._maxes, time)
+        block = self._blocks[index]
+        del block[bisect_left(block, time)]
+        if not block:
+            del self._blocks[index]
+            del self._maxes[index]
+        else:
+            self._maxes[index] = block[-1]
+
+    def closest(self, time):
+        """
+        Return the time closest to C{time} and the difference between them.
+        When two times are equally close the latest is returned.
+
+        @raises ValueError: If the set is empty.
+        """
+        maxes = self._maxes
+        if not maxes:
+            raise ValueError("closest() on empty SortedTimes")
+
+        index = bisect_left(maxes, time)
+        if index == len(maxes):
+            return maxes[-1], abs(time - maxes[-1])
+
+        block = self._blocks[index]
+        pos = bisect_left(block, time)
+        after = block[pos]
+        if pos > 0:
+            before = block[pos - 1]
+        elif index > 0:
+            before = maxes[index - 1]
+        else:
+            return after, abs(after - time)
+
+        if time - before < after - time:
+            return before, abs(time - before)
+        return after, abs(after - time)
+
+    def index(self, time):
+        """
+        Return the position of the first time that is not smaller than
+        C{time}.
+        """
+        maxes = self._maxes
+        block_index = bisect_left(maxes, time)
+        position = 0
+        for block in self._blocks[:block_index]:
+            position += len(block)
+        if block_index < len(maxes):
+            position += bisect_left(self._blocks[block_index], time)
+        return position
+
+    def before(self, time):
+        """Return the largest time strictly smaller than C{time}, or None."""
+        index = bisect_left(self._maxes, time)
+        if index < len(self._maxes):
+            block = self._blocks[index]
+            pos = bisect_left(block, time)
+            if pos > 0:
+                return block[pos - 1]
+        if index > 0:
+            return self._maxes[index - 1]
+        return None
+
+    def after(self, time):
+        """Return the smallest time strictly larger than C{time}, or None."""
+        index = bisect_right(self._maxes, time)
+        if index == len(self._maxes):
+            return None
+        block = self._blocks[index]
+        return block[bisect_right(block, time)]
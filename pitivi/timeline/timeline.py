@@ -20,17 +20,26 @@
 # Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
 # Boston, MA 02110-1301, USA.
 
-from bisect import bisect_left
+from itertools import izip
+from operator import attrgetter
+
+try:
+    import numpy
+except ImportError:
+    HAVE_NUMPY = False
+else:
+    HAVE_NUMPY = True
 
 from pitivi.signalinterface import Signallable
 from pitivi.log.loggable import Loggable
-from pitivi.utils import UNKNOWN_DURATION, closest_item, PropertyChangeTracker
+from pitivi.utils import UNKNOWN_DURATION, PropertyChangeTracker
 from pitivi.timeline.track import TrackObject, SourceTrackObject,\
      TrackEffect, TrackError
 from pitivi.stream import match_stream_groups_map
-from pitivi.utils import start_insort_right, infinity, getPreviousObject, \
-        getNextObject
+from pitivi.utils import start_insort_right, start_reinsort_right, \
+        infinity, getPreviousObject, getNextObject, between
 from pitivi.timeline.gap import Gap, SmallestGapsFinder, invalid_gap
+from pitivi.timeline.index import TimelineIndex, SortedTimes
 from pitivi.stream import VideoStream
 
 # Selection modes
@@ -95,6 +104,18 @@ class TimelineObject(Signallable, Loggable):
         'track-object-removed': ["track_object"],
     }
 
+    # signals notifying a property change, coalesced within a timeline
+    # transaction
+    property_signals = frozenset(['start-changed', 'duration-changed',
+            'in-point-changed', 'out-point-changed', 'media-duration-changed',
+            'priority-changed', 'selected-changed'])
+
+    # Attributes are stored in slots to keep the objects small on large
+    # timelines. Other attributes can still be set, they go in the instance
+    # dictionary which is only allocated when needed.
+    __slots__ = ('factory', 'track_objects', 'timeline', 'link', '_selected',
+            'logCategory', '_signal_group')
+
     DEFAULT_START = 0
     DEFAULT_DURATION = UNKNOWN_DURATION
     DEFAULT_IN_POINT = 0
@@ -119,6 +140,14 @@ class TimelineObject(Signallable, Loggable):
 
         return other
 
+    def emit(self, signame, *args, **kwargs):
+        if signame in self.property_signals and not kwargs and \
+                self.timeline is not None and \
+                self.timeline.queueNotification(self, signame, args):
+            return None
+
+        return Signallable.emit(self, signame, *args, **kwargs)
+
     #{ Property methods
 
     def _getStart(self):
@@ -556,6 +585,8 @@ class Selection(Signallable):
 
 # FIXME : What is this for ? It's not used anywhere AFAICS (Edward)
 class LinkEntry(object):
+    __slots__ = ('start', 'duration')
+
     def __init__(self, start, duration):
         self.start = start
         self.duration = duration
@@ -649,8 +680,11 @@ class Link(object):
             self.waiting_update.remove(timeline_object)
             for linked_object in list(self.waiting_update):
                 # this will trigger signals that modify self.waiting_update so
-                # we iterate over a copy
-                linked_object.start += delta
+                # we iterate over a copy.
+                # Use the last notified start, within a timeline transaction
+                # linked_object might already have been moved.
+                tracker = self.property_trackers[linked_object]
+                linked_object.start = tracker.properties['start'] + delta
 
                 if linked_object.start < earliest.start:
                     earliest = linked_object
@@ -683,9 +717,13 @@ class TimelineEdges(object):
     """
     Tracks start/stop values and offers convenience methods to find the
     closest value for a given position.
+
+    @ivar edges: The distinct start/stop values.
+    @type edges: L{SortedTimes}
     """
     def __init__(self):
-        self.edges = []
+        self.edges = SortedTimes()
+        self.timeline_objects = set()
         self.by_start = {}
         self.by_end = {}
         self.by_time = {}
@@ -705,6 +743,46 @@ class TimelineEdges(object):
 
         self._connectToTimelineObject(timeline_object)
 
+    def addTimelineObjects(self, timeline_objects):
+        """
+        Add the start/stop values of many objects at once.
+
+        The edges are sorted once at the end instead of being inserted one by
+        one.
+
+        @param timeline_objects: The objects whose start/stop we want to
+        track.
+        @type timeline_objects: iterable of L{TimelineObject}
+        """
+        times = []
+        for timeline_object in timeline_objects:
+            for obj in timeline_object.track_objects:
+                times.extend(self._addTrackObject(obj))
+
+            self._connectToTimelineObject(timeline_object)
+
+        self.edges.update(times)
+
+    def rebuild(self, timeline_objects):
+        """
+        Stop tracking every object and start tracking the given ones.
+
+        @type timeline_objects: iterable of L{TimelineObject}
+        """
+        for timeline_object in list(self.timeline_objects):
+            self._disconnectFromTimelineObject(timeline_object)
+        for track_object in self.by_object:
+            self._disconnectFromTrackObject(track_object)
+
+        self.edges.clear()
+        self.by_start = {}
+        self.by_end = {}
+        self.by_time = {}
+        self.by_object = {}
+        self.changed_objects = {}
+
+        self.addTimelineObjects(timeline_objects)
+
     def removeTimelineObject(self, timeline_object):
         """
         Remove this object's start/stop values from the edges.
@@ -718,10 +796,12 @@ class TimelineEdges(object):
             self.removeTrackObject(obj)
 
     def _connectToTimelineObject(self, timeline_object):
+        self.timeline_objects.add(timeline_object)
         timeline_object.connect("track-object-added", self._trackObjectAddedCb)
         timeline_object.connect("track-object-removed", self._trackObjectRemovedCb)
 
     def _disconnectFromTimelineObject(self, timeline_object):
+        self.timeline_objects.discard(timeline_object)
         timeline_object.disconnect_by_func(self._trackObjectAddedCb)
         timeline_object.disconnect_by_func(self._trackObjectRemovedCb)
 
@@ -732,14 +812,17 @@ class TimelineEdges(object):
         self.removeTrackObject(track_object)
 
     def addTrackObject(self, track_object):
+        self.addStartEnd(*self._addTrackObject(track_object))
+
+    def _addTrackObject(self, track_object):
+        # track the object without touching self.edges, returns the edges
+        # that need to be added
         if track_object in self.by_object:
             raise TimelineError("TrackObject already controlled by this TimelineEdge")
 
         start = track_object.start
         end = track_object.start + track_object.duration
 
-        self.addStartEnd(start, end)
-
         self.by_start.setdefault(start, []).append(track_object)
         self.by_end.setdefault(end, []).append(track_object)
         self.by_time.setdefault(start, []).append(track_object)
@@ -747,6 +830,8 @@ class TimelineEdges(object):
         self.by_object[track_object] = (start, end)
         self._connectToTrackObject(track_object)
 
+        return start, end
+
     def removeTrackObject(self, track_object):
         try:
             old_start, old_end = self.by_object.pop(track_object)
@@ -797,32 +882,25 @@ class TimelineEdges(object):
         self._maybeProcessChanges()
 
     def addStartEnd(self, start, end=None):
-        lo = 0
-        index = bisect_left(self.edges, start, lo=lo)
-        lo = index
-        self.edges.insert(index, start)
+        self.edges.add(start)
 
         if end is not None:
-            index = bisect_left(self.edges, end, lo=lo)
-            self.edges.insert(index, end)
+            self.edges.add(end)
 
     def removeStartEnd(self, start, end=None):
-        lo = 0
-        index = bisect_left(self.edges, start, lo=lo)
-        # check if start is a valid edge
-        if index == len(self.edges) or self.edges[index] != start:
+        # check that both edges are valid before removing anything
+        if start not in self.edges:
             raise TimelineError("Start (%r) is not a valid edge" % start)
 
-        del self.edges[index]
-        lo = index
-
         if end is not None:
-            index = bisect_left(self.edges, end, lo=lo)
-            # check if end is a valid edge
-            if index == len(self.edges) or self.edges[index] != end:
-                raise TimelineError("End (%r) is not a valid edge")
+            if end not in self.edges or \
+                    (end == start and self.edges.count(end) < 2):
+                raise TimelineError("End (%r) is not a valid edge" % end)
+
+        self.edges.remove(start)
 
-            del self.edges[index]
+        if end is not None:
+            self.edges.remove(end)
 
     def enableUpdates(self):
         self.enable_updates = True
@@ -874,14 +952,12 @@ class TimelineEdges(object):
         if len(self.edges) == 0:
             return start, 0
 
-        start_closest, start_diff, start_index = \
-                closest_item(self.edges, start)
+        start_closest, start_diff = self.edges.closest(start)
 
         if end is None or len(self.edges) == 1:
             return start_closest, start_diff,
 
-        end_closest, end_diff, end_index = \
-                closest_item(self.edges, end, start_index)
+        end_closest, end_diff = self.edges.closest(end)
 
         if start_diff <= end_diff:
             return start_closest, start_diff
@@ -897,7 +973,8 @@ class TimelineEdges(object):
         @param position: The position to search for.
         @type position: L{long}
         """
-        closest, diff, index = closest_item(self.edges, position)
+        closest, diff = self.edges.closest(position)
+        index = self.edges.index(closest)
         return self.edges[max(0, index - 2)], self.edges[min(
             len(self.edges) - 1, index + 1)]
 
@@ -924,6 +1001,300 @@ class TimelineEdges(object):
         return []
 
 
+class TimelineKeyframes(object):
+    """
+    Tracks the positions of the L{TimelineObject} boundaries and of the
+    visible keyframes of their L{TrackObject}s, used to seek from keyframe to
+    keyframe.
+
+    The positions are updated from the object and interpolator signals so
+    that looking up the previous or next keyframe doesn't need to walk the
+    whole timeline.
+
+    @ivar positions: The distinct keyframe positions, in timeline time.
+    @type positions: L{SortedTimes}
+    """
+    def __init__(self):
+        self.positions = SortedTimes()
+        self.extents = {}
+        self.interpolators = {}
+        self.keyframes = {}
+
+    def addTimelineObject(self, timeline_object):
+        """
+        Start tracking the keyframes of the given object.
+
+        @type timeline_object: L{TimelineObject}
+        @raises TimelineError: If the object is already tracked.
+        """
+        if timeline_object in self.extents:
+            raise TimelineError("TimelineObject already controlled by "
+                    "this TimelineKeyframes")
+
+        start = timeline_object.start
+        end = start + timeline_object.duration
+        self.extents[timeline_object] = (start, end)
+        self.positions.add(start)
+        self.positions.add(end)
+
+        timeline_object.connect("start-changed", self._timelineObjectChangedCb)
+        timeline_object.connect("duration-changed",
+                self._timelineObjectChangedCb)
+        timeline_object.connect("in-point-changed",
+                self._timelineObjectChangedCb)
+        timeline_object.connect("track-object-added",
+                self._trackObjectAddedCb)
+        timeline_object.connect("track-object-removed",
+                self._trackObjectRemovedCb)
+
+        for track_object in timeline_object.track_objects:
+            self._addTrackObject(track_object)
+
+    def removeTimelineObject(self, timeline_object):
+        """
+        Stop tracking the keyframes of the given object.
+
+        @type timeline_object: L{TimelineObject}
+        @raises TimelineError: If the object isn't tracked.
+        """
+        try:
+            start, end = self.extents.pop(timeline_object)
+        except KeyError:
+            raise TimelineError("TimelineObject not controlled by "
+                    "this TimelineKeyframes")
+
+        self.positions.remove(start)
+        self.positions.remove(end)
+
+        timeline_object.disconnect_by_func(self._timelineObjectChangedCb)
+        timeline_object.disconnect_by_func(self._trackObjectAddedCb)
+        timeline_object.disconnect_by_func(self._trackObjectRemovedCb)
+
+        for track_object in timeline_object.track_objects:
+            self._removeTrackObject(track_object)
+
+    def getPrevKeyframe(self, time):
+        """
+        Return the closest keyframe position before C{time}, or C{None}.
+        """
+        return self.positions.before(time)
+
+    def getNextKeyframe(self, time):
+        """
+        Return the closest keyframe position after C{time}, or C{None}.
+        """
+        return self.positions.after(time)
+
+    def _trackObjectAddedCb(self, timeline_object, track_object):
+        self._addTrackObject(track_object)
+        # the extent is the one of the first track object
+        self._updateExtent(timeline_object)
+
+    def _trackObjectRemovedCb(self, timeline_object, track_object):
+        self._removeTrackObject(track_object)
+        self._updateExtent(timeline_object)
+
+    def _timelineObjectChangedCb(self, timeline_object, unused_value):
+        self._updateExtent(timeline_object)
+        for track_object in timeline_object.track_objects:
+            for interpolator in self.interpolators.get(track_object, ()):
+                for keyframe in interpolator.getInteriorKeyframes():
+                    self._updateKeyframe(keyframe)
+
+    def _updateExtent(self, timeline_object):
+        old_start, old_end = self.extents[timeline_object]
+        start = timeline_object.start
+        end = start + timeline_object.duration
+        if (start, end) == (old_start, old_end):
+            return
+
+        self.positions.remove(old_start)
+        self.positions.remove(old_end)
+        self.positions.add(start)
+        self.positions.add(end)
+        self.extents[timeline_object] = (start, end)
+
+    def _addTrackObject(self, track_object):
+        self.interpolators[track_object] = []
+        track_object.connect("interpolators-changed",
+                self._interpolatorsChangedCb)
+        self._connectToInterpolators(track_object)
+
+    def _removeTrackObject(self, track_object):
+        track_object.disconnect_by_func(self._interpolatorsChangedCb)
+        self._disconnectFromInterpolators(track_object)
+        del self.interpolators[track_object]
+
+    def _interpolatorsChangedCb(self, track_object):
+        self._disconnectFromInterpolators(track_object)
+        self._connectToInterpolators(track_object)
+
+    def _connectToInterpolators(self, track_object):
+        try:
+            interpolators = track_object.getInterpolators()
+        except TrackError:
+            # the object isn't in a track anymore, it will emit
+            # interpolators-changed when it's added to one again
+            return
+
+        for prop, interpolator in interpolators.itervalues():
+            interpolator.connect("keyframe-added", self._keyframeAddedCb)
+            interpolator.connect("keyframe-removed", self._keyframeRemovedCb)
+            self.interpolators[track_object].append(interpolator)
+            for keyframe in interpolator.getInteriorKeyframes():
+                self._addKeyframe(keyframe)
+
+    def _disconnectFromInterpolators(self, track_object):
+        interpolators = self.interpolators[track_object]
+        for interpolator in interpolators:
+            interpolator.disconnect_by_func(self._keyframeAddedCb)
+            interpolator.disconnect_by_func(self._keyframeRemovedCb)
+            for keyframe in interpolator.getInteriorKeyframes():
+                self._removeKeyframe(keyframe)
+        del interpolators[:]
+
+    def _keyframeAddedCb(self, interpolator, keyframe):
+        self._addKeyframe(keyframe)
+
+    def _keyframeRemovedCb(self, interpolator, keyframe, old_value):
+        self._removeKeyframe(keyframe)
+
+    def _keyframeTimeChangedCb(self, keyframe, time):
+        # Interpolator emits keyframe-moved before setting the new time, so
+        # follow the keyframe itself
+        self._updateKeyframe(keyframe)
+
+    def _addKeyframe(self, keyframe):
+        self.keyframes[keyframe] = None
+        keyframe.connect("time-changed", self._keyframeTimeChangedCb)
+        self._updateKeyframe(keyframe)
+
+    def _removeKeyframe(self, keyframe):
+        keyframe.disconnect_by_func(self._keyframeTimeChangedCb)
+        position = self.keyframes.pop(keyframe)
+        if position is not None:
+            self.positions.remove(position)
+
+    def _updateKeyframe(self, keyframe):
+        interpolator = keyframe.parent
+        track_object = interpolator.trackobject
+        # keyframes trimmed out of the object are skipped
+        if between(interpolator.start.time, keyframe.time,
+                interpolator.end.time):
+            position = keyframe.time + track_object.start - \
+                    track_object.in_point
+        else:
+            position = None
+
+        old_position = self.keyframes[keyframe]
+        if position == old_position:
+            return
+
+        if old_position is not None:
+            self.positions.remove(old_position)
+        if position is not None:
+            self.positions.add(position)
+        self.keyframes[keyframe] = position
+
+
+def _int_array(values):
+    """
+    Return C{values} as a contiguous array of 64 bits integers if numpy is
+    available, else as a C{list}: C{array.array} can't hold 64 bits integers
+    on all platforms.
+    """
+    if HAVE_NUMPY:
+        return numpy.array(values, numpy.int64)
+    return list(values)
+
+
+def _shift(values, offset):
+    """
+    @return: C{values}, as returned by L{_int_array}, plus C{offset}.
+    @rtype: C{list} of C{int}
+    """
+    if HAVE_NUMPY:
+        return (values + offset).tolist()
+    return [value + offset for value in values]
+
+
+class RippleSet(object):
+    """
+    The L{TimelineObject}s that follow the edited objects in ripple mode.
+
+    The offsets of the objects from a reference position and priority are
+    computed once and kept in integer arrays, the objects are then moved as
+    a batch with L{Timeline.moveTimelineObjects}.
+
+    @ivar timeline_objects: The rippled objects.
+    @type timeline_objects: C{list} of L{TimelineObject}
+    """
+
+    def __init__(self, timeline, timeline_objects, start, priority):
+        """
+        @param start: The reference position of the offsets.
+        @type start: C{long}
+        @param priority: The reference priority of the offsets.
+        @type priority: C{int}
+        """
+        self.timeline = timeline
+        self.timeline_objects = list(timeline_objects)
+        self.original_starts = _int_array([timeline_object.start
+                for timeline_object in self.timeline_objects])
+        self.original_priorities = _int_array([timeline_object.priority
+                for timeline_object in self.timeline_objects])
+        self.start_offsets = _int_array(_shift(self.original_starts, -start))
+        self.priority_offsets = _int_array(_shift(self.original_priorities,
+                -priority))
+
+    def __len__(self):
+        return len(self.timeline_objects)
+
+    def getMinimumOffset(self):
+        """
+        @return: The offset of the earliest object, 0 if the set is empty.
+        @rtype: C{long}
+        """
+        if not len(self.start_offsets):
+            return 0
+
+        if HAVE_NUMPY:
+            return int(self.start_offsets.min())
+        return min(self.start_offsets)
+
+    def getEnd(self):
+        """
+        @return: The end of the latest object, 0 if the set is empty.
+        @rtype: C{long}
+        """
+        return max([0] + [timeline_object.start + timeline_object.duration
+                for timeline_object in self.timeline_objects])
+
+    def moveTo(self, position, priority=None):
+        """
+        Move the objects so that the reference position is at C{position}.
+
+        @param priority: If not C{None}, the new reference priority.
+        @type priority: C{int}
+        """
+        starts = _shift(self.start_offsets, position)
+        if priority is None:
+            priorities = None
+        else:
+            priorities = _shift(self.priority_offsets, priority)
+
+        self.timeline.moveTimelineObjects(self.timeline_objects, starts,
+                priorities)
+
+    def restore(self):
+        """
+        Move the objects back to their original start and priority.
+        """
+        self.timeline.moveTimelineObjects(self.timeline_objects,
+                _shift(self.original_starts, 0),
+                _shift(self.original_priorities, 0))
+
+
 class EditingContext(object):
 
     DEFAULT = 0
@@ -1054,12 +1425,17 @@ class EditingContext(object):
         self._snap = snap
 
     def editTo(self, position, priority):
-        if self._mode == self.DEFAULT:
-            position, priority = self._defaultTo(position, priority)
-        if self._mode == self.ROLL:
-            position, priority = self._rollTo(position, priority)
-        elif self._mode == self.RIPPLE:
-            position, priority = self._rippleTo(position, priority)
+        # every object moved by this step is notified once
+        self.timeline.beginTransaction()
+        try:
+            if self._mode == self.DEFAULT:
+                position, priority = self._defaultTo(position, priority)
+            if self._mode == self.ROLL:
+                position, priority = self._rollTo(position, priority)
+            elif self._mode == self.RIPPLE:
+                position, priority = self._rippleTo(position, priority)
+        finally:
+            self.timeline.commitTransaction()
         self._last_position = position
         self._last_priority = priority
 
@@ -1123,18 +1499,13 @@ class MoveContext(EditingContext):
         self.default_span = latest - earliest
 
         ripple = timeline.getObjsAfterTime(latest)
-        self.ripple_offsets = self._getOffsets(self.focus.start,
-            self.focus.priority, ripple)
+        self.ripple = RippleSet(timeline, ripple, self.focus.start,
+                self.focus.priority)
 
         # get the span over all clips for ripple editing
-        for timeline_object in ripple:
-            latest = max(latest, timeline_object.start +
-                timeline_object.duration)
+        latest = max(latest, self.ripple.getEnd())
         self.ripple_span = latest - earliest
 
-        # save default values
-        self.ripple_originals = self._saveValues(ripple)
-
         self.timeline_objects_plus_ripple = set(self.timeline_objects)
         self.timeline_objects_plus_ripple.update(ripple)
 
@@ -1282,7 +1653,7 @@ class MoveContext(EditingContext):
         return position, priority
 
     def _finishRipple(self):
-        self._restoreValues(self.ripple_originals)
+        self.ripple.restore()
 
     def _rippleTo(self, position, priority):
         if self._snap:
@@ -1311,9 +1682,7 @@ class MoveContext(EditingContext):
         for obj, (s_offset, p_offset) in self.offsets.iteritems():
             obj.setStart(position + s_offset)
             obj.priority = priority + p_offset
-        for obj, (s_offset, p_offset) in self.ripple_offsets.iteritems():
-            obj.setStart(position + s_offset)
-            obj.priority = priority + p_offset
+        self.ripple.moveTo(position, priority)
 
         return position, priority
 
@@ -1338,13 +1707,8 @@ class TrimStartContext(EditingContext):
 
         ripple = self.timeline.getObjsBeforeTime(focus.start)
         assert not focus.timeline_object in ripple or focus.duration == 0
-        self.ripple_originals = self._saveValues(ripple)
-        self.ripple_offsets = self._getOffsets(focus.start, focus.priority,
-            ripple)
-        if ripple:
-            self.ripple_min = focus.start - min((obj.start for obj in ripple))
-        else:
-            self.ripple_min = 0
+        self.ripple = RippleSet(timeline, ripple, focus.start, focus.priority)
+        self.ripple_min = -self.ripple.getMinimumOffset()
 
     def _rollTo(self, position, priority):
         earliest = self.focus.start - self.focus.in_point
@@ -1367,13 +1731,12 @@ class TrimStartContext(EditingContext):
         position = min(latest, max(position, earliest))
         self.focus.trimStart(position)
         r_position = max(position, self.ripple_min)
-        for obj, (s_offset, p_offset) in self.ripple_offsets.iteritems():
-            obj.setStart(r_position + s_offset)
+        self.ripple.moveTo(r_position)
 
         return position, priority
 
     def _finishRipple(self):
-        self._restoreValues(self.ripple_originals)
+        self.ripple.restore()
 
     def _defaultTo(self, position, priority):
         earliest = max(0, self.focus.start - self.focus.in_point)
@@ -1415,10 +1778,8 @@ class TrimEndContext(EditingContext):
 
         reference = focus.start + focus.duration
         ripple = self.timeline.getObjsAfterTime(reference)
-
-        self.ripple_originals = self._saveValues(ripple)
-        self.ripple_offsets = self._getOffsets(reference, self.focus.priority,
-            ripple)
+        self.ripple = RippleSet(timeline, ripple, reference,
+                self.focus.priority)
 
     def _rollTo(self, position, priority):
         if self._snap:
@@ -1440,13 +1801,12 @@ class TrimEndContext(EditingContext):
         position = min(latest, max(position, earliest))
         duration = position - self.focus.start
         self.focus.setDuration(duration)
-        for obj, (s_offset, p_offset) in self.ripple_offsets.iteritems():
-            obj.setStart(position + s_offset)
+        self.ripple.moveTo(position)
 
         return position, priority
 
     def _finishRipple(self):
-        self._restoreValues(self.ripple_originals)
+        self.ripple.restore()
 
     def _defaultTo(self, position, priority):
         duration = max(0, position - self.focus.start)
@@ -1472,6 +1832,24 @@ class TrimEndContext(EditingContext):
             self._defaultTo(duration, self.focus.priority)
 
 
+class TimelineTransaction(object):
+    """
+    Context manager running a L{Timeline} transaction.
+
+    @see: L{Timeline.transaction}
+    """
+    def __init__(self, timeline):
+        self.timeline = timeline
+
+    def __enter__(self):
+        self.timeline.beginTransaction()
+        return self.timeline
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timeline.commitTransaction()
+        return False
+
+
 class Timeline(Signallable, Loggable):
     """
     Top-level container for L{TimelineObject}s.
@@ -1488,6 +1866,12 @@ class Timeline(Signallable, Loggable):
     @type duration: C{long}
     @ivar selection: The currently selected TimelineObjects
     @type selection: L{Selection}
+    @ivar index: Interval index of the L{TimelineObject}s, used for time-range
+    queries.
+    @type index: L{TimelineIndex}
+    @ivar keyframes: Positions of the keyframes of the objects, used to seek
+    from keyframe to keyframe.
+    @type keyframes: L{TimelineKeyframes}
     """
     __signals__ = {
         'duration-changed': ['duration'],
@@ -1505,13 +1889,18 @@ class Timeline(Signallable, Loggable):
         self.selection = Selection()
         self.selection.connect("selection-changed", self._selectionChanged)
         self.timeline_objects = []
+        self.index = TimelineIndex()
         self.duration = 0
         self.links = []
         # FIXME : What's the unit of dead_band ?
         self.dead_band = 10
         self.edges = TimelineEdges()
+        self.keyframes = TimelineKeyframes()
         self.property_trackers = {}
         self._video_caps = None
+        self._transaction_depth = 0
+        self._pending_notifications = []
+        self._pending_by_key = {}
 
     def addTrack(self, track):
         """
@@ -1596,12 +1985,50 @@ class Timeline(Signallable, Loggable):
         self._connectToTimelineObject(obj)
 
         start_insort_right(self.timeline_objects, obj)
+        self.index.addObject(obj)
         obj.timeline = self
 
         self.edges.addTimelineObject(obj)
+        self.keyframes.addTimelineObject(obj)
 
         self.emit("timeline-object-added", obj)
 
+    def addTimelineObjects(self, objs):
+        """
+        Add many TimelineObjects to the Timeline at once.
+
+        The objects are validated and sorted once and the edges are computed
+        in one go, which makes loading big projects much faster than calling
+        L{addTimelineObject} for each object.
+
+        @param objs: The objects to add
+        @type objs: C{list} of L{TimelineObject}
+        @raises TimelineError: if one of the objects is used in another
+        Timeline.
+        """
+        objs = list(objs)
+        seen = set()
+        for obj in objs:
+            if obj.timeline is not None or obj in seen:
+                raise TimelineError("TimelineObject already controlled by another Timeline")
+
+            if not obj.track_objects:
+                raise TimelineError("TimelineObject doesn't have any TrackObject (THIS IS A VERY DUBIOUS CHECK, WE SHOULD ACCEPT THIS)")
+            seen.add(obj)
+
+        for obj in objs:
+            self._connectToTimelineObject(obj)
+            self.index.addObject(obj)
+            obj.timeline = self
+            self.keyframes.addTimelineObject(obj)
+
+        self.timeline_objects.extend(objs)
+        self.timeline_objects.sort(key=attrgetter('start'))
+        self.edges.addTimelineObjects(objs)
+
+        for obj in objs:
+            self.emit("timeline-object-added", obj)
+
     def removeTimelineObject(self, obj, deep=False):
         """
         Remove the given object from the Timeline.
@@ -1617,6 +2044,8 @@ class Timeline(Signallable, Loggable):
         except ValueError:
             raise TimelineError("TimelineObject not controlled by this Timeline")
 
+        self.index.removeObject(obj)
+
         if obj.link is not None:
             obj.link.removeTimelineObject(obj)
 
@@ -1625,6 +2054,7 @@ class Timeline(Signallable, Loggable):
         obj.timeline = None
 
         self.edges.removeTimelineObject(obj)
+        self.keyframes.removeTimelineObject(obj)
 
         self.emit("timeline-object-removed", obj)
 
@@ -1633,14 +2063,62 @@ class Timeline(Signallable, Loggable):
                 track = track_object.track
                 track.removeTrackObject(track_object)
 
+    def removeTimelineObjects(self, objs, deep=False):
+        """
+        Remove many objects from the Timeline at once.
+
+        @param objs: The objects to remove
+        @type objs: C{list} of L{TimelineObject}
+        @param deep: If C{True}, remove the L{TrackObject}s associated to the
+        objects, one batch per track.
+        @type deep: C{bool}
+        @raises TimelineError: If one of the objects doesn't belong to the
+        timeline.
+        """
+        objs = list(objs)
+        removed = set(objs)
+        for obj in objs:
+            if obj.timeline is not self:
+                raise TimelineError("TimelineObject not controlled by this Timeline")
+        if len(removed) != len(objs):
+            raise TimelineError("TimelineObject not controlled by this Timeline")
+
+        self.timeline_objects[:] = [obj for obj in self.timeline_objects
+                if obj not in removed]
+
+        for obj in objs:
+            self.index.removeObject(obj)
+
+            if obj.link is not None:
+                obj.link.removeTimelineObject(obj)
+
+            self._disconnectFromTimelineObject(obj)
+
+            obj.timeline = None
+
+            self.edges.removeTimelineObject(obj)
+            self.keyframes.removeTimelineObject(obj)
+
+        for obj in objs:
+            self.emit("timeline-object-removed", obj)
+
+        if deep:
+            tracks = {}
+            for obj in objs:
+                for track_object in obj.track_objects:
+                    tracks.setdefault(track_object.track,
+                            []).append(track_object)
+
+            for track, track_objects in tracks.iteritems():
+                track.removeTrackObjects(track_objects)
+
     def removeFactory(self, factory):
         """Remove every instance factory in the timeline
         @param factory: the factory to remove from the timeline
         """
         objs = [obj for obj in self.timeline_objects if obj.factory is
             factory]
-        for obj in objs:
-            self.removeTimelineObject(obj, deep=True)
+        self.removeTimelineObjects(objs, deep=True)
 
     def usesFactory(self, factory):
         """
@@ -1655,21 +2133,27 @@ class Timeline(Signallable, Loggable):
         return False
 
     def _timelineObjectStartChangedCb(self, timeline_object, start):
-        self.timeline_objects.remove(timeline_object)
-        start_insort_right(self.timeline_objects, timeline_object)
+        start_reinsort_right(self.timeline_objects, timeline_object)
+        self.index.updateObject(timeline_object, reorder=True)
 
     def _timelineObjectDurationChangedCb(self, timeline_object, duration):
-        pass
+        self.index.updateObject(timeline_object)
+
+    def _timelineObjectPriorityChangedCb(self, timeline_object, priority):
+        self.index.updateObject(timeline_object)
 
     def _connectToTimelineObject(self, timeline_object):
         timeline_object.connect('start-changed',
                 self._timelineObjectStartChangedCb)
         timeline_object.connect('duration-changed',
                 self._timelineObjectDurationChangedCb)
+        timeline_object.connect('priority-changed',
+                self._timelineObjectPriorityChangedCb)
 
     def _disconnectFromTimelineObject(self, timeline_object):
         timeline_object.disconnect_by_function(self._timelineObjectStartChangedCb)
         timeline_object.disconnect_by_function(self._timelineObjectDurationChangedCb)
+        timeline_object.disconnect_by_function(self._timelineObjectPriorityChangedCb)
 
     # FIXME : shouldn't this be made more generic (i.e. not specific to source factories) ?
     # FIXME : Maybe it should be up to the ObjectFactory to create the TimelineObject since
@@ -1689,19 +2173,8 @@ class Timeline(Signallable, Loggable):
         @raises TimelineError: if C{strict} is True and no exact mapping could be calculated.
         """
         self.debug("factory:%r", factory)
-        output_streams = factory.getOutputStreams()
-        if not output_streams:
-            raise TimelineError("SourceFactory doesn't provide any Output Streams")
-
-        if stream_map is None:
-            stream_map = self._getSourceFactoryStreamMap(factory)
-            if len(stream_map) < len(output_streams):
-                # we couldn't assign each stream to a track automatically,
-                # error out and require the caller to pass a stream_map
-                self.error("Couldn't find a complete stream mapping (self:%d < factory:%d)",
-                           len(stream_map), len(output_streams))
-                if strict:
-                    raise TimelineError("Couldn't map all streams to available Tracks")
+        stream_map = self._getCheckedSourceFactoryStreamMap(factory,
+                stream_map, strict)
 
         timeline_object = TimelineObject(factory)
         start = 0
@@ -1717,6 +2190,55 @@ class Timeline(Signallable, Loggable):
         self.addTimelineObject(timeline_object)
         return timeline_object
 
+    def addSourceFactories(self, factories, start=None):
+        """
+        Creates a TimelineObject for each of the given SourceFactories and
+        adds them all to the timeline, one after the other.
+
+        The objects are added to the tracks and to the timeline in one batch,
+        see L{Track.addTrackObjects} and L{addTimelineObjects}.
+
+        @param factories: The factories to add.
+        @type factories: C{list} of L{SourceFactory}
+        @param start: Where to put the first object. If C{None}, each object
+        is put at the end of its tracks like L{addSourceFactory} does.
+        @type start: C{long}
+        @returns: The new L{TimelineObject}s, in the order of C{factories}.
+        @rtype: C{list} of L{TimelineObject}
+        """
+        track_ends = dict((track, track.duration) for track in self.tracks)
+        track_objects = dict((track, []) for track in self.tracks)
+        timeline_objects = []
+        for factory in factories:
+            self.debug("factory:%r", factory)
+            stream_map = self._getCheckedSourceFactoryStreamMap(factory)
+
+            timeline_object = TimelineObject(factory)
+            for stream, track in stream_map.iteritems():
+                track_object = SourceTrackObject(factory, stream)
+                track_objects[track].append(track_object)
+                timeline_object.addTrackObject(track_object)
+
+            if start is None:
+                object_start = max([0] + [track_ends[track]
+                        for track in stream_map.itervalues()])
+            else:
+                object_start = start
+            timeline_object.start = object_start
+            end = object_start + timeline_object.duration
+            for track in stream_map.itervalues():
+                track_ends[track] = end
+            if start is not None:
+                start = end
+
+            timeline_objects.append(timeline_object)
+
+        for track, objs in track_objects.iteritems():
+            track.addTrackObjects(objs)
+        self.addTimelineObjects(timeline_objects)
+
+        return timeline_objects
+
     def addEffectFactoryOnObject(self, factory, timeline_objects):
         """
         Add EffectTracks corresponding to the effect from the factory to the corresponding
@@ -1774,6 +2296,24 @@ class Timeline(Signallable, Loggable):
                            for listTo in listTimelineObjectTrackObject])
         return listTimelineObjectTrackObject
 
+    def _getCheckedSourceFactoryStreamMap(self, factory, stream_map=None,
+            strict=False):
+        output_streams = factory.getOutputStreams()
+        if not output_streams:
+            raise TimelineError("SourceFactory doesn't provide any Output Streams")
+
+        if stream_map is None:
+            stream_map = self._getSourceFactoryStreamMap(factory)
+            if len(stream_map) < len(output_streams):
+                # we couldn't assign each stream to a track automatically,
+                # error out and require the caller to pass a stream_map
+                self.error("Couldn't find a complete stream mapping (self:%d < factory:%d)",
+                           len(stream_map), len(output_streams))
+                if strict:
+                    raise TimelineError("Couldn't map all streams to available Tracks")
+
+        return stream_map
+
     def _getSourceFactoryStreamMap(self, factory):
         # track.stream -> track
         track_stream_to_track_map = dict((track.stream, track)
@@ -1963,8 +2503,7 @@ class Timeline(Signallable, Loggable):
         Removes all the currently selected L{TimelineObject}s from the Timeline.
         """
         self.unlinkSelection()
-        for timeline_object in self.selection:
-            self.removeTimelineObject(timeline_object, deep=True)
+        self.removeTimelineObjects(self.selection, deep=True)
         self.selection.setSelection(set([]), SELECT)
 
     def split(self, time):
@@ -1979,9 +2518,7 @@ class Timeline(Signallable, Loggable):
             obj.split(time)
 
     def rebuildEdges(self):
-        self.edges = TimelineEdges()
-        for timeline_object in self.timeline_objects:
-            self.edges.addTimelineObject(timeline_object)
+        self.edges.rebuild(self.timeline_objects)
 
     def snapToEdge(self, start, end=None):
         """
@@ -1999,6 +2536,138 @@ class Timeline(Signallable, Loggable):
 
         return start
 
+    def moveTimelineObjects(self, timeline_objects, starts, priorities=None):
+        """
+        Move several objects as a batch. The starts and priorities are
+        written straight to the L{TrackObject}s, without snapping nor
+        clamping, within a single transaction: the lists sorted by start are
+        sorted once for all the objects, then each moved object is notified
+        once. Objects that don't move are not notified.
+
+        @param timeline_objects: The objects to move.
+        @type timeline_objects: C{list} of L{TimelineObject}
+        @param starts: The new starts, in the same order as the objects.
+        @type starts: C{list} of C{long}
+        @param priorities: If not C{None}, the new priorities, in the same
+        order as the objects.
+        @type priorities: C{list} of C{int}
+        @raises TimelineError: If an object doesn't control any
+        C{TrackObject}s.
+        """
+        self.beginTransaction()
+        try:
+            for timeline_object, start in izip(timeline_objects, starts):
+                track_objects = timeline_object.track_objects
+                if not track_objects:
+                    raise TimelineError("TimelineObject doesn't control "
+                            "any TrackObjects")
+
+                if track_objects[0].start == start:
+                    continue
+
+                for track_object in track_objects:
+                    track_object.setObjectStart(start)
+                self.queueNotification(timeline_object, 'start-changed',
+                        (start,))
+
+            if priorities is not None:
+                for timeline_object, priority in \
+                        izip(timeline_objects, priorities):
+                    track_objects = timeline_object.track_objects
+                    if track_objects[0].priority == priority:
+                        continue
+
+                    for track_object in track_objects:
+                        track_object.setObjectPriority(priority)
+                    self.queueNotification(timeline_object,
+                            'priority-changed', (priority,))
+        finally:
+            self.commitTransaction()
+
+    def transaction(self):
+        """
+        Return a context manager running a transaction, see
+        L{beginTransaction}.
+
+        Example::
+            with timeline.transaction():
+                for timeline_object in timeline_objects:
+                    timeline_object.start += delta
+
+        @rtype: L{TimelineTransaction}
+        """
+        return TimelineTransaction(self)
+
+    def beginTransaction(self):
+        """
+        Start a transaction. Until the matching L{commitTransaction}, the
+        property notifications (C{start-changed}, C{duration-changed}...) of
+        the L{TimelineObject}s and L{TrackObject}s of the timeline are queued
+        and collapsed to their last value, then they are emitted once per
+        object and signal on commit, in the order they were first emitted.
+
+        The state derived from those notifications (the order of
+        L{timeline_objects}, the L{index}, the edges...) is only updated on
+        commit, so it must not be queried within a transaction.
+
+        Transactions can be nested, the notifications are emitted when the
+        outermost transaction is committed.
+        """
+        self._transaction_depth += 1
+
+    def commitTransaction(self):
+        """
+        Commit the current transaction, see L{beginTransaction}.
+
+        @raises TimelineError: If there's no transaction in progress.
+        """
+        if not self._transaction_depth:
+            raise TimelineError("No transaction in progress")
+
+        self._transaction_depth -= 1
+        if self._transaction_depth:
+            return
+
+        pending = self._pending_notifications
+        self._pending_notifications = []
+        self._pending_by_key = {}
+        if not pending:
+            return
+
+        # start-changed handlers remove the object and insert it back in
+        # sorted lists, which only works if the lists are sorted
+        start_key = attrgetter("start")
+        self.timeline_objects.sort(key=start_key)
+        for track in self.tracks:
+            track.track_objects.sort(key=start_key)
+
+        for obj, signame, args in pending:
+            Signallable.emit(obj, signame, *args)
+
+    def queueNotification(self, obj, signame, args):
+        """
+        Queue a property notification of C{obj} if a transaction is in
+        progress.
+
+        @return: C{True} if the notification was queued, C{False} if it must
+        be emitted right away.
+        @rtype: C{bool}
+        """
+        if not self._transaction_depth:
+            return False
+
+        key = (id(obj), signame)
+        try:
+            notification = self._pending_by_key[key]
+        except KeyError:
+            notification = [obj, signame, args]
+            self._pending_by_key[key] = notification
+            self._pending_notifications.append(notification)
+        else:
+            notification[2] = args
+
+        return True
+
     def disableUpdates(self):
         """
         Block internal updates. Use this when doing more than one consecutive
@@ -2023,119 +2692,49 @@ class Timeline(Signallable, Loggable):
 
         self.emit("disable-updates", False)
 
-    def getObjsAtTime(self, time):
-        objects = []
-        for obj in self.timeline_objects:
-            if obj.start < time:
-                if (obj.start + obj.duration) > time:
-                    objects.append(obj)
-            else:
-                break
-        return objects
+    def getObjsAtTime(self, time, min_priority=None, max_priority=None):
+        """
+        Return the objects that overlap C{time}, ordered by start.
+
+        Objects starting or ending exactly at C{time} are not included.
+        """
+        return self.index.getObjsAtTime(time, min_priority, max_priority)
 
     def getObjsAfterObj(self, obj):
         return self.getObjsAfterTime(obj.start + obj.duration)
 
     def getObjsAfterTime(self, target):
-        objects = []
-        for i in range(0, len(self.timeline_objects)):
-            if self.timeline_objects[i].start >= target:
-                objects.extend(self.timeline_objects[i:])
-                break
-        return objects
+        """Return the objects starting at or after C{target}."""
+        return self.index.getObjsStartingBetween(low=target)
 
     def getObjsBeforeObj(self, obj):
         return self.getObjsBeforeTime(obj.start)
 
     def getObjsBeforeTime(self, target):
-        objects = []
-        for obj in self.timeline_objects:
-            if obj.start > target:
-                break
-            elif obj.start + obj.duration <= target:
-                objects.append(obj)
-        return objects
+        """Return the objects ending at or before C{target}."""
+        return self.index.getObjsStartingBetween(high=target, max_end=target)
 
     def getObjsInRegion(self, start, end, min_priority=0,
         max_priority=4294967295L):
-        objects = []
-        for obj in self.timeline_objects:
-            if obj.start >= start:
-                if ((obj.start + obj.duration) <= end and
-                obj.priority >= min_priority and
-                obj.priority <= max_priority):
-                    objects.append(obj)
-            elif obj.start > end:
-                break
-        return objects
+        """
+        Return the objects contained in the [C{start}, C{end}] region and
+        whose priority is between C{min_priority} and C{max_priority}.
+        """
+        return self.index.getObjsStartingBetween(start, end, end,
+                min_priority, max_priority)
 
     def getPrevKeyframe(self, time):
-        tl_objs = []
-
-        # Exclude objects that start after current position.
-        for obj in self.timeline_objects:
-            tl_objs.append(obj)
-            if obj.start > time:
-                break
-
-        keyframe_positions = self._getKeyframePositions(tl_objs)
-        for n in range(len(keyframe_positions) - 1, -1, -1):
-            if keyframe_positions[n] < time:
-                return keyframe_positions[n]
-        return None
+        """Return the closest keyframe position before C{time}, or C{None}."""
+        return self.keyframes.getPrevKeyframe(time)
 
     def getNextKeyframe(self, time):
-        tl_objs = []
-
-        # Include from first object whose end is after the current
-        # position onward.
-        for obj in self.timeline_objects:
-            if (obj.start + obj.duration) > time:
-                n = self.timeline_objects.index(obj)
-                tl_objs.extend(self.timeline_objects[n:])
-                break
-
-        keyframe_positions = self._getKeyframePositions(tl_objs)
-        for n in range(0, len(keyframe_positions)):
-            if keyframe_positions[n] > time:
-                return keyframe_positions[n]
-
-        return None
-
-    def _getKeyframePositions(self, timeline_objects):
-        keyframe_positions = set([])
-        for tl_obj in timeline_objects:
-            first_track = True
-            for track_obj in tl_obj.track_objects:
-                start = track_obj.start
-                in_point = track_obj.in_point
-                if first_track:
-                    keyframe_positions.add(start)
-                    keyframe_positions.add(start + track_obj.duration)
-                    first_track = False
-
-                interpolators = track_obj.getInterpolators()
-                for value in interpolators:
-                    interpolator = track_obj.getInterpolator(value)
-                    keyframes = interpolator.getInteriorKeyframes()
-                    for kf in keyframes:
-                        position_in_obj = kf.getTime() + start - in_point
-                        keyframe_positions.add(position_in_obj)
-        keyframe_positions = list(keyframe_positions)
-        keyframe_positions.sort()
-        return keyframe_positions
+        """Return the closest keyframe position after C{time}, or C{None}."""
+        return self.keyframes.getNextKeyframe(time)
 
     def getObjsToAddEffectTo(self, point, priority):
-        timeline_objects = []
         if point == -1:
-            for obj in self.timeline_objects:
-                if obj.priority == priority:
-                    timeline_objects.append(obj)
-        else:
-            for obj in self.timeline_objects:
-                if (obj.start <= point and
-                    point <= (obj.start + obj.duration) and\
-                    obj.priority == priority):
-                    timeline_objects.append(obj)
+            return self.index.getObjsStartingBetween(min_priority=priority,
+                    max_priority=priority)
 
-        return timeline_objects
+        return self.index.getObjsAtTime(point, priority, priority,
+                closed=True)
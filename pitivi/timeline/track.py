@@ -19,12 +19,15 @@
 # Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
 # Boston, MA 02110-1301, USA.
 
+from bisect import bisect_left
+from operator import attrgetter, itemgetter
+
 import gst
 import gobject
 
 from pitivi.signalinterface import Signallable
 from pitivi.utils import get_controllable_properties, getPreviousObject, \
-        getNextObject, start_insort_right, between
+        getNextObject, start_insort_right, start_reinsort_right, between
 from pitivi.log.loggable import Loggable
 from pitivi.stream import VideoStream, AudioStream
 from pitivi.factories.test import VideoTestSourceFactory, \
@@ -47,13 +50,17 @@ class Keyframe(Signallable):
         "mode-changed": ['mode'],
     }
 
+    # there can be a lot of keyframes, keep them small
+    __slots__ = ('parent', '_mode', '_time', '_value', '_signal_group')
+
     def __init__(self, parent):
         self.parent = parent
+        self._mode = gst.INTERPOLATE_LINEAR
+        self._time = 0
+        self._value = None
 
 ## Properties
 
-    _mode = gst.INTERPOLATE_LINEAR
-
     def setMode(self, mode):
         if self.parent:
             self.parent.setKeyframeMode(self, mode)
@@ -69,8 +76,6 @@ class Keyframe(Signallable):
 
     mode = property(getMode, setMode)
 
-    _time = 0
-
     def setTime(self, time):
         if self.parent:
             self.parent.setKeyframeTime(self, time)
@@ -86,8 +91,6 @@ class Keyframe(Signallable):
 
     time = property(getTime, setTime)
 
-    _value = None
-
     def setValue(self, value):
         if self.parent:
             self.parent.setKeyframeValue(self, value)
@@ -317,8 +320,24 @@ class TrackObject(Signallable, Loggable):
         'selected-changed': ['state'],
         'stagger-changed': ['stagger'],
         'active-changed': ['active'],
+        'interpolators-changed': [],
     }
 
+    # signals notifying a property change, coalesced within a timeline
+    # transaction
+    property_signals = frozenset(['start-changed', 'duration-changed',
+            'in-point-changed', 'out-point-changed', 'media-duration-changed',
+            'priority-changed', 'selected-changed', 'stagger-changed',
+            'active-changed'])
+
+    # Attributes are stored in slots to keep the objects small on large
+    # timelines. Other attributes can still be set, they go in the instance
+    # dictionary which is only allocated when needed.
+    __slots__ = ('factory', 'stream', 'stream_type', 'track',
+            'timeline_object', 'interpolators', '_rebuild_interpolators',
+            '_public_priority', '_position', '_stagger', 'gnl_object',
+            'keyframes', '__selected', 'logCategory', '_signal_group')
+
     def __init__(self, factory, stream, start=0,
             duration=0, in_point=0,
             media_duration=0, priority=0):
@@ -334,6 +353,9 @@ class TrackObject(Signallable, Loggable):
         self._public_priority = priority
         self._position = 0
         self._stagger = 0
+        # True when the track object is part of the timeline's current
+        # selection
+        self.__selected = False
         self.gnl_object = obj = self._makeGnlObject()
         self.keyframes = []
 
@@ -359,6 +381,16 @@ class TrackObject(Signallable, Loggable):
         self._connectToSignals(obj)
         self._updatePriority(self._public_priority)
 
+    def emit(self, signame, *args, **kwargs):
+        if signame in self.property_signals and not kwargs and \
+                self.timeline_object is not None and \
+                self.timeline_object.timeline is not None and \
+                self.timeline_object.timeline.queueNotification(self,
+                        signame, args):
+            return None
+
+        return Signallable.emit(self, signame, *args, **kwargs)
+
     def getInterpolator(self, property_name):
         self._maybeBuildInterpolators()
 
@@ -416,6 +448,8 @@ class TrackObject(Signallable, Loggable):
             self.interpolators[gst_object_property.name] = \
                     (gst_object_property, interpolator)
 
+        self.emit('interpolators-changed')
+
     def release(self):
         self._disconnectFromSignals()
         self.releaseBin()
@@ -639,9 +673,6 @@ class TrackObject(Signallable, Loggable):
         self.setObjectMediaDuration(position - self.gnl_object.props.start)
         return other
 
-    # True when the track object is part of the timeline's current selection
-    __selected = False
-
     def _getSelected(self):
         return self.__selected
 
@@ -977,6 +1008,101 @@ class AudioTransition(Transition):
         self.b_controller.set("volume", self.duration, 1.0)
 
 
+class _LayerSegment(object):
+    """
+    A run of overlapping track objects in a L{_TrackLayer}.
+
+    Segments start at an object that doesn't overlap any object before it, so
+    the transitions of a segment don't depend on the rest of the layer except
+    for the stagger position the segment starts at.
+    """
+
+    __slots__ = ('first', 'key', 'pos', 'slots', 'valid')
+
+    def __init__(self, first, key, pos, slots, valid):
+        self.first = first
+        self.key = key
+        self.pos = pos
+        self.slots = slots
+        self.valid = valid
+
+
+class _TrackLayer(object):
+    """
+    The non-effect track objects of a L{Track} with the same priority, sorted
+    like L{Track.track_objects}, and the transition slots computed the last
+    time the layer was updated.
+    """
+
+    def __init__(self):
+        self.objs = []
+        self.keys = []
+        self.segments = []
+        self.invalid = 0
+        self.dirty_from = None
+        self.dirty_to = None
+
+    def insert(self, obj, key):
+        index = bisect_left(self.keys, key)
+        self.keys.insert(index, key)
+        self.objs.insert(index, obj)
+        self.markDirty(key[0])
+
+    def remove(self, obj, key):
+        index = bisect_left(self.keys, key)
+        del self.keys[index]
+        del self.objs[index]
+        self.markDirty(key[0])
+
+    def extend(self, items):
+        """
+        Insert many (key, obj) pairs, sorting the layer once.
+        """
+        keys = [key for key, obj in items]
+        self.markDirty(min(keys)[0])
+        self.markDirty(max(keys)[0])
+
+        items = zip(self.keys, self.objs) + list(items)
+        items.sort(key=itemgetter(0))
+        self.keys = [key for key, obj in items]
+        self.objs = [obj for key, obj in items]
+
+    def removeKeys(self, keys):
+        """
+        Remove the objects with the given keys, rebuilding the layer once.
+        """
+        self.markDirty(min(keys)[0])
+        self.markDirty(max(keys)[0])
+
+        items = [(key, obj) for key, obj in zip(self.keys, self.objs)
+                if key not in keys]
+        self.keys = [key for key, obj in items]
+        self.objs = [obj for key, obj in items]
+
+    def markDirty(self, time):
+        if self.dirty_from is None:
+            self.dirty_from = self.dirty_to = time
+        else:
+            self.dirty_from = min(self.dirty_from, time)
+            self.dirty_to = max(self.dirty_to, time)
+
+    def findRestartSegment(self):
+        """
+        Return the index of the last segment that starts before every change
+        since the last update, or -1 if there's no such segment.
+        """
+        segments = self.segments
+        low = 0
+        high = len(segments)
+        while low < high:
+            mid = (low + high) // 2
+            if segments[mid].key[0] < self.dirty_from:
+                low = mid + 1
+            else:
+                high = mid
+        return low - 1
+
+
 class Track(Signallable, Loggable):
     logCategory = "track"
 
@@ -1003,6 +1129,14 @@ class Track(Signallable, Loggable):
         self.transitions = {}
         self._update_transitions = True
         self._max_priority = 0
+        # priority -> number of track objects with that priority
+        self._priorities = {}
+        self._track_object_priorities = {}
+        # priority -> _TrackLayer, for the non-effect track objects
+        self._layers = {}
+        self._layer_keys = {}
+        self._dirty_layers = set()
+        self._sequence = 0
 
         self.mixer = self._getMixerForStream(stream)
         if self.mixer:
@@ -1142,10 +1276,41 @@ class Track(Signallable, Loggable):
     max_priority = property(_getMaxPriority)
 
     def _trackObjectPriorityCb(self, trackobject, priority):
-        op = self._max_priority
-        self._max_priority = max((obj.priority for obj in self.track_objects))
-        if op != self._max_priority:
-            self.emit("max-priority-changed", self._max_priority)
+        self._removePriority(self._track_object_priorities[trackobject])
+        self._addPriority(trackobject, priority)
+        self._updateMaxPriority()
+
+    def _addPriority(self, track_object, priority):
+        self._track_object_priorities[track_object] = priority
+        self._priorities[priority] = self._priorities.get(priority, 0) + 1
+
+    def _removePriority(self, priority):
+        count = self._priorities[priority] - 1
+        if count:
+            self._priorities[priority] = count
+        else:
+            del self._priorities[priority]
+
+    def _nextLayerKey(self, track_object):
+        # track objects with the same start are kept in the order they were
+        # (re)inserted in self.track_objects, like start_insort_right does
+        self._sequence += 1
+        return (track_object.start, self._sequence)
+
+    def _addToLayer(self, track_object, priority, key):
+        try:
+            layer = self._layers[priority]
+        except KeyError:
+            layer = self._layers[priority] = _TrackLayer()
+        layer.insert(track_object, key)
+        self._layer_keys[track_object] = (priority, key)
+        self._dirty_layers.add(priority)
+
+    def _removeFromLayer(self, track_object):
+        priority, key = self._layer_keys.pop(track_object)
+        self._layers[priority].remove(track_object, key)
+        self._dirty_layers.add(priority)
+        return priority, key
 
     def _connectToTrackObjectSignals(self, track_object):
         track_object.connect("priority-changed", self._trackObjectPriorityCb)
@@ -1164,6 +1329,9 @@ class Track(Signallable, Loggable):
         track_object.track = self
 
         start_insort_right(self.track_objects, track_object)
+        if not isinstance(track_object, TrackEffect):
+            self._addToLayer(track_object, int(track_object.priority),
+                    self._nextLayerKey(track_object))
         self.updateDefaultSources()
 
         try:
@@ -1173,6 +1341,7 @@ class Track(Signallable, Loggable):
 
         self._connectToTrackObjectSignals(track_object)
 
+        self._addPriority(track_object, track_object.priority)
         self._updateMaxPriority()
         self._connectToTrackObject(track_object)
 
@@ -1194,10 +1363,13 @@ class Track(Signallable, Loggable):
         track_object.releaseBin()
 
         self.track_objects.remove(track_object)
+        if track_object in self._layer_keys:
+            self._removeFromLayer(track_object)
         track_object.track = None
 
         self._disconnectTrackObjectSignals(track_object)
 
+        self._removePriority(self._track_object_priorities.pop(track_object))
         self._updateMaxPriority()
         self.updateDefaultSources()
 
@@ -1205,17 +1377,138 @@ class Track(Signallable, Loggable):
         if self._update_transitions:
             self.updateTransitions()
 
+    def addTrackObjects(self, track_objects):
+        """
+        Add many track objects at once.
+
+        Unlike calling L{addTrackObject} for each object, the objects are
+        validated and sorted once, added to the composition in one go and the
+        default sources, priorities and transitions are only updated at the
+        end.
+
+        @param track_objects: The objects to add.
+        @type track_objects: C{list} of L{TrackObject}
+        @raises TrackError: If one of the objects already belongs to a track.
+        """
+        track_objects = list(track_objects)
+        if not track_objects:
+            return
+
+        gnl_objects = set(self.composition)
+        seen = set()
+        for track_object in track_objects:
+            if track_object.track is not None or track_object in seen:
+                raise TrackError()
+
+            if track_object.gnl_object in gnl_objects:
+                raise TrackError()
+            seen.add(track_object)
+
+        layers = {}
+        for track_object in track_objects:
+            track_object.makeBin()
+            track_object.track = self
+
+            if not isinstance(track_object, TrackEffect):
+                priority = int(track_object.priority)
+                key = self._nextLayerKey(track_object)
+                self._layer_keys[track_object] = (priority, key)
+                layers.setdefault(priority, []).append((key, track_object))
+
+        self.track_objects.extend(track_objects)
+        self.track_objects.sort(key=attrgetter('start'))
+        for priority, items in layers.iteritems():
+            try:
+                layer = self._layers[priority]
+            except KeyError:
+                layer = self._layers[priority] = _TrackLayer()
+            layer.extend(items)
+            self._dirty_layers.add(priority)
+
+        try:
+            self.composition.add(*[track_object.gnl_object
+                    for track_object in track_objects])
+        except gst.AddError:
+            raise TrackError()
+
+        for track_object in track_objects:
+            self._connectToTrackObjectSignals(track_object)
+            self._addPriority(track_object, track_object.priority)
+            self._connectToTrackObject(track_object)
+        self._updateMaxPriority()
+        self.updateDefaultSources()
+
+        for track_object in track_objects:
+            self.emit('track-object-added', track_object)
+        if self._update_transitions:
+            self.updateTransitions()
+
+    def removeTrackObjects(self, track_objects):
+        """
+        Remove many track objects at once.
+
+        The objects are removed from the composition in one go and the
+        default sources, priorities and transitions are only updated at the
+        end.
+
+        @param track_objects: The objects to remove.
+        @type track_objects: C{list} of L{TrackObject}
+        @raises TrackError: If one of the objects doesn't belong to the track.
+        """
+        track_objects = list(track_objects)
+        if not track_objects:
+            return
+
+        removed = set(track_objects)
+        for track_object in track_objects:
+            if track_object.track is not self:
+                raise TrackError()
+        if len(removed) != len(track_objects):
+            raise TrackError()
+
+        try:
+            self.composition.remove(*[track_object.gnl_object
+                    for track_object in track_objects])
+        except gst.RemoveError:
+            raise TrackError()
+
+        layers = {}
+        for track_object in track_objects:
+            track_object.gnl_object.set_state(gst.STATE_NULL)
+            self._disconnectFromTrackObject(track_object)
+            track_object.releaseBin()
+            if track_object in self._layer_keys:
+                priority, key = self._layer_keys.pop(track_object)
+                layers.setdefault(priority, set()).add(key)
+            track_object.track = None
+
+            self._disconnectTrackObjectSignals(track_object)
+            self._removePriority(
+                    self._track_object_priorities.pop(track_object))
+
+        for priority, keys in layers.iteritems():
+            self._layers[priority].removeKeys(keys)
+            self._dirty_layers.add(priority)
+
+        self.track_objects[:] = [track_object
+                for track_object in self.track_objects
+                if track_object not in removed]
+        self._updateMaxPriority()
+        self.updateDefaultSources()
+
+        for track_object in track_objects:
+            self.emit('track-object-removed', track_object)
+        if self._update_transitions:
+            self.updateTransitions()
+
     def removeAllTrackObjects(self):
-        for track_object in list(self.track_objects):
-            self.removeTrackObject(track_object)
+        self.removeTrackObjects(self.track_objects)
 
     def _updateMaxPriority(self):
-        priorities = [track_object.priority for track_object in
-            self.track_objects]
-        if not priorities:
+        if not self._priorities:
             max_priority = 0
         else:
-            max_priority = max(priorities)
+            max_priority = max(self._priorities)
         if max_priority != self._max_priority:
             self._max_priority = max_priority
             self.emit('max-priority-changed', self._max_priority)
@@ -1229,14 +1522,27 @@ class Track(Signallable, Loggable):
         self.emit('duration-changed', duration)
 
     def _trackObjectPriorityChangedCb(self, track_object, priority):
-        self._updateMaxPriority()
+        if track_object not in self._layer_keys:
+            return
+
+        priority = int(priority)
+        if self._layer_keys[track_object][0] != priority:
+            old_priority, key = self._removeFromLayer(track_object)
+            self._addToLayer(track_object, priority, key)
 
     def _trackObjectStartChangedCb(self, track_object, start):
-        self.track_objects.remove(track_object)
-        start_insort_right(self.track_objects, track_object)
+        start_reinsort_right(self.track_objects, track_object)
+
+        if track_object in self._layer_keys:
+            priority, key = self._removeFromLayer(track_object)
+            self._addToLayer(track_object, priority,
+                    self._nextLayerKey(track_object))
 
     def _trackObjectDurationChangedCb(self, track_object, duration):
-        pass
+        if track_object in self._layer_keys:
+            priority, key = self._layer_keys[track_object]
+            self._layers[priority].markDirty(key[0])
+            self._dirty_layers.add(priority)
 
     def _connectToTrackObject(self, track_object):
         track_object.connect('priority-changed',
@@ -1280,10 +1586,12 @@ class Track(Signallable, Loggable):
         self.emit("transition-removed", transition)
 
     def getTrackObjectsGroupedByLayer(self):
-        layers = [[] for x in xrange(0, self.max_priority + 1)]
-        for track_object in self.track_objects:
-            if not isinstance(track_object, TrackEffect):
-                layers[int(track_object.priority)].append(track_object)
+        layers = []
+        for priority in xrange(0, self.max_priority + 1):
+            try:
+                layers.append(list(self._layers[priority].objs))
+            except KeyError:
+                layers.append([])
         return layers
 
     def getValidTransitionSlots(self, objs):
@@ -1323,17 +1631,92 @@ class Track(Signallable, Loggable):
 
         return slots, valid
 
-    valid_arrangement = True
+    def _getSegmentSlots(self, objs, index):
+        # Same as getValidTransitionSlots() for the objects starting at
+        # objs[index] and overlapping it, directly or through other objects.
+        # Returns the slots, whether the arrangement is valid and the index of
+        # the first object of the next segment.
+        obj = objs[index]
+        safe = obj.start
+        duration = safe + obj.duration
+        prev = obj
+        slots = []
+        valid = True
 
-    def updateTransitions(self):
-        # create all new transitions
-        valid_slots = set()
-        all_valid = True
-        for layer in self.getTrackObjectsGroupedByLayer():
+        index += 1
+        length = len(objs)
+        while index < length:
+            obj = objs[index]
+            start = obj.start
+            end = start + obj.duration
+            if start >= duration:
+                break
+            elif end >= duration and start >= safe:
+                slots.append((prev, obj))
+                safe = duration
+                duration = end
+                prev = obj
+            elif end >= duration and start < safe:
+                if slots:
+                    slots.pop(-1)
+                valid = False
+                safe = duration
+                duration = end
+                prev = obj
+            elif end < duration and start >= safe:
+                safe = end
+                valid = False
+            elif end < duration and start < safe:
+                if slots:
+                    slots.pop(-1)
+                valid = False
+                safe = end
+            index += 1
+
+        return slots, valid, index
+
+    def _updateLayer(self, layer, old_slots, new_slots):
+        objs = layer.objs
+        keys = layer.keys
+        old_segments = layer.segments
+        if layer.dirty_from is None:
+            return
+
+        restart = layer.findRestartSegment()
+        if restart == -1:
+            restart = 0
             pos = 0
+            index = 0
+        else:
+            # the first object of the segment didn't change, so it's still
+            # where it was
+            pos = old_segments[restart].pos
+            index = bisect_left(keys, old_segments[restart].key)
+
+        segments = []
+        old_index = restart
+        end = len(old_segments)
+        while index < len(objs):
+            first = objs[index]
+            if segments and first.start > layer.dirty_to:
+                # nothing changed from here on, if the old run had a segment
+                # starting at the same object and stagger position, we can
+                # keep all the old segments from there
+                while old_index < len(old_segments) and \
+                        old_segments[old_index].key < keys[index]:
+                    old_index += 1
+                if old_index < len(old_segments) and \
+                        old_segments[old_index].first is first and \
+                        old_segments[old_index].pos == pos:
+                    end = old_index
+                    break
+
+            key = keys[index]
+            slots, valid, index = self._getSegmentSlots(objs, index)
+            segment = _LayerSegment(first, key, pos, slots, valid)
+            segments.append(segment)
+
             prev = None
-            slots, is_valid = self.getValidTransitionSlots(layer)
-            all_valid &= is_valid
             for slot in slots:
                 a, b = slot
                 if a == prev:
@@ -1344,11 +1727,45 @@ class Track(Signallable, Loggable):
                     b.updatePosition(pos + 1)
                     pos += 2
                 prev = b
-                valid_slots.add(slot)
+                new_slots.add(slot)
                 if not slot in self.transitions:
                     tr = self.TransitionClass(a, b)
                     self.addTransition(tr)
-        current_slots = set(self.transitions.iterkeys())
-        for slot in current_slots - valid_slots:
-            self.removeTransition(self.transitions[slot])
-        self.valid_arrangement = all_valid
+
+            if not valid:
+                layer.invalid += 1
+
+        for segment in old_segments[restart:end]:
+            old_slots.update(segment.slots)
+            if not segment.valid:
+                layer.invalid -= 1
+
+        layer.segments = old_segments[:restart] + segments + \
+                old_segments[end:]
+        layer.dirty_from = layer.dirty_to = None
+
+    valid_arrangement = True
+
+    def updateTransitions(self):
+        """
+        Update the transitions of the layers that changed since the last
+        update.
+        """
+        old_slots = set()
+        new_slots = set()
+        for priority in sorted(self._dirty_layers):
+            layer = self._layers.get(priority)
+            if layer is None:
+                continue
+
+            self._updateLayer(layer, old_slots, new_slots)
+            if not layer.objs:
+                del self._layers[priority]
+        self._dirty_layers.clear()
+
+        for slot in old_slots - new_slots:
+            if slot in self.transitions:
+                self.removeTransition(self.transitions[slot])
+
+        self.valid_arrangement = not [layer for layer in
+                self._layers.itervalues() if layer.invalid]
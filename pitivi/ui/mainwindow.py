@@ -65,6 +65,7 @@ from pitivi.ui.common import factory_name
 from pitivi.utils import beautify_length
 from pitivi.ui.zoominterface import Zoomable
 from pitivi.ui.filechooserpreview import PreviewWidget
+from pitivi.ui.previewer import release_previewers
 
 if HAVE_GCONF:
     D_G_INTERFACE = "/desktop/gnome/interface"
@@ -839,6 +840,8 @@ class PitiviMainWindow(gtk.Window, Loggable):
         self.viewer.setAction(None)
         self.viewer.setPipeline(None)
         project.seeker.disconnect_by_func(self._timelineSeekCb)
+        # stop the pipelines of the thumbnails and waveforms of the project
+        release_previewers()
         return False
 
     def _projectManagerRevertingToSavedCb(self, projectManager, project):
@@ -26,13 +26,15 @@ Utility tools and classes for easy generation of previews
 import gobject
 import gst
 import cairo
+import array
 import os
+from itertools import izip
 from gettext import gettext as _
 import pitivi.utils as utils
 from pitivi.configure import get_pixmap_dir
 from pitivi.elements.singledecodebin import SingleDecodeBin
 from pitivi.elements.thumbnailsink import CairoSurfaceThumbnailSink
-from pitivi.elements.arraysink import ArraySink
+from pitivi.elements.arraysink import PeakSink, WaveformSink
 from pitivi.signalinterface import Signallable
 import pitivi.stream as stream
 from pitivi.settings import GlobalSettings
@@ -40,6 +42,11 @@ from pitivi.ui.zoominterface import Zoomable
 from pitivi.log.loggable import Loggable
 from pitivi.factories.file import PictureFileSourceFactory
 from pitivi.thumbnailcache import ThumbnailCache
+from pitivi.thumbnailscheduler import ThumbnailScheduler
+from pitivi.thumbnailpool import ThumbnailWorkerPool
+from pitivi.thumbnailstore import ThumbnailStore
+from pitivi.peaks import PeakStore
+from pitivi.settings import xdg_cache_home
 from pitivi.ui.prefs import PreferencesDialog
 from pitivi.receiver import receiver, handler
 
@@ -56,22 +63,58 @@ PreferencesDialog.addNumericPreference("thumbnailSpacingHint",
     lower=0,
     description=_("The gap between thumbnails"))
 
-# this default works out to a maximum of ~ 1.78 MiB per factory, assuming:
+# the thumbnails of all the factories share a single cache, bounded by the
+# size of the surfaces. This default works out to about 4800 video thumbnails,
+# assuming:
 # 4:3 aspect ratio
 # 4 bytes per pixel
 # 50 pixel height
-GlobalSettings.addConfigOption("thumbnailCacheSize",
+GlobalSettings.addConfigOption("thumbnailCacheBytes",
     section="thumbnailing",
-    key="cache-size",
-    default=250)
+    key="cache-bytes",
+    default=64 * 1024 * 1024)
 
-# the maximum number of thumbnails to enqueue at a given time. setting this to
-# a larger value will increase latency after large operations, such as zooming
+# the thumbnails are also kept on disk between sessions, in packs bounded by
+# their total size. 0 disables the disk cache.
+GlobalSettings.addConfigOption("thumbnailDiskCacheBytes",
+    section="thumbnailing",
+    key="disk-cache-bytes",
+    default=256 * 1024 * 1024)
+
+# the maximum number of pending thumbnails of a previewer, the requests the
+# furthest from the visible part of the timeline are dropped first. setting
+# this to a larger value will increase latency after large operations, such as
+# zooming
 GlobalSettings.addConfigOption("thumbnailMaxRequests",
     section="thumbnailing",
     key="max-requests",
     default=10)
 
+# the video thumbnails are generated by a pool of pipelines shared by all the
+# previewers. 0 workers means one per processor. the memory used by the
+# pipelines is estimated from the size of the decoded frames.
+GlobalSettings.addConfigOption("thumbnailWorkers",
+    section="thumbnailing",
+    key="workers",
+    default=0)
+
+GlobalSettings.addConfigOption("thumbnailWorkersPerFile",
+    section="thumbnailing",
+    key="workers-per-file",
+    default=2)
+
+GlobalSettings.addConfigOption("thumbnailWorkersBytes",
+    section="thumbnailing",
+    key="workers-bytes",
+    default=512 * 1024 * 1024)
+
+# the pipelines unused for this number of seconds are destroyed, they are
+# created again when needed. 0 keeps them until the project is closed.
+GlobalSettings.addConfigOption("thumbnailWorkersIdleTimeout",
+    section="thumbnailing",
+    key="workers-idle-timeout",
+    default=30)
+
 GlobalSettings.addConfigOption('showThumbnails',
     section='user-interface',
     key='show-thumbnails',
@@ -106,6 +149,103 @@ PreferencesDialog.addTogglePreference('showWaveforms',
 
 previewers = {}
 
+# the quality of the thumbnails in the cache: the frame of the keyframe
+# preceding the segment, or the frame of the segment
+QUALITY_KEYFRAME = 0
+QUALITY_EXACT = 1
+
+thumbnail_cache = None
+
+
+def get_thumbnail_cache(settings):
+    """
+    Return the thumbnail cache shared by all the previewers.
+
+    @rtype: L{ThumbnailCache}
+    """
+    global thumbnail_cache
+    if thumbnail_cache is None:
+        thumbnail_cache = ThumbnailCache(
+                max_bytes=settings.thumbnailCacheBytes)
+    return thumbnail_cache
+
+
+thumbnail_scheduler = None
+
+
+def get_thumbnail_scheduler():
+    """
+    Return the scheduler of the thumbnail requests of all the previewers.
+
+    @rtype: L{ThumbnailScheduler}
+    """
+    global thumbnail_scheduler
+    if thumbnail_scheduler is None:
+        thumbnail_scheduler = ThumbnailScheduler()
+    return thumbnail_scheduler
+
+
+thumbnail_pool = None
+
+
+def get_thumbnail_pool(settings):
+    """
+    Return the pool of the pipelines of the previewers.
+
+    @rtype: L{ThumbnailWorkerPool}
+    """
+    global thumbnail_pool
+    if thumbnail_pool is None:
+        thumbnail_pool = ThumbnailWorkerPool(get_thumbnail_scheduler(),
+                max_workers=settings.thumbnailWorkers or None,
+                max_workers_per_owner=settings.thumbnailWorkersPerFile,
+                max_bytes=settings.thumbnailWorkersBytes)
+        timeout = settings.thumbnailWorkersIdleTimeout
+        if timeout:
+            gobject.timeout_add_seconds(max(1, timeout / 2),
+                    _collect_idle_workers, timeout)
+    return thumbnail_pool
+
+
+def _collect_idle_workers(timeout):
+    thumbnail_pool.collect(timeout)
+    return True
+
+
+thumbnail_store = None
+
+
+def get_thumbnail_store(settings):
+    """
+    Return the on-disk thumbnail store shared by all the previewers, or
+    C{None} if it's disabled.
+
+    @rtype: L{ThumbnailStore}
+    """
+    global thumbnail_store
+    if thumbnail_store is None and settings.thumbnailDiskCacheBytes:
+        directory = os.path.join(xdg_cache_home(), "pitivi", "thumbnails")
+        thumbnail_store = ThumbnailStore(directory,
+                max_bytes=settings.thumbnailDiskCacheBytes)
+    return thumbnail_store
+
+
+peak_store = None
+
+
+def get_peak_store():
+    """
+    Return the store of the waveform peaks of the audio files, next to the
+    thumbnail store.
+
+    @rtype: L{PeakStore}
+    """
+    global peak_store
+    if peak_store is None:
+        peak_store = PeakStore(os.path.join(xdg_cache_home(), "pitivi",
+                "peaks"))
+    return peak_store
+
 
 def get_preview_for_object(instance, trackobject):
     factory = trackobject.factory
@@ -129,6 +269,16 @@ def get_preview_for_object(instance, trackobject):
     return previewers[key]
 
 
+def release_previewers():
+    """
+    Release the pipelines and the pending requests of all the previewers,
+    when the project is closed. The cached thumbnails are kept.
+    """
+    for previewer in previewers.itervalues():
+        previewer.release()
+    previewers.clear()
+
+
 class Previewer(Signallable, Loggable):
 
     __signals__ = {
@@ -156,6 +306,10 @@ class Previewer(Signallable, Loggable):
         not intersect the visible portion of the object"""
         raise NotImplementedError
 
+    def release(self):
+        """Release the pipelines of the previewer, it's not used anymore."""
+        pass
+
     def _connectSettings(self, settings):
         self._settings = settings
 
@@ -181,29 +335,55 @@ class RandomAccessPreviewer(Previewer):
     def __init__(self, instance, factory, stream_):
         self._view = True
         Previewer.__init__(self, instance, factory, stream_)
-        self._queue = []
+        self._scheduler = get_thumbnail_scheduler()
+        # the position in the timeline of the start of the file of the
+        # element being rendered
+        self._offset = 0
+        self._factory = factory
+        self._stream = stream_
+
+        # assume 50 pixel height
+        self.theight = 50
 
+        # the thumbnails are accounted to the factory in the shared cache
+        self._cache = get_thumbnail_cache(instance.settings).getView(factory,
+                stream_)
+        # the segments whose thumbnail is being loaded by _loadThumbnail()
+        self._loading = set()
+
+        # the pipelines are created by the pool when there are thumbnails to
+        # generate, see makeWorker()
+        self._pool = get_thumbnail_pool(instance.settings)
+        self._pool.addOwner(self)
+        self._pipelineInit(factory, stream_)
+
+    def _makeBin(self):
+        """Return a new bin decoding the stream."""
         # FIXME:
         # why doesn't this work?
         # bin = factory.makeBin(stream_)
-        uri = factory.uri
-        caps = stream_.caps
-        bin = SingleDecodeBin(uri=uri, caps=caps, stream=stream_)
+        return SingleDecodeBin(uri=self._factory.uri, caps=self._stream.caps,
+                stream=self._stream)
 
-        # assume 50 pixel height
-        self.theight = 50
-        self.waiting_timestamp = None
-
-        self._pipelineInit(factory, bin)
+    def _pipelineInit(self, factory, stream_):
+        """Prepare the creation of the pipelines of the preview process.
+        Subclasses should override this method and set C{worker_bytes}, the
+        estimated memory used by a pipeline."""
+        raise NotImplementedError
 
-    def _pipelineInit(self, factory, bin):
-        """Create the pipeline for the preview process. Subclasses should
-        override this method and create a pipeline, connecting to callbacks to
-        the appropriate signals, and prerolling the pipeline if necessary."""
+    def makeWorker(self):
+        """Return a new pipeline decoding the bin returned by L{_makeBin},
+        called by the pool. Subclasses should override this method, see
+        L{ThumbnailWorkerPool} for the interface of the workers. The workers
+        call L{_workerDone} when they finished a segment."""
         raise NotImplementedError
 
 ## public interface
 
+    def release(self):
+        self._scheduler.cancel(self)
+        self._pool.removeOwner(self)
+
     def render_cairo(self, cr, bounds, element, hscroll_pos, y1):
         if not self._view:
             return
@@ -226,8 +406,8 @@ class RandomAccessPreviewer(Previewer):
         # tdur = duration in ns of thumbnail
         # sof  = start of file in pixel coordinates
         x1 = bounds.x1
-        sof = Zoomable.nsToPixel(element.start - element.in_point) +\
-            hscroll_pos
+        self._offset = element.start - element.in_point
+        sof = Zoomable.nsToPixel(self._offset) + hscroll_pos
 
         # i = left edge of thumbnail to be drawn. We start with x1 and
         # subtract the distance to the nearest leftward rectangle.
@@ -271,67 +451,100 @@ class RandomAccessPreviewer(Previewer):
 
     def _thumbForTime(self, cr, time, x, y):
         segment = self._segment_for_time(time)
-        if segment in self._cache:
-            surface = self._cache[segment]
-        else:
-            self._requestThumbnail(segment)
+        surface = self._cache.get(segment)
+        if surface is None:
+            if segment not in self._loading:
+                if self._loadThumbnail(segment):
+                    self._loading.add(segment)
+                else:
+                    self._requestThumbnail(segment, time)
             surface = self.default_thumb
+        elif self._needsRefinement(segment):
+            self._requestThumbnail(segment, time, background=True)
         cr.set_source_surface(surface, x, y)
 
-    def _finishThumbnail(self, surface, segment):
-        """Notifies the preview object that the a new thumbnail is ready to be
-        cached. This should be called by subclasses when they have finished
-        processing the thumbnail for the current segment. This function should
-        always be called from the main thread of the application."""
-        waiting = self.waiting_timestamp
-        self.waiting_timestamp = None
+    def _needsRefinement(self, segment):
+        """Return whether the cached thumbnail of the segment should be
+        generated again at a better quality. Subclasses producing
+        approximate thumbnails first should override this method."""
+        return False
 
-        if segment != waiting:
-            segment = waiting
+    def _loadThumbnail(self, segment):
+        """Start loading the thumbnail of the segment without running the
+        pipeline, return C{False} if it can't be loaded. Subclasses can
+        override this method to read thumbnails stored by L{_saveThumbnail}
+        in the background, and call L{_thumbnailLoaded} when done."""
+        return False
 
-        self._cache[segment] = surface
+    def _thumbnailLoaded(self, segment, surface):
+        """Called from the main thread when the thumbnail started by
+        L{_loadThumbnail} is loaded, C{surface} is C{None} if it wasn't
+        found. The segment is then requested from the pipeline on the next
+        redraw."""
+        self._loading.discard(segment)
+        if surface is not None:
+            self._cache.put(segment, surface, QUALITY_EXACT)
         self.emit("update", segment)
 
-        if segment in self._queue:
-            self._queue.remove(segment)
-        self._nextThumbnail()
+    def _saveThumbnail(self, surface, segment):
+        """Called with each thumbnail produced by the pipeline, subclasses can
+        override this method to store it."""
+        pass
+
+    def _workerDone(self, worker, surface, segment, quality=None):
+        """Notifies the preview object that a worker finished processing a
+        segment, C{surface} is C{None} if it failed. This function should
+        always be called from the main thread of the application."""
+        if surface is not None:
+            self._addThumbnail(surface, segment, quality)
+        self._pool.release(worker)
+
+    def _addThumbnail(self, surface, segment, quality=None):
+        """Cache a new thumbnail and notify the UI. The thumbnail is dropped
+        if a better one is already cached."""
+        self._scheduler.cancel(self, segment)
+        if not self._cache.put(segment, surface, quality):
+            return
+
+        # approximate thumbnails are refined later, only the final ones are
+        # worth storing
+        if quality != QUALITY_KEYFRAME:
+            self._saveThumbnail(surface, segment)
+        self.emit("update", segment)
+
+    def _isProcessing(self, segment):
+        """Return whether the thumbnail of the segment is being
+        generated."""
+        for worker in self._pool.workers.get(self, ()):
+            if segment in worker.segments:
+                return True
         return False
 
     def _nextThumbnail(self):
-        """Notifies the preview object that the pipeline is ready to process
-        the next thumbnail in the queue. This should always be called from the
-        main application thread."""
-        if self._queue:
-            if not self._startThumbnail(self._queue[0]):
-                self._queue.pop(0)
-                self._nextThumbnail()
+        """Start processing the most urgent pending thumbnails on the
+        available pipelines. This should always be called from the main
+        application thread."""
+        self._pool.dispatch()
         return False
 
-    def _requestThumbnail(self, segment):
-        """Queue a thumbnail request for the given segment"""
+    def _requestThumbnail(self, segment, time, background=False):
+        """Queue a thumbnail request for the given segment, drawn at the
+        given time of the file of the element being rendered. The requests
+        are processed by order of distance to the visible part of the
+        timeline, background requests after all the others, see
+        L{ThumbnailScheduler}."""
+        if self._isProcessing(segment):
+            return
 
-        if (segment not in self._queue) and (len(self._queue) <=
-            self.max_requests):
-            if self._queue:
-                self._queue.append(segment)
-            else:
-                self._queue.append(segment)
-                self._nextThumbnail()
-
-    def _startThumbnail(self, segment):
-        """Start processing segment. Subclasses should override
-        this method to perform whatever action on the pipeline is necessary.
-        Typically this will be a flushing seek(). When the
-        current segment has finished processing, subclasses should call
-        _nextThumbnail() with the resulting cairo surface. Since seeking and
-        playback are asyncrhonous, you may have to call _nextThumbnail() in a
-        message handler or other callback."""
-        self.waiting_timestamp = segment
+        start = self._offset + time
+        self._scheduler.request(self, segment, start,
+                start + Zoomable.pixelToNs(self.twidth), self.max_requests,
+                background)
+        self._nextThumbnail()
 
     def _connectSettings(self, settings):
         Previewer._connectSettings(self, settings)
         self.spacing = settings.thumbnailSpacingHint
-        self._cache = ThumbnailCache(size=settings.thumbnailCacheSize)
         self.max_requests = settings.thumbnailMaxRequests
         settings.connect("thumbnailSpacingHintChanged",
             self._thumbnailSpacingHintChanged)
@@ -357,19 +570,177 @@ class RandomAccessVideoPreviewer(RandomAccessPreviewer):
         rate = stream_.framerate
         RandomAccessPreviewer.__init__(self, instance, factory, stream_)
         self.tstep = Zoomable.pixelToNsAt(self.twidth, Zoomable.max_zoom)
+        self.frame_duration = 0
         if rate.num:
-            frame_duration = (gst.SECOND * rate.denom) / rate.num
-            self.tstep = max(frame_duration, self.tstep)
+            self.frame_duration = (gst.SECOND * rate.denom) / rate.num
+            self.tstep = max(self.frame_duration, self.tstep)
+        self._pack = self._getThumbnailPack(instance, factory)
+        # the segments which were looked up in the pack without success
+        self._unstored = set()
+
+    def _pipelineInit(self, factory, stream_):
+        width = stream_.width or 1920
+        height = stream_.height or 1080
+        self.worker_bytes = width * height * 3 / 2 * WORKER_BUFFERED_FRAMES
+
+    def makeWorker(self):
+        """Return a new thumbnailing pipeline, called by the pool.
+
+        @rtype: L{VideoThumbnailWorker}"""
+        return VideoThumbnailWorker(self)
+
+    def _getSeekQuality(self, segment):
+        """Return the quality of the thumbnail to generate for the segment:
+        a keyframe first, the exact frame when refining it."""
+        if self._cache.getQuality(segment) == QUALITY_KEYFRAME:
+            return QUALITY_EXACT
+        return QUALITY_KEYFRAME
+
+    def _needsRefinement(self, segment):
+        # the keyframe can be far from the segment, it only matters when the
+        # thumbnails are closer to each other than keyframes usually are
+        return self._cache.getQuality(segment) == QUALITY_KEYFRAME and \
+                self.tdur < KEYFRAME_INTERVAL
+
+    def _takeScanSegments(self, segment):
+        """Return the segments to generate along with the given one, when
+        enough pending segments closely follow it to decode them all in a
+        single pass instead of seeking to each of them.
+
+        @return: The sorted segments, only C{segment} if it's better to seek.
+        @rtype: C{list}"""
+        following = [other for other in self._scheduler.getPending(self)
+                if other > segment]
+        following.sort()
+
+        segments = [segment]
+        for other in following[:SCAN_MAX_SEGMENTS - 1]:
+            if other - segments[-1] > SCAN_MAX_GAP:
+                break
+            segments.append(other)
+
+        if len(segments) < SCAN_MIN_SEGMENTS:
+            return [segment]
+
+        for other in segments[1:]:
+            self._scheduler.cancel(self, other)
+        return segments
 
-    def _pipelineInit(self, factory, sbin):
+    def _segment_for_time(self, time):
+        # quantize thumbnail timestamps to maximum granularity
+        return time - (time % self.tstep)
+
+    def _getThumbnailPack(self, instance, factory):
+        store = get_thumbnail_store(instance.settings)
+        uri = factory.uri
+        if store is None or not gst.uri_is_valid(uri) or \
+                gst.uri_get_protocol(uri) != "file":
+            return None
+        return store.getPack(uri, gst.uri_get_location(uri), self.theight)
+
+    def _loadThumbnail(self, segment):
+        if self._pack is None or segment in self._unstored:
+            return False
+
+        self._pack.load(segment, self._packLoadCb)
+        return True
+
+    def _packLoadCb(self, segment, thumbnail):
+        # called from the thread of the store
+        gobject.idle_add(self._thumbnailLoadedCb, segment, thumbnail)
+
+    def _thumbnailLoadedCb(self, segment, thumbnail):
+        if thumbnail is None:
+            self._unstored.add(segment)
+            surface = None
+        else:
+            width, height, stride, data = thumbnail
+            b = array.array("b")
+            b.fromstring(data)
+            surface = cairo.ImageSurface.create_for_data(b,
+                    cairo.FORMAT_RGB24, width, height, stride)
+        self._thumbnailLoaded(segment, surface)
+        return False
+
+    def _saveThumbnail(self, surface, segment):
+        if self._pack is None or segment is None:
+            return
+
+        self._unstored.discard(segment)
+
+        # copy the pixels now, the compression and the write to the disk are
+        # done by the writer thread of the store
+        self._pack.put(segment, surface.get_width(), surface.get_height(),
+                surface.get_stride(), str(surface.get_data()))
+
+    def _connectSettings(self, settings):
+        RandomAccessPreviewer._connectSettings(self, settings)
+        settings.connect("showThumbnailsChanged", self._showThumbsChanged)
+        self._view = settings.showThumbnails
+
+    def _showThumbsChanged(self, settings):
+        self._view = settings.showThumbnails
+        self.emit("update", None)
+
+
+# a rough estimate of the number of decoded frames held by a thumbnailing
+# pipeline, in its decoder and queues
+WORKER_BUFFERED_FRAMES = 16
+
+# when at least SCAN_MIN_SEGMENTS pending thumbnails of a file follow each
+# other by less than SCAN_MAX_GAP, they are generated by decoding the whole
+# range once instead of seeking to each of them, which decodes the frames
+# from the previous keyframe each time.
+SCAN_MIN_SEGMENTS = 4
+SCAN_MAX_SEGMENTS = 32
+SCAN_MAX_GAP = 2 * gst.SECOND
+
+# the usual distance between two keyframes, when the thumbnails are further
+# apart the keyframe thumbnails are not refined
+KEYFRAME_INTERVAL = 2 * gst.SECOND
+
+
+class VideoThumbnailWorker(Loggable):
+
+    """
+    A thumbnailing pipeline of a L{RandomAccessVideoPreviewer}, run by the
+    L{ThumbnailWorkerPool}.
+
+    A single segment is generated with a seek to the previous keyframe, fast
+    but approximate, or with an accurate seek when refining it. Several
+    segments are generated by scanning: the range of the segments is played
+    and the first frame reaching each segment is kept.
+
+    @ivar owner: The previewer.
+    @type owner: L{RandomAccessVideoPreviewer}
+    @ivar segments: The segments being generated, sorted.
+    @type segments: C{list}
+    @ivar scanning: Whether the segments are generated by scanning.
+    @type scanning: C{bool}
+    @ivar quality: The quality of the thumbnails being generated.
+    @type quality: C{int}
+    """
+
+    def __init__(self, owner):
+        Loggable.__init__(self)
+        self.owner = owner
+        self.segments = []
+        self.scanning = False
+        self.quality = QUALITY_EXACT
+        self._prerolled = False
+        self._failed = False
+        # distinguishes the frames of successive requests
+        self._generation = 0
+
+        sbin = owner._makeBin()
         csp = gst.element_factory_make("ffmpegcolorspace")
-        sink = CairoSurfaceThumbnailSink()
+        self._sink = sink = CairoSurfaceThumbnailSink()
         scale = gst.element_factory_make("videoscale")
         scale.props.method = 0
         caps = ("video/x-raw-rgb,height=(int) %d,width=(int) %d" %
-            (self.theight, self.twidth + 2))
+            (owner.theight, owner.twidth + 2))
         filter_ = utils.filter_(caps)
-        self.videopipeline = utils.pipeline({
+        self.pipeline = utils.pipeline({
             sbin: csp,
             csp: scale,
             scale: filter_,
@@ -377,35 +748,157 @@ class RandomAccessVideoPreviewer(RandomAccessPreviewer):
             sink: None
         })
         sink.connect('thumbnail', self._thumbnailCb)
-        self.videopipeline.set_state(gst.STATE_PAUSED)
-
-    def _segment_for_time(self, time):
-        # quantize thumbnail timestamps to maximum granularity
-        return time - (time % self.tstep)
-
-    def _thumbnailCb(self, unused_thsink, pixbuf, timestamp):
-        gobject.idle_add(self._finishThumbnail, pixbuf, timestamp)
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message::error", self._busMessageErrorCb)
+        bus.connect("message::eos", self._busMessageEosCb)
+        self.pipeline.set_state(gst.STATE_PAUSED)
+
+    def start(self, segment):
+        """Start generating the thumbnail of the segment, and of the
+        pending segments following it if they are worth scanning.
+
+        @return: Whether the thumbnails are being generated.
+        @rtype: C{bool}"""
+        if self._failed:
+            return False
+
+        self.segments = self.owner._takeScanSegments(segment)
+        self.scanning = len(self.segments) > 1
+        if self.scanning:
+            self.quality = QUALITY_EXACT
+        else:
+            self.quality = self.owner._getSeekQuality(segment)
+        self._generation += 1
+        if not self._prerolled:
+            # the seek is done once the pipeline prerolled
+            return True
+
+        if not self._seek():
+            self._reset()
+            return False
+        return True
+
+    def destroy(self):
+        bus = self.pipeline.get_bus()
+        bus.disconnect_by_func(self._busMessageErrorCb)
+        bus.disconnect_by_func(self._busMessageEosCb)
+        bus.remove_signal_watch()
+        self.pipeline.set_state(gst.STATE_NULL)
+        self.segments = []
+        self._failed = True
+
+    def _seek(self):
+        flags = gst.SEEK_FLAG_FLUSH | gst.SEEK_FLAG_ACCURATE
+        if not self.scanning:
+            if self.quality == QUALITY_KEYFRAME:
+                flags = gst.SEEK_FLAG_FLUSH | gst.SEEK_FLAG_KEY_UNIT
+            return self.pipeline.seek(1.0, gst.FORMAT_TIME, flags,
+                gst.SEEK_TYPE_SET, self.segments[0],
+                gst.SEEK_TYPE_NONE, -1)
+
+        if not self.pipeline.seek(1.0, gst.FORMAT_TIME, flags,
+                gst.SEEK_TYPE_SET, self.segments[0],
+                gst.SEEK_TYPE_SET, self.segments[-1] + self.owner.tstep):
+            return False
+        self.pipeline.set_state(gst.STATE_PLAYING)
+        return True
+
+    def _reset(self):
+        self.segments = []
+        if self.scanning:
+            self.scanning = False
+            self.pipeline.set_state(gst.STATE_PAUSED)
+
+    def _thumbnailCb(self, thsink, surface, timestamp):
+        # called from the streaming thread, drop the frames preceding the
+        # next segment of a scan without going through the main loop
+        segments = self.segments
+        if self.scanning and segments and \
+                timestamp + self.owner.frame_duration <= segments[0]:
+            thsink.releaseSurface(surface)
+            return
+        gobject.idle_add(self._thumbnailDone, surface, timestamp,
+                self._generation)
+
+    def _thumbnailDone(self, surface, timestamp, generation):
+        if self._failed:
+            return False
+
+        if not self._prerolled:
+            # the preroll thumbnail is the first frame, not a requested one
+            self._prerolled = True
+            self._sink.releaseSurface(surface)
+            if self.segments and not self._seek():
+                self._done()
+            return False
+
+        if generation != self._generation or not self.segments:
+            self._sink.releaseSurface(surface)
+            return False
+
+        if not self.scanning:
+            self._done(surface, self.segments[0])
+            return False
+
+        # the frame is the thumbnail of the segments it reached
+        end = timestamp + self.owner.frame_duration
+        reached = []
+        while self.segments and end > self.segments[0]:
+            reached.append(self.segments.pop(0))
+        if not reached:
+            self._sink.releaseSurface(surface)
+            return False
+
+        # each segment gets its own surface, the cache accounts the memory
+        # of each entry
+        for segment in reached[:-1]:
+            self.owner._addThumbnail(self._copySurface(surface), segment,
+                    self.quality)
+        if self.segments:
+            self.owner._addThumbnail(surface, reached[-1], self.quality)
+        else:
+            self._done(surface, reached[-1])
+        return False
 
-    def _startThumbnail(self, timestamp):
-        RandomAccessPreviewer._startThumbnail(self, timestamp)
-        return self.videopipeline.seek(1.0,
-            gst.FORMAT_TIME, gst.SEEK_FLAG_FLUSH | gst.SEEK_FLAG_ACCURATE,
-            gst.SEEK_TYPE_SET, timestamp,
-            gst.SEEK_TYPE_NONE, -1)
+    def _copySurface(self, surface):
+        copy = cairo.ImageSurface(surface.get_format(), surface.get_width(),
+                surface.get_height())
+        cr = cairo.Context(copy)
+        cr.set_source_surface(surface, 0, 0)
+        cr.set_operator(cairo.OPERATOR_SOURCE)
+        cr.paint()
+        copy.flush()
+        return copy
 
-    def _connectSettings(self, settings):
-        RandomAccessPreviewer._connectSettings(self, settings)
-        settings.connect("showThumbnailsChanged", self._showThumbsChanged)
-        self._view = settings.showThumbnails
+    def _busMessageErrorCb(self, bus, message):
+        error, debug = message.parse_error()
+        self.warning("thumbnailing failed: %s %s", error, debug)
+        self._failed = True
+        self._done()
+
+    def _busMessageEosCb(self, bus, message):
+        # the frames reaching the end of the stream are still queued in the
+        # main loop
+        gobject.idle_add(self._scanDone, self._generation)
+
+    def _scanDone(self, generation):
+        if generation == self._generation and self.segments:
+            # the remaining segments are past the end of the stream
+            self._done()
+        return False
 
-    def _showThumbsChanged(self, settings):
-        self._view = settings.showThumbnails
-        self.emit("update", None)
+    def _done(self, surface=None, segment=None):
+        had_segments = bool(self.segments) or segment is not None
+        self._reset()
+        if had_segments:
+            self.owner._workerDone(self, surface, segment, self.quality)
 
 
 class StillImagePreviewer(RandomAccessVideoPreviewer):
-    def _thumbForTime(self, cr, time, x, y):
-        return RandomAccessVideoPreviewer._thumbForTime(self, cr, 0L, x, y)
+    def _segment_for_time(self, time):
+        # all the thumbnails are the same
+        return 0L
 
 
 class RandomAccessAudioPreviewer(RandomAccessPreviewer):
@@ -414,66 +907,94 @@ class RandomAccessAudioPreviewer(RandomAccessPreviewer):
         self.tdur = 30 * gst.SECOND
         self.base_width = int(Zoomable.max_zoom)
         RandomAccessPreviewer.__init__(self, instance, factory, stream_)
+        self._peaks = None
+        self._peaks_job = None
+        self._released = False
+        self._loadPeaks(factory)
 
     @property
     def twidth(self):
         return Zoomable.nsToPixel(self.tdur)
 
-    def _pipelineInit(self, factory, sbin):
+    def _pipelineInit(self, factory, stream_):
         self.spacing = 0
+        # the samples are reduced as they arrive, count a second of mono
+        # float samples in the queues of the pipeline
+        rate = stream_.rate or 48000
+        self.worker_bytes = rate * 4
+
+    def makeWorker(self):
+        """Return a new waveform pipeline, called by the pool.
+
+        @rtype: L{AudioWaveformWorker}"""
+        return AudioWaveformWorker(self)
+
+    def release(self):
+        RandomAccessPreviewer.release(self)
+        self._released = True
+        if self._peaks_job is not None:
+            self._peaks_job.cancel()
+            self._peaks_job = None
+
+    def _loadPeaks(self, factory):
+        # the peaks of local files are saved, so that the waveforms are drawn
+        # without decoding anything the next time the file is used
+        uri = factory.uri
+        if not gst.uri_is_valid(uri) or gst.uri_get_protocol(uri) != "file":
+            return
 
-        self.audioSink = ArraySink()
-        conv = gst.element_factory_make("audioconvert")
-        self.audioPipeline = utils.pipeline({
-            sbin: conv,
-            conv: self.audioSink,
-            self.audioSink: None})
-        bus = self.audioPipeline.get_bus()
-        bus.add_signal_watch()
-        bus.connect("message::segment-done", self._busMessageSegmentDoneCb)
-        bus.connect("message::error", self._busMessageErrorCb)
+        self._peaks_uri = uri
+        self._peaks_path = gst.uri_get_location(uri)
+        get_peak_store().read(uri, self._peaks_path, self._peaksReadCb)
 
-        self._audio_cur = None
-        self.audioPipeline.set_state(gst.STATE_PAUSED)
+    def _peaksReadCb(self, peaks):
+        # called from the thread of the peak store
+        gobject.idle_add(self._peaksLoadedCb, peaks)
 
-    def _spacing(self):
-        return 0
+    def _peaksLoadedCb(self, peaks):
+        if self._released:
+            return False
 
-    def _segment_for_time(self, time):
-        # for audio files, we need to know the duration the segment spans
-        return time - (time % self.tdur), self.tdur
+        if peaks is None:
+            # the whole stream is decoded by the pool, the waveforms are
+            # drawn from decoded segments until it's done
+            self._peaks_job = AudioPeaksJob(self)
+            self._peaks_job.request(self._offset,
+                    self._offset + self._factory.duration)
+            return False
 
-    def _busMessageSegmentDoneCb(self, bus, message):
-        self.debug("segment done")
-        self._finishWaveform()
+        self._peaks = peaks
+        self.emit("update", None)
+        return False
 
-    def _busMessageErrorCb(self, bus, message):
-        error, debug = message.parse_error()
-        print "Event bus error:", str(error), str(debug)
+    def _peaksDone(self, peaks):
+        """Called by the L{AudioPeaksJob} when the peaks of the stream are
+        computed, C{peaks} is C{None} if it failed."""
+        self._peaks_job = None
+        if peaks is None:
+            return
 
-        return gst.BUS_PASS
+        self._peaks = peaks
+        get_peak_store().save(self._peaks_uri, self._peaks_path, peaks)
+        self.emit("update", None)
 
-    def _startThumbnail(self, (timestamp, duration)):
-        RandomAccessPreviewer._startThumbnail(self, (timestamp, duration))
-        self._audio_cur = timestamp, duration
-        res = self.audioPipeline.seek(1.0,
-            gst.FORMAT_TIME,
-            gst.SEEK_FLAG_FLUSH | gst.SEEK_FLAG_ACCURATE | gst.SEEK_FLAG_SEGMENT,
-            gst.SEEK_TYPE_SET, timestamp,
-            gst.SEEK_TYPE_SET, timestamp + duration)
-        if not res:
-            self.warning("seek failed %s", timestamp)
-        self.audioPipeline.set_state(gst.STATE_PLAYING)
+    def _spacing(self):
+        return 0
 
-        return res
+    def _segment_for_time(self, time):
+        # for audio files, we need to know the duration the segment spans
+        return time - (time % self.tdur), self.tdur
 
-    def _finishWaveform(self):
+    def _makeWaveforms(self, sink):
+        """Return the waveforms of the samples of the sink, at several
+        widths."""
         surfaces = []
         surface = cairo.ImageSurface(cairo.FORMAT_A8,
             self.base_width, self.theight)
         cr = cairo.Context(surface)
-        self._plotWaveform(cr, self.base_width)
-        self.audioSink.reset()
+        self._plotWaveform(cr, self.base_width, sink.mins, sink.maxs,
+                sink.channels)
+        sink.reset()
 
         for width in [25, 100, 200]:
             scaled = cairo.ImageSurface(cairo.FORMAT_A8,
@@ -487,53 +1008,91 @@ class RandomAccessAudioPreviewer(RandomAccessPreviewer):
             cr.fill()
             surfaces.append(scaled)
         surfaces.append(surface)
-        gobject.idle_add(self._finishThumbnail, surfaces, self._audio_cur)
+        return surfaces
 
-    def _plotWaveform(self, cr, base_width):
+    def _plotWaveform(self, cr, base_width, mins, maxs, channels):
         # clear background
         cr.set_source_rgba(1, 1, 1, 0.0)
         cr.rectangle(0, 0, base_width, self.theight)
         cr.fill()
 
-        samples = self.audioSink.samples
-
-        if not samples:
+        if not mins:
             return
 
-        # find the samples-per-pixel ratio
-        spp = len(samples) / base_width
-        if spp == 0:
-            spp = 1
-        channels = self.audioSink.channels
-        stride = spp * channels
         hscale = self.theight / (2 * channels)
 
-        # plot points from min to max over a given hunk
-        chan = 0
-        y = hscale
-        while chan < channels:
-            i = chan
+        # the samples were reduced to the min and max of each column by the
+        # sink, plot a line from min to max for each column
+        for chan in xrange(channels):
+            y = hscale + chan * 2 * hscale
             x = 0
-            while i < len(samples):
-                slice = samples[i:i + stride:channels]
-                min_ = min(slice)
-                max_ = max(slice)
+            for min_, max_ in izip(mins[chan::channels], maxs[chan::channels]):
                 cr.move_to(x, y - (min_ * hscale))
                 cr.line_to(x, y - (max_ * hscale))
-                i += spp
                 x += 1
-            y += 2 * hscale
-            chan += 1
 
         # Draw!
         cr.set_source_rgba(0, 0, 0, 1.0)
         cr.stroke()
 
+    def _plotPeaks(self, segment, level):
+        """Plot the waveform of the segment from the given level of the
+        peaks, one pixel per peak."""
+        timestamp, duration = segment
+        peaks = self._peaks
+        channels = peaks.channels
+        first = int(timestamp * peaks.rate / gst.SECOND / level.spp)
+        width = max(1, int(duration * peaks.rate / gst.SECOND / level.spp))
+        last = min(first + width, peaks.getCount(level))
+
+        surface = cairo.ImageSurface(cairo.FORMAT_A8, width, self.theight)
+        cr = cairo.Context(surface)
+        hscale = self.theight / (2.0 * channels)
+        # the peaks are quantized to [-127, 127]
+        vscale = hscale / 127
+        mins = level.mins
+        maxs = level.maxs
+
+        y = hscale
+        for chan in xrange(channels):
+            for column in xrange(first, last):
+                i = column * channels + chan
+                x = column - first + 0.5
+                cr.move_to(x, y - mins[i] * vscale)
+                cr.line_to(x, y - maxs[i] * vscale)
+            y += 2 * hscale
+
+        cr.set_source_rgba(0, 0, 0, 1.0)
+        cr.set_line_width(1.0)
+        cr.stroke()
+        return surface
+
+    def _peaksForTime(self, cr, segment, level, x, y):
+        key = segment, level.spp
+        surface = self._cache.get(key)
+        if surface is None:
+            surface = self._plotPeaks(segment, level)
+            self._cache[key] = surface
+
+        cr.set_source_surface(surface)
+        matrix = cairo.Matrix()
+        matrix.scale(float(surface.get_width()) / self.twidth, 1.0)
+        matrix.translate(-x, -y)
+        cr.get_source().set_matrix(matrix)
+
     def _thumbForTime(self, cr, time, x, y):
         segment = self._segment_for_time(time)
+        if self._peaks is not None:
+            # draw from the level of the peaks nearest to the zoom ratio
+            level = self._peaks.getLevel(
+                    self._peaks.rate / Zoomable.zoomratio)
+            if level is not None:
+                self._peaksForTime(cr, segment, level, x, y)
+                return
+
         twidth = self.twidth
-        if segment in self._cache:
-            surfaces = self._cache[segment]
+        surfaces = self._cache.get(segment)
+        if surfaces is not None:
             if twidth > 200:
                 surface = surfaces[3]
                 base_width = self.base_width
@@ -553,7 +1112,7 @@ class RandomAccessAudioPreviewer(RandomAccessPreviewer):
             matrix.translate(-x, -y)
             cr.get_source().set_matrix(matrix)
         else:
-            self._requestThumbnail(segment)
+            self._requestThumbnail(segment, time)
             cr.set_source_rgba(0.0, 0.0, 0.0, 0.0)
 
     def _connectSettings(self, settings):
@@ -564,3 +1123,211 @@ class RandomAccessAudioPreviewer(RandomAccessPreviewer):
     def _showWaveformsChanged(self, settings):
         self._view = settings.showWaveforms
         self.emit("update", None)
+
+
+class AudioWaveformWorker(Loggable):
+
+    """
+    A waveform pipeline of a L{RandomAccessAudioPreviewer}, run by the
+    L{ThumbnailWorkerPool}. A segment is decoded with a segment seek, the
+    samples are downmixed and reduced to the columns of the waveform by the
+    sink, and its waveforms are plotted when the segment is done.
+
+    @ivar owner: The previewer.
+    @type owner: L{RandomAccessAudioPreviewer}
+    @ivar segments: The segment being processed, or nothing.
+    @type segments: C{list}
+    """
+
+    def __init__(self, owner):
+        Loggable.__init__(self)
+        self.owner = owner
+        self.segments = []
+        self._failed = False
+
+        sbin = owner._makeBin()
+        self.sink = WaveformSink()
+        conv = gst.element_factory_make("audioconvert")
+        self.pipeline = utils.pipeline({
+            sbin: conv,
+            conv: self.sink,
+            self.sink: None})
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message::segment-done", self._busMessageSegmentDoneCb)
+        bus.connect("message::error", self._busMessageErrorCb)
+        self.pipeline.set_state(gst.STATE_PAUSED)
+
+    def start(self, segment):
+        """Start decoding the segment.
+
+        @return: Whether the segment is being decoded.
+        @rtype: C{bool}"""
+        if self._failed:
+            return False
+
+        timestamp, duration = segment
+        self.sink.setColumns(duration, self.owner.base_width)
+        res = self.pipeline.seek(1.0,
+            gst.FORMAT_TIME,
+            gst.SEEK_FLAG_FLUSH | gst.SEEK_FLAG_ACCURATE | gst.SEEK_FLAG_SEGMENT,
+            gst.SEEK_TYPE_SET, timestamp,
+            gst.SEEK_TYPE_SET, timestamp + duration)
+        if not res:
+            self.warning("seek failed %s", timestamp)
+            return False
+
+        self.segments = [segment]
+        self.pipeline.set_state(gst.STATE_PLAYING)
+        return True
+
+    def destroy(self):
+        bus = self.pipeline.get_bus()
+        bus.disconnect_by_func(self._busMessageSegmentDoneCb)
+        bus.disconnect_by_func(self._busMessageErrorCb)
+        bus.remove_signal_watch()
+        self.pipeline.set_state(gst.STATE_NULL)
+        self.segments = []
+        self._failed = True
+
+    def _busMessageSegmentDoneCb(self, bus, message):
+        self.debug("segment done")
+        if not self.segments:
+            return
+        self.sink.finish()
+        self._done(self.owner._makeWaveforms(self.sink))
+
+    def _busMessageErrorCb(self, bus, message):
+        error, debug = message.parse_error()
+        self.warning("waveform failed: %s %s", error, debug)
+        self._failed = True
+        self._done(None)
+
+    def _done(self, surfaces):
+        if not self.segments:
+            return
+        segment = self.segments.pop()
+        self.pipeline.set_state(gst.STATE_PAUSED)
+        self.owner._workerDone(self, surfaces, segment)
+
+
+class AudioPeaksJob(object):
+
+    """
+    The computation of the peaks of the stream of a
+    L{RandomAccessAudioPreviewer}. The job is an owner of the
+    L{ThumbnailWorkerPool} with a single background request, so that the
+    pipeline decoding the whole stream counts against the limits of the pool
+    and runs after the visible waveforms.
+
+    @ivar previewer: The previewer.
+    @type previewer: L{RandomAccessAudioPreviewer}
+    """
+
+    # the key of the single request of the job
+    SEGMENT = 0
+
+    def __init__(self, previewer):
+        self.previewer = previewer
+        self.worker_bytes = previewer.worker_bytes
+        self._scheduler = previewer._scheduler
+        self._pool = previewer._pool
+        self._pool.addOwner(self)
+
+    def request(self, start, end):
+        """
+        Queue the computation, for the stream displayed from C{start} to
+        C{end} in the timeline.
+        """
+        self._scheduler.request(self, self.SEGMENT, start, end,
+                background=True)
+        self._pool.dispatch()
+
+    def cancel(self):
+        """
+        Stop the computation.
+        """
+        self._scheduler.cancel(self)
+        self._pool.removeOwner(self)
+
+    def makeWorker(self):
+        """Return a new peak pipeline, called by the pool.
+
+        @rtype: L{AudioPeaksWorker}"""
+        return AudioPeaksWorker(self)
+
+    def _workerDone(self, worker, peaks):
+        self.cancel()
+        # the pipeline made room for the requests of the other owners
+        self._pool.dispatch()
+        self.previewer._peaksDone(peaks)
+
+
+class AudioPeaksWorker(Loggable):
+
+    """
+    A pipeline of an L{AudioPeaksJob}, run by the L{ThumbnailWorkerPool}.
+    The whole stream is played and its peaks are computed by the sink as the
+    samples arrive.
+
+    @ivar owner: The job.
+    @type owner: L{AudioPeaksJob}
+    """
+
+    def __init__(self, owner):
+        Loggable.__init__(self)
+        self.owner = owner
+        self._running = False
+        self._failed = False
+
+        sbin = owner.previewer._makeBin()
+        conv = gst.element_factory_make("audioconvert")
+        self.sink = PeakSink()
+        self.pipeline = utils.pipeline({
+            sbin: conv,
+            conv: self.sink,
+            self.sink: None})
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message::eos", self._busMessageEosCb)
+        bus.connect("message::error", self._busMessageErrorCb)
+
+    def start(self, segment):
+        """Start decoding the stream.
+
+        @return: Whether the stream is being decoded.
+        @rtype: C{bool}"""
+        if self._failed or self._running:
+            return False
+
+        self._running = True
+        self.pipeline.set_state(gst.STATE_PLAYING)
+        return True
+
+    def destroy(self):
+        bus = self.pipeline.get_bus()
+        bus.disconnect_by_func(self._busMessageEosCb)
+        bus.disconnect_by_func(self._busMessageErrorCb)
+        bus.remove_signal_watch()
+        self.pipeline.set_state(gst.STATE_NULL)
+        self._running = False
+        self._failed = True
+
+    def _busMessageEosCb(self, bus, message):
+        builder = self.sink.builder
+        if builder is None:
+            self._done(None)
+        else:
+            self._done(builder.finish())
+
+    def _busMessageErrorCb(self, bus, message):
+        error, debug = message.parse_error()
+        self.warning("couldn't compute the peaks: %s %s", error, debug)
+        self._failed = True
+        self._done(None)
+
+    def _done(self, peaks):
+        if not self._running:
+            return
+        self._running = False
+        self.owner._workerDone(self, peaks)
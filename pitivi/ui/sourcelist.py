@@ -31,23 +31,33 @@ from gettext import gettext as _
 from gettext import ngettext
 
 import pitivi.ui.dnd as dnd
-from pitivi.ui.pathwalker import PathWalker, quote_uri
+from pitivi.threads import PathWalker
+from pitivi.ui.thumbnailloader import ThumbnailLoader
 from pitivi.ui.filelisterrordialog import FileListErrorDialog
 from pitivi.configure import get_pixmap_dir
 from pitivi.signalgroup import SignalGroup
 from pitivi.stream import VideoStream, AudioStream, TextStream, \
         MultimediaStream
 from pitivi.settings import GlobalSettings
-from pitivi.utils import beautify_length
+from pitivi.utils import beautify_length, quote_uri
 from pitivi.ui.common import beautify_factory, factory_name, \
     beautify_stream, SPACING, PADDING
 from pitivi.log.loggable import Loggable
 from pitivi.sourcelist import SourceListError
+from pitivi.thumbnailcache import ThumbnailCache
 from pitivi.ui.filechooserpreview import PreviewWidget
 
 SHOW_TREEVIEW = 1
 SHOW_ICONVIEW = 2
 
+# widths of the thumbnails of the tree view and of the icon view
+THUMBNAIL_WIDTH = 64
+THUMBNAIL_LARGE_WIDTH = 96
+# maximum number of rows added to the store at each idle
+ROWS_PER_IDLE = 50
+# the number of loaded thumbnail files kept for the rows added later
+THUMBNAIL_CACHE_SIZE = 256
+
 GlobalSettings.addConfigSection('clip-library')
 GlobalSettings.addConfigOption('lastImportFolder',
     section='clip-library',
@@ -120,6 +130,8 @@ class SourceList(gtk.VBox, Loggable):
         self.app = instance
         self.settings = instance.settings
         self._errors = []
+        # the sources of the loaded project whose files changed
+        self._changed = []
 
         # Store
         # icon, infotext, objectfactory, uri, length
@@ -278,6 +290,18 @@ class SourceList(gtk.VBox, Loggable):
         self.audiofilepixbuf = self._getIcon("audio-x-generic", "pitivi-sound.png")
         self.videofilepixbuf = self._getIcon("video-x-generic", "pitivi-video.png")
 
+        # rows waiting to be added to the store
+        self._pending_rows = []
+        self._pending_rows_id = 0
+        # thumbnail file => (thumbnail, thumbnail_large)
+        self._thumbnails = ThumbnailCache(size=THUMBNAIL_CACHE_SIZE)
+        # thumbnail file being loaded => list of gtk.TreeRowReference
+        self._thumbnail_rows = {}
+        self._thumbnail_loader = ThumbnailLoader(
+                (THUMBNAIL_WIDTH, THUMBNAIL_LARGE_WIDTH),
+                self._thumbnailLoadedCb)
+        self._thumbnail_loader.start()
+
         # Drag and Drop
         self.drag_dest_set(gtk.DEST_DEFAULT_DROP | gtk.DEST_DEFAULT_MOTION,
                            [dnd.URI_TUPLE, dnd.FILE_TUPLE],
@@ -397,11 +421,8 @@ class SourceList(gtk.VBox, Loggable):
         sources = self.app.current.sources
         start = timeline.duration
         self.app.current.seeker.seek(start)
-        for uri in self.getSelectedItems():
-            factory = sources.getUri(uri)
-            source = timeline.addSourceFactory(factory)
-            source.setStart(start)
-            start += source.duration
+        factories = [sources.getUri(uri) for uri in self.getSelectedItems()]
+        timeline.addSourceFactories(factories, start)
         self.app.action_log.commit()
 
     def searchEntryChangedCb(self, entry):
@@ -453,6 +474,8 @@ class SourceList(gtk.VBox, Loggable):
             project.sources, "source-removed", None, self._sourceRemovedCb)
         self.project_signals.connect(
             project.sources, "discovery-error", None, self._discoveryErrorCb)
+        self.project_signals.connect(
+            project.sources, "source-changed", None, self._sourceChangedCb)
         self.project_signals.connect(
             project.sources, "missing-plugins", None, self._missingPluginsCb)
         self.project_signals.connect(
@@ -559,31 +582,27 @@ class SourceList(gtk.VBox, Loggable):
 
     def _addFactory(self, factory):
         video = factory.getOutputStreams(VideoStream)
+        thumbnail_file = None
         if video and video[0].thumbnail:
             thumbnail_file = video[0].thumbnail
             try:
-                self.debug("attempting to open thumbnail file '%s'",
-                        thumbnail_file)
-                pixbuf = gtk.gdk.pixbuf_new_from_file(thumbnail_file)
-            except:
-                self.error("Failure to create thumbnail from file '%s'",
-                        thumbnail_file)
+                thumbnail, thumbnail_large = self._thumbnails[thumbnail_file]
+            except KeyError:
+                # loaded in the background, see _thumbnailLoadedCb
                 thumbnail = self.videofilepixbuf
                 thumbnail_large = self.videofilepixbuf
+                if thumbnail_file not in self._thumbnail_rows:
+                    self._thumbnail_rows[thumbnail_file] = []
+                    self._thumbnail_loader.load(thumbnail_file,
+                            float(video[0].dar))
             else:
-                desiredheight = int(64 / float(video[0].dar))
-                thumbnail = pixbuf.scale_simple(64,
-                        desiredheight, gtk.gdk.INTERP_BILINEAR)
-                desiredheight = int(96 / float(video[0].dar))
-                thumbnail_large = pixbuf.scale_simple(96,
-                        desiredheight, gtk.gdk.INTERP_BILINEAR)
+                thumbnail_file = None
+        elif video:
+            thumbnail = self.videofilepixbuf
+            thumbnail_large = self.videofilepixbuf
         else:
-            if video:
-                thumbnail = self.videofilepixbuf
-                thumbnail_large = self.videofilepixbuf
-            else:
-                thumbnail = self.audiofilepixbuf
-                thumbnail_large = self.audiofilepixbuf
+            thumbnail = self.audiofilepixbuf
+            thumbnail_large = self.audiofilepixbuf
 
         if not factory.duration or factory.duration == gst.CLOCK_TIME_NONE:
             duration = ''
@@ -600,15 +619,68 @@ class SourceList(gtk.VBox, Loggable):
         else:
             short_text = factory_name(factory)
 
-        self.storemodel.append([thumbnail,
+        row = [thumbnail,
             thumbnail_large,
             beautify_factory(factory),
             factory,
             factory.uri,
             duration,
             factory_name(factory),
-            short_text])
+            short_text]
+        self._pending_rows.append((row, thumbnail_file))
+        if not self._pending_rows_id:
+            self._pending_rows_id = gobject.idle_add(self._addPendingRows)
+
+    def _addPendingRows(self):
+        rows = self._pending_rows[:ROWS_PER_IDLE]
+        del self._pending_rows[:ROWS_PER_IDLE]
+        for row, thumbnail_file in rows:
+            tree_iter = self.storemodel.append(row)
+            if thumbnail_file is None:
+                continue
+
+            pixbufs = self._thumbnails.get(thumbnail_file)
+            if pixbufs is not None:
+                # loaded while the row was waiting
+                self.storemodel.set(tree_iter, COL_ICON, pixbufs[0],
+                        COL_ICON_LARGE, pixbufs[1])
+            elif thumbnail_file in self._thumbnail_rows:
+                path = self.storemodel.get_path(tree_iter)
+                self._thumbnail_rows[thumbnail_file].append(
+                        gtk.TreeRowReference(self.storemodel, path))
+
         self._displayClipView()
+        if len(self.storemodel):
+            self.infobar.hide_all()
+            self.search_hbox.show_all()
+
+        if self._pending_rows:
+            return True
+
+        self._pending_rows_id = 0
+        return False
+
+    def _clearRows(self):
+        self.storemodel.clear()
+        self._pending_rows = []
+        self._thumbnails.clear()
+        self._thumbnail_rows.clear()
+        if self._pending_rows_id:
+            gobject.source_remove(self._pending_rows_id)
+            self._pending_rows_id = 0
+
+    def _thumbnailLoadedCb(self, thumbnail_file, pixbufs):
+        references = self._thumbnail_rows.pop(thumbnail_file, [])
+        if pixbufs is None:
+            return False
+
+        self._thumbnails[thumbnail_file] = pixbufs
+        for reference in references:
+            if reference.valid():
+                self.storemodel.set(self.storemodel.get_iter(
+                        reference.get_path()),
+                        COL_ICON, pixbufs[0], COL_ICON_LARGE, pixbufs[1])
+        return False
 
     # sourcelist callbacks
 
@@ -616,19 +688,20 @@ class SourceList(gtk.VBox, Loggable):
         """ a file was added to the sourcelist """
         self._updateProgressbar()
         self._addFactory(factory)
-        if len(self.storemodel):
-            self.infobar.hide_all()
-            self.search_hbox.show_all()
 
     def _sourceRemovedCb(self, sourcelist, uri, factory):
         """ the given uri was removed from the sourcelist """
         # find the good line in the storemodel and remove it
+        for pending in self._pending_rows:
+            if uri == pending[0][COL_URI]:
+                self._pending_rows.remove(pending)
+                break
         model = self.storemodel
         for row in model:
             if uri == row[COL_URI]:
                 model.remove(row.iter)
                 break
-        if not len(model):
+        if not len(model) and not self._pending_rows:
             self._displayHelpText()
             self.search_hbox.hide()
 
@@ -637,6 +710,12 @@ class SourceList(gtk.VBox, Loggable):
         error = (uri, reason, extra)
         self._errors.append(error)
 
+    def _sourceChangedCb(self, unused_sourcelist, uri, reason, extra):
+        """ The file of a source of the loaded project changed """
+        self._changed.append((uri, reason, extra))
+        if not self._progressbar.get_property("visible"):
+            self._showWarnings()
+
     def _missingPluginsCb(self, sourcelist, uri, factory, details, descriptions, cb):
         error = (uri, "Missing plugins", "\n".join(descriptions))
         self._errors.append(error)
@@ -647,6 +726,9 @@ class SourceList(gtk.VBox, Loggable):
 
     def _sourcesStoppedImportingCb(self, unused_sourcelist):
         self._progressbar.hide()
+        self._showWarnings()
+
+    def _showWarnings(self):
         if self._errors:
             if len(self._errors) > 1:
                 self._warning_label.set_text(_("Errors occurred while importing."))
@@ -654,8 +736,19 @@ class SourceList(gtk.VBox, Loggable):
             else:
                 self._warning_label.set_text(_("An error occurred while importing."))
                 self._view_error_btn.set_label(_("View error"))
+        elif self._changed:
+            if len(self._changed) > 1:
+                self._warning_label.set_text(
+                        _("Some files changed since the project was saved."))
+                self._view_error_btn.set_label(_("View files"))
+            else:
+                self._warning_label.set_text(
+                        _("A file changed since the project was saved."))
+                self._view_error_btn.set_label(_("View file"))
+        else:
+            return
 
-            self._import_warning_infobar.show_all()
+        self._import_warning_infobar.show_all()
 
     ## Error Dialog Box callbacks
 
@@ -763,26 +856,43 @@ class SourceList(gtk.VBox, Loggable):
 
     def _resetErrorList(self):
         self._errors = []
+        self._changed = []
         self._import_warning_infobar.hide()
 
     def _viewErrorsButtonClickedCb(self, unused_button):
         """
-        Show a FileListErrorDialog to display import _errors.
+        Show a FileListErrorDialog to display import _errors, or the changed
+        files of the project.
         """
-        if len(self._errors) > 1:
-            msgs = (_("Error while analyzing files"),
-                    _("The following files can not be used with PiTiVi."))
+        if self._errors:
+            failed = self._errors
+            if len(self._errors) > 1:
+                msgs = (_("Error while analyzing files"),
+                        _("The following files can not be used with PiTiVi."))
+            else:
+                msgs = (_("Error while analyzing a file"),
+                        _("The following file can not be used with PiTiVi."))
         else:
-            msgs = (_("Error while analyzing a file"),
-                    _("The following file can not be used with PiTiVi."))
+            failed = self._changed
+            if len(self._changed) > 1:
+                msgs = (_("Files changed"),
+                        _("The following files changed since the project "
+                        "was saved."))
+            else:
+                msgs = (_("File changed"),
+                        _("The following file changed since the project "
+                        "was saved."))
         self._error_dialogbox = FileListErrorDialog(*msgs)
         self._error_dialogbox.connect("close", self._errorDialogBoxCloseCb)
         self._error_dialogbox.connect("response", self._errorDialogBoxResponseCb)
-        for uri, reason, extra in self._errors:
+        for uri, reason, extra in failed:
             self._error_dialogbox.addFailedFile(uri, reason, extra)
         self._error_dialogbox.window.show()
-        # Reset the error list, since the user has read them.
-        self._resetErrorList()
+        # Reset the list, since the user has read it. The changed files are
+        # shown after the errors.
+        del failed[:]
+        self._import_warning_infobar.hide()
+        self._showWarnings()
 
     def _treeViewMenuItemToggledCb(self, unused_widget):
         if self.treeview_menuitem.get_active():
@@ -1000,14 +1110,14 @@ class SourceList(gtk.VBox, Loggable):
 
     def _newProjectCreatedCb(self, app, project):
         self._resetErrorList()
-        self.storemodel.clear()
+        self._clearRows()
         self._connectToProject(project)
 
     def _newProjectLoadedCb(self, unused_pitivi, project):
         pass
 
     def _newProjectFailedCb(self, unused_pitivi, unused_reason, unused_uri):
-        self.storemodel.clear()
+        self._clearRows()
         self.project_signals.disconnectAll()
 
     ## Drag and Drop
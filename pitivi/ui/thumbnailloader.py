@@ -0,0 +1,76 @@
+# PiTiVi , Non-linear video editor
+#
+#       ui/thumbnailloader.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+import Queue
+import threading
+
+import gobject
+import gtk
+
+from pitivi.threads import Thread
+
+
+class ThumbnailLoader(Thread):
+    """
+    Thread decoding and scaling thumbnail files, so that the main loop isn't
+    blocked when many files are imported.
+
+    The callback is called from the main loop with the filename and the list
+    of scaled pixbufs, one per width, or C{None} if the file couldn't be
+    loaded.
+    """
+
+    def __init__(self, widths, callback):
+        Thread.__init__(self)
+        self.widths = widths
+        self.callback = callback
+        self.queue = Queue.Queue()
+        self.stopme = threading.Event()
+        self.setDaemon(True)
+
+    def load(self, filename, dar):
+        """
+        Queue the loading of C{filename}, scaled with the display aspect
+        ratio C{dar}.
+        """
+        self.queue.put((filename, dar))
+
+    def process(self):
+        while not self.stopme.isSet():
+            request = self.queue.get()
+            if request is None:
+                return
+
+            filename, dar = request
+            self.debug("loading thumbnail file '%s'", filename)
+            try:
+                pixbuf = gtk.gdk.pixbuf_new_from_file(filename)
+            except gobject.GError, e:
+                self.warning("Failure to create thumbnail from file '%s': %s",
+                        filename, e)
+                pixbufs = None
+            else:
+                pixbufs = [pixbuf.scale_simple(width, int(width / dar),
+                        gtk.gdk.INTERP_BILINEAR) for width in self.widths]
+
+            gobject.idle_add(self.callback, filename, pixbufs)
+
+    def abort(self):
+        self.stopme.set()
+        self.queue.put(None)
@@ -42,6 +42,7 @@ from pitivi.timeline.timeline import MoveContext, SELECT
 from pitivi.utils import Seeker
 from pitivi.ui.filelisterrordialog import FileListErrorDialog
 from pitivi.ui.curve import Curve
+from pitivi.ui.previewer import get_thumbnail_scheduler
 from pitivi.ui.common import SPACING
 
 from pitivi.factories.operation import EffectFactory
@@ -436,8 +437,8 @@ class Timeline(gtk.Table, Loggable, Zoomable):
     def _dragLeaveCb(self, unused_layout, context, unused_tstamp):
         if self._temp_objects:
             try:
-                for obj in self._temp_objects:
-                    self.timeline.removeTimelineObject(obj, deep=True)
+                self.timeline.removeTimelineObjects(self._temp_objects,
+                        deep=True)
             finally:
                 self._temp_objects = None
 
@@ -522,8 +523,7 @@ class Timeline(gtk.Table, Loggable, Zoomable):
         return timeline_objs
 
     def _add_temp_source(self):
-        self._temp_objects = [self.timeline.addSourceFactory(factory)
-            for factory in self._factories]
+        self._temp_objects = self.timeline.addSourceFactories(self._factories)
 
     def _move_temp_source(self, x, y):
         x1, y1, x2, y2 = self._controls.get_allocation()
@@ -579,6 +579,14 @@ class Timeline(gtk.Table, Loggable, Zoomable):
         self._scroll_pos_ns = Zoomable.pixelToNs(self.hadj.get_value())
         self._root_item.set_simple_transform(-self.hadj.get_value(),
             -self.vadj.get_value(), 1.0, 0)
+        self._updateThumbnailViewport()
+
+    def _updateThumbnailViewport(self):
+        # thumbnails are generated for the visible part of the timeline first
+        start = self.hadj.get_value()
+        end = start + self.hadj.props.page_size
+        get_thumbnail_scheduler().setViewport(Zoomable.pixelToNs(start),
+                Zoomable.pixelToNs(end))
 
     def _zoomAdjustmentChangedCb(self, adjustment):
         # GTK crack
@@ -619,6 +627,7 @@ class Timeline(gtk.Table, Loggable, Zoomable):
 
     def timelinePositionChanged(self, position):
         self._position = position
+        get_thumbnail_scheduler().setPlayhead(position)
         self.ruler.timelinePositionChanged(position)
         self._canvas.timelinePositionChanged(position)
         if self._state == gst.STATE_PLAYING:
@@ -705,6 +714,7 @@ class Timeline(gtk.Table, Loggable, Zoomable):
         self.hadj.props.page_size = a.width
         self.hadj.props.page_increment = size * 0.9
         self.hadj.props.step_increment = size * 0.1
+        self._updateThumbnailViewport()
 
     @handler(timeline, "selection-changed")
     def _timelineSelectionChanged(self, timeline):
@@ -28,6 +28,8 @@ import gst
 import bisect
 import os
 import struct
+from urllib import quote
+from urlparse import urlsplit, urlunsplit
 from pitivi.signalinterface import Signallable
 import pitivi.log.log as log
 from gettext import ngettext
@@ -267,6 +269,13 @@ def uri_is_valid(uri):
             len(os.path.basename(gst.uri_get_location(uri))) > 0)
 
 
+def quote_uri(uri):
+    parts = list(urlsplit(uri, allow_fragments=False))
+    parts[2] = quote(parts[2])
+    uri = urlunsplit(parts)
+    return uri
+
+
 def uri_is_reachable(uri):
     """ Check whether the given uri is reachable and we can read/write
     to it.
@@ -364,6 +373,17 @@ def get_filesystem_encoding():
     return sys.getfilesystemencoding() or "utf-8"
 
 
+def cpu_count():
+    """
+    @return: The number of online processors, 1 if it's unknown.
+    @rtype: C{int}
+    """
+    try:
+        return max(1, int(os.sysconf("SC_NPROCESSORS_ONLN")))
+    except (AttributeError, ValueError, OSError):
+        return 1
+
+
 def get_controllable_properties(element):
     """
     Returns a list of controllable properties for the given
@@ -422,6 +442,36 @@ def start_bisect_left(a, x, lo=0, hi=None):
     return lo
 
 
+def start_reinsort_right(a, x):
+    """
+    Move C{x}, whose start changed, to its place in C{a}, a list otherwise
+    sorted by start. Like with L{start_insort_right}, C{x} ends up after the
+    objects with the same start.
+
+    This is cheap when C{x} is already in order, for example after the list
+    was sorted as a whole.
+    """
+    start = x.start
+    lo = start_bisect_left(a, x)
+    hi = lo
+    length = len(a)
+    index = -1
+    while hi < length and a[hi].start == start:
+        if a[hi] is x:
+            index = hi
+        hi += 1
+
+    if index != -1 and (lo == 0 or a[lo - 1].start < start) and \
+            (hi == length or a[hi].start > start):
+        if index != hi - 1:
+            del a[index]
+            a.insert(hi - 1, x)
+        return
+
+    a.remove(x)
+    start_insort_right(a, x)
+
+
 class Infinity(object):
     def __cmp__(self, other):
         if isinstance(other, Infinity):
@@ -0,0 +1,139 @@
+# PiTiVi , Non-linear video editor
+#
+#       tests/bench_memory.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+"""
+Memory benchmark of the timeline model, reports the bytes used per clip.
+
+The model size only accounts for the python objects owned by each clip
+(L{TimelineObject}, L{TrackObject}, interpolators, keyframes and their
+signal handlers), the resident size also accounts for the gstreamer objects
+and the timeline/track bookkeeping.
+
+Run with: PYTHONPATH=.. python bench_memory.py [clips] [max-model-bytes]
+
+Exits with an error when the model size per clip is bigger than
+max-model-bytes, which defaults to L{MAX_MODEL_BYTES}.
+"""
+
+import gc
+import os
+import sys
+
+import gst
+
+from pitivi.signalinterface import Signallable
+from pitivi.stream import AudioStream
+from pitivi.timeline.timeline import Timeline, TimelineObject
+from pitivi.timeline.track import Track, TrackObject, SourceTrackObject, \
+        Interpolator, Keyframe
+
+from common import StubFactory
+
+model_types = (TimelineObject, TrackObject, Interpolator, Keyframe,
+        Signallable.SignalGroup)
+container_types = (list, tuple, dict, set, frozenset)
+
+# a clip with its audio track object takes about 15k bytes with __slots__,
+# this leaves room for interpolators but catches a regression to
+# per-instance attribute dicts
+MAX_MODEL_BYTES = 20000
+
+
+def getModelSize(roots):
+    """
+    Return the size of the given model objects, following the references to
+    other model objects and containers but not to gstreamer objects,
+    factories, tracks or timelines.
+    """
+    seen = set()
+    size = 0
+    objs = list(roots)
+    while objs:
+        obj = objs.pop()
+        if id(obj) in seen:
+            continue
+
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        for ref in gc.get_referents(obj):
+            if isinstance(ref, model_types) or \
+                    type(ref) in container_types:
+                objs.append(ref)
+
+    return size
+
+
+def getResidentSize():
+    try:
+        statm = open("/proc/self/statm").read().split()
+    except IOError:
+        return None
+
+    return int(statm[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def makeTimeline(n_clips):
+    factory = StubFactory()
+    stream = AudioStream(gst.Caps("audio/x-raw-int"))
+    factory.addOutputStream(stream)
+    track = Track(stream)
+    timeline = Timeline()
+    timeline.addTrack(track)
+
+    timeline.disableUpdates()
+    for i in xrange(n_clips):
+        track_object = SourceTrackObject(factory, stream)
+        track.addTrackObject(track_object)
+        timeline_object = TimelineObject(factory)
+        timeline_object.addTrackObject(track_object)
+        timeline.addTimelineObject(timeline_object)
+        timeline_object.start = i * gst.SECOND
+        timeline_object.duration = gst.SECOND
+    timeline.enableUpdates()
+
+    return timeline
+
+
+def main(args):
+    n_clips = int(args[0]) if args else 2000
+    max_bytes = int(args[1]) if len(args) > 1 else MAX_MODEL_BYTES
+
+    gc.collect()
+    rss_before = getResidentSize()
+    timeline = makeTimeline(n_clips)
+    gc.collect()
+    rss_after = getResidentSize()
+
+    model_size = getModelSize(timeline.timeline_objects)
+    model_per_clip = model_size / n_clips
+
+    print "clips:                 %d" % n_clips
+    print "model bytes per clip:  %d" % model_per_clip
+    if rss_before is not None:
+        print "resident bytes per clip: %d" % \
+                ((rss_after - rss_before) / n_clips)
+
+    if model_per_clip > max_bytes:
+        print "model bytes per clip above %d" % max_bytes
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,217 @@
+# PiTiVi , Non-linear video editor
+#
+#       tests/bench_signallable.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+"""
+Micro-benchmark of L{Signallable} connect/disconnect/emit, compared to the
+previous list based implementation.
+
+Run with: PYTHONPATH=.. python bench_signallable.py [objects] [handlers]
+"""
+
+import gc
+import sys
+import time
+from random import randint
+
+from pitivi.signalinterface import Signallable
+
+
+class ListSignalGroup:
+    """
+    The previous SignalGroup implementation, kept as a reference: random ids,
+    handler lists and a copy of the handlers, args and kwargs on each
+    emission.
+    """
+    def __init__(self, signallable):
+        self.siglist = signallable.get_signals()
+        self.ids = {}
+        self.callback_ids = {}
+        self.handlers = {}
+        for signame in self.siglist.keys():
+            self.handlers[signame] = []
+
+    def connect(self, signame, cb, args, kwargs):
+        if not signame in self.handlers.keys():
+            raise Exception("Signal %s is not one of %s" % (signame,
+            ",\n\t".join(self.handlers.keys())))
+        if not callable(cb):
+            raise Exception("Provided callable '%r' is not callable" % cb)
+
+        uuid = randint(0, 2 ** 64)
+        while uuid in self.ids:
+            uuid = randint(0, 2 ** 64)
+
+        self.ids[uuid] = (cb, args, kwargs)
+        self.callback_ids.setdefault(cb, []).append(uuid)
+        self.handlers[signame].append(uuid)
+        return uuid
+
+    def disconnect(self, sigid):
+        try:
+            cb = self.ids[sigid][0]
+            del self.ids[sigid]
+        except KeyError:
+            raise Exception("unknown signal id")
+
+        for lists in self.handlers.itervalues():
+            try:
+                lists.remove(sigid)
+            except ValueError:
+                continue
+
+            self.callback_ids.get(cb, []).remove(sigid)
+
+    def disconnect_by_function(self, function):
+        try:
+            sig_ids = self.callback_ids[function]
+        except KeyError:
+            raise Exception("function is not a known callback")
+
+        for sigid in list(sig_ids):
+            self.disconnect(sigid)
+
+        del self.callback_ids[function]
+
+    def emit(self, signame, *args, **kwargs):
+        res = None
+        signame_handlers = list(self.handlers[signame])
+        for sigid in signame_handlers:
+            if sigid not in self.handlers[signame]:
+                continue
+            cb, orar, kwar = self.ids[sigid]
+            ar = args[:] + orar
+            kw = kwargs.copy()
+            kw.update(kwar)
+            res = cb(*ar, **kw)
+        return res
+
+
+class Clip(Signallable):
+    __signals__ = {
+        'start-changed': ['start'],
+        'duration-changed': ['duration'],
+        'in-point-changed': ['in-point'],
+        'priority-changed': ['priority'],
+        'selected-changed': ['state'],
+    }
+
+
+class ListClip(Clip):
+    SignalGroup = ListSignalGroup
+
+
+class Listener(object):
+    def startChangedCb(self, clip, start):
+        pass
+
+    def durationChangedCb(self, clip, duration):
+        pass
+
+    def selectedChangedCb(self, clip, state):
+        pass
+
+
+def benchConnectDisconnect(klass, n_objects):
+    """
+    Connect a few handlers to many objects, then disconnect them, like
+    loading and deleting many clips.
+    """
+    listener = Listener()
+    objs = [klass() for i in xrange(n_objects)]
+    begin = time.time()
+    for obj in objs:
+        obj.connect('start-changed', listener.startChangedCb)
+        obj.connect('duration-changed', listener.durationChangedCb)
+        obj.connect('selected-changed', listener.selectedChangedCb)
+    for obj in objs:
+        obj.disconnect_by_func(listener.startChangedCb)
+        obj.disconnect_by_func(listener.durationChangedCb)
+        obj.disconnect_by_func(listener.selectedChangedCb)
+    return time.time() - begin
+
+
+def benchManyHandlers(klass, n_handlers):
+    """
+    Connect many handlers to a single object and disconnect them by id in
+    connection order.
+    """
+    listener = Listener()
+    obj = klass()
+    begin = time.time()
+    ids = [obj.connect('start-changed', listener.startChangedCb)
+            for i in xrange(n_handlers)]
+    for sigid in ids:
+        obj.disconnect(sigid)
+    return time.time() - begin
+
+
+def benchMassDisconnect(klass, n_handlers):
+    """
+    Connect many handlers to a single object and disconnect them by id from
+    the last one, emitting after each hundred disconnections, like deleting
+    a selection of clips listening to the timeline.
+    """
+    listener = Listener()
+    obj = klass()
+    ids = [obj.connect('start-changed', listener.startChangedCb)
+            for i in xrange(n_handlers)]
+    begin = time.time()
+    for i, sigid in enumerate(reversed(ids)):
+        obj.disconnect(sigid)
+        if not i % 100:
+            obj.emit('start-changed', i)
+    return time.time() - begin
+
+
+def benchEmit(klass, n_emissions):
+    """Emit a signal with three connected handlers."""
+    listener = Listener()
+    obj = klass()
+    obj.connect('start-changed', listener.startChangedCb)
+    obj.connect('start-changed', listener.startChangedCb)
+    obj.connect('start-changed', listener.startChangedCb)
+    begin = time.time()
+    for i in xrange(n_emissions):
+        obj.emit('start-changed', i)
+    return time.time() - begin
+
+
+def report(name, bench, count):
+    gc.collect()
+    old = bench(ListClip, count)
+    gc.collect()
+    new = bench(Clip, count)
+    print "%-24s %8d %10.4fs %10.4fs %8.1fx" % (name, count, old, new,
+            old / max(new, 1e-9))
+
+
+def main(args):
+    n_objects = int(args[0]) if args else 20000
+    n_handlers = int(args[1]) if len(args) > 1 else 20000
+
+    print "%-24s %8s %11s %11s %9s" % ("benchmark", "count", "list",
+            "current", "speedup")
+    report("connect/disconnect", benchConnectDisconnect, n_objects)
+    report("many handlers", benchManyHandlers, n_handlers)
+    # quadratic with the list implementation
+    report("mass disconnect", benchMassDisconnect, n_handlers / 10)
+    report("emit", benchEmit, n_objects * 5)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
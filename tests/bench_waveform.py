@@ -0,0 +1,144 @@
+# PiTiVi , Non-linear video editor
+#
+#       tests/bench_waveform.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+"""
+Benchmark of the plotting of a waveform segment, compared to the previous
+implementation reducing each pixel column with a python loop. The samples
+are now reduced to columns by the sink, the benchmark includes the
+reduction.
+
+Run with: PYTHONPATH=.. python bench_waveform.py [seconds] [rate] [channels]
+"""
+
+import array
+import math
+import sys
+import time
+
+import cairo
+
+import pitivi.peaks
+from pitivi.peaks import extrema
+from pitivi.ui.previewer import RandomAccessAudioPreviewer
+from pitivi.ui.zoominterface import Zoomable
+
+
+class StubArraySink(object):
+    def __init__(self, samples, channels):
+        self.samples = samples
+        self.channels = channels
+
+
+class StubPreviewer(object):
+    theight = 50
+
+    def __init__(self, samples, channels):
+        self.audioSink = StubArraySink(samples, channels)
+
+
+def loopPlotWaveform(self, cr, base_width):
+    """
+    The previous implementation of L{RandomAccessAudioPreviewer._plotWaveform}
+    kept as a reference.
+    """
+    cr.set_source_rgba(1, 1, 1, 0.0)
+    cr.rectangle(0, 0, base_width, self.theight)
+    cr.fill()
+
+    samples = self.audioSink.samples
+
+    if not samples:
+        return
+
+    spp = len(samples) / base_width
+    if spp == 0:
+        spp = 1
+    channels = self.audioSink.channels
+    stride = spp * channels
+    hscale = self.theight / (2 * channels)
+
+    chan = 0
+    y = hscale
+    while chan < channels:
+        i = chan
+        x = 0
+        while i < len(samples):
+            slice = samples[i:i + stride:channels]
+            min_ = min(slice)
+            max_ = max(slice)
+            cr.move_to(x, y - (min_ * hscale))
+            cr.line_to(x, y - (max_ * hscale))
+            i += spp
+            x += 1
+        y += 2 * hscale
+        chan += 1
+
+    cr.set_source_rgba(0, 0, 0, 1.0)
+    cr.stroke()
+
+
+def makeSegment(seconds, rate, channels):
+    samples = array.array("f")
+    for i in xrange(seconds * rate):
+        value = math.sin(i * 0.01)
+        for chan in xrange(channels):
+            samples.append(value)
+    return samples
+
+
+def benchPlot(plot, samples, channels):
+    base_width = int(Zoomable.max_zoom)
+    previewer = StubPreviewer(samples, channels)
+    surface = cairo.ImageSurface(cairo.FORMAT_A8, base_width,
+            previewer.theight)
+    cr = cairo.Context(surface)
+    begin = time.time()
+    plot(previewer, cr, base_width)
+    return time.time() - begin
+
+
+def main(args):
+    seconds = int(args[0]) if args else 30
+    rate = int(args[1]) if len(args) > 1 else 48000
+    channels = int(args[2]) if len(args) > 2 else 1
+
+    samples = makeSegment(seconds, rate, channels)
+    current_plot = RandomAccessAudioPreviewer._plotWaveform.im_func
+
+    def plot(previewer, cr, base_width):
+        # the reduction done by WaveformSink, then the plotting
+        sink = previewer.audioSink
+        spp = max(1, len(sink.samples) / (base_width * sink.channels))
+        mins, maxs = extrema(sink.samples, sink.channels, spp)
+        current_plot(previewer, cr, base_width, mins, maxs, sink.channels)
+
+    print "%d s segment, %d Hz, %d channels" % (seconds, rate, channels)
+    loop = benchPlot(loopPlotWaveform, samples, channels)
+    print "%-20s %10.4fs" % ("python loop", loop)
+    if pitivi.peaks.HAVE_NUMPY:
+        current = benchPlot(plot, samples, channels)
+        print "%-20s %10.4fs %8.1fx" % ("numpy", current,
+                loop / max(current, 1e-9))
+    pitivi.peaks.HAVE_NUMPY = False
+    current = benchPlot(plot, samples, channels)
+    print "%-20s %10.4fs %8.1fx" % ("without numpy", current,
+            loop / max(current, 1e-9))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
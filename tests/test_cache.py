@@ -26,5 +26,82 @@ class CacheTest(TestCase):
         assert 32 in c
         assert not 33 in c
 
+    def testOverwrite(self):
+        c = ThumbnailCache(size=2)
+        c[1] = 1
+        c[2] = 2
+        # overwriting doesn't add another entry for the key
+        c[1] = 1
+        c[1] = 1
+        self.failUnlessEqual(len(c), 2)
+        self.failUnless(2 in c)
+
+        c[3] = 3
+        self.failIf(2 in c)
+        self.failUnless(1 in c)
+
+    def testBytes(self):
+        c = ThumbnailCache(max_bytes=10, sizeof=len)
+        c["a"] = "xxxx"
+        c["b"] = "xxxx"
+        self.failUnlessEqual(c.bytes, 8)
+
+        c["a"]
+        c["c"] = "xxxx"
+        self.failUnlessEqual(c.bytes, 8)
+        self.failUnlessEqual(c.evictions, 1)
+        self.failIf("b" in c)
+
+        # an entry bigger than the budget evicts everything else
+        c["d"] = "x" * 20
+        self.failUnlessEqual(len(c), 1)
+        self.failUnlessEqual(c.bytes, 20)
+
+    def testCounters(self):
+        c = ThumbnailCache(size=10)
+        c[1] = 1
+        self.failUnlessEqual(c.get(1), 1)
+        self.failUnlessEqual(c.get(2), None)
+        self.failUnless(1 in c)
+        self.failUnlessEqual((c.hits, c.misses, c.evictions), (2, 1, 0))
+
+    def testViews(self):
+        c = ThumbnailCache(max_bytes=10, sizeof=len)
+        view1 = c.getView("factory1")
+        view2 = c.getView("factory2", "stream")
+        view1[0] = "xxx"
+        view2[0] = "xx"
+        self.failUnlessEqual(view1[0], "xxx")
+        self.failUnlessEqual(view2.get(0), "xx")
+        self.failUnlessEqual(c.getOwnerBytes("factory1"), 3)
+        self.failUnlessEqual(c.getOwnerBytes("factory2"), 2)
+
+        view1[1] = "xxxx"
+        self.failUnlessEqual(c.getOwnerBytes("factory1"), 7)
+        c.removeOwner("factory1")
+        self.failIf(0 in view1)
+        self.failUnlessEqual(c.getOwnerBytes("factory1"), 0)
+        self.failUnlessEqual(c.bytes, 2)
+        self.failUnless(0 in view2)
+
+    def testQuality(self):
+        c = ThumbnailCache(max_bytes=10, sizeof=len)
+        view = c.getView("factory")
+        self.failUnless(view.put(0, "coarse", 0))
+        self.failUnlessEqual(view.getQuality(0), 0)
+
+        # a better value replaces the previous one, but not a worse one
+        self.failUnless(view.put(0, "exact", 1))
+        self.failIf(view.put(0, "bad", 0))
+        self.failUnlessEqual(view[0], "exact")
+        self.failUnlessEqual(view.getQuality(0), 1)
+        self.failUnlessEqual(c.bytes, 5)
+
+        # untagged values always replace the previous one
+        view[0] = "x"
+        self.failUnlessEqual(view.getQuality(0), None)
+        self.failUnless(view.put(0, "xx", 0))
+        self.failUnlessEqual(view.getQuality(1), None)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,33 @@
+from common import TestCase
+from pitivi.discoverbench import DiscoveryBenchmark, TIMEOUT_ERROR
+from pitivi.factories.file import FileSourceFactory
+
+
+class TestDiscoveryBenchmark(TestCase):
+
+    def testSummary(self):
+        uris = ["file:///%d" % i for i in xrange(4)]
+        benchmark = DiscoveryBenchmark(uris)
+        benchmark.start = benchmark._last = 0
+
+        discoverer = benchmark.discoverer
+        discoverer.emit("discovery-done", uris[0], FileSourceFactory(uris[0]))
+        discoverer.emit("discovery-error", uris[1], "error", None)
+        discoverer.emit("discovery-error", uris[2], TIMEOUT_ERROR, None)
+        discoverer.emit("discovery-done", uris[3], FileSourceFactory(uris[3]))
+        benchmark.end = benchmark.start + 2
+
+        self.failUnlessEqual([result["result"] for result in benchmark.results],
+                ["done", "error", "timeout", "done"])
+        summary = benchmark.getSummary()
+        self.failUnlessEqual(summary["files"], 4)
+        self.failUnlessEqual(summary["errors"], 1)
+        self.failUnlessEqual(summary["timeouts"], 1)
+        self.failUnlessEqual(summary["time"], 2)
+        self.failUnlessEqual(summary["files_per_second"], 2.0)
+
+    def testNothingToDiscover(self):
+        benchmark = DiscoveryBenchmark([])
+        benchmark.run()
+        self.failUnlessEqual(benchmark.results, [])
+        self.failUnlessEqual(benchmark.getSummary()["files"], 0)
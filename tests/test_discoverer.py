@@ -25,7 +25,7 @@ gobject.threads_init()
 import gst
 
 from common import TestCase
-from pitivi.discoverer import Discoverer
+from pitivi.discoverer import Discoverer, ConcurrentDiscoverer
 from pitivi.factories.file import FileSourceFactory, PictureFileSourceFactory
 
 
@@ -75,6 +75,88 @@ class TestAnalysisQueue(TestCase):
         self.failUnlessEqual(discoverer.analysis_scheduled, 0)
 
 
+class StubChildDiscoverer(Discoverer):
+    def _scheduleAnalysis(self):
+        pass
+
+    def finish(self, error=None):
+        uri = self.queue[0]
+        if error is None:
+            self.emit("discovery-done", uri, FileSourceFactory(uri))
+        else:
+            self.emit("discovery-error", uri, error, None)
+        self._finishAnalysisAfterResult()
+
+
+class StubConcurrentDiscoverer(ConcurrentDiscoverer):
+    discovererClass = StubChildDiscoverer
+
+
+class TestConcurrentDiscoverer(TestCase):
+    def setUp(self):
+        TestCase.setUp(self)
+        self.results = []
+        self.signals = []
+
+    def tearDown(self):
+        self.results = None
+        self.signals = None
+        TestCase.tearDown(self)
+
+    def _makeDiscoverer(self, concurrency, ordered=True):
+        discoverer = StubConcurrentDiscoverer(concurrency, ordered)
+        discoverer.connect("discovery-done", self._discoveryDoneCb)
+        discoverer.connect("discovery-error", self._discoveryErrorCb)
+        discoverer.connect("starting", self._signalCb, "starting")
+        discoverer.connect("ready", self._signalCb, "ready")
+        return discoverer
+
+    def _discoveryDoneCb(self, discoverer, uri, factory):
+        self.results.append(uri)
+
+    def _discoveryErrorCb(self, discoverer, uri, error, detail):
+        self.results.append((uri, error))
+
+    def _signalCb(self, discoverer, name):
+        self.signals.append(name)
+
+    def _running(self, discoverer):
+        return sorted([child.queue[0] for child in discoverer.discoverers
+                if child.queue])
+
+    def testConcurrency(self):
+        discoverer = self._makeDiscoverer(2)
+        discoverer.addUris(["a", "b", "c"])
+        self.failUnlessEqual(self.signals, ["starting"])
+        self.failUnlessEqual(self._running(discoverer), ["a", "b"])
+        self.failUnlessEqual(discoverer.queue, ["c"])
+
+        # the results are emitted in order
+        second = discoverer.discoverers[1]
+        second.finish()
+        self.failUnlessEqual(self.results, [])
+        self.failUnlessEqual(self._running(discoverer), ["a", "c"])
+
+        discoverer.discoverers[0].finish(error="meh")
+        self.failUnlessEqual(self.results, [("a", "meh"), "b"])
+        self.failUnless(discoverer.working)
+
+        second.finish()
+        self.failUnlessEqual(self.results, [("a", "meh"), "b", "c"])
+        self.failIf(discoverer.working)
+        self.failUnlessEqual(self.signals, ["starting", "ready"])
+        self.failUnlessEqual(len(discoverer.discoverers), 2)
+
+    def testUnordered(self):
+        discoverer = self._makeDiscoverer(2, ordered=False)
+        discoverer.addUris(["a", "b"])
+        discoverer.discoverers[1].finish()
+        self.failUnlessEqual(self.results, ["b"])
+        discoverer.discoverers[0].finish()
+        self.failUnlessEqual(self.results, ["b", "a"])
+        self.failUnlessEqual(self.signals, ["starting", "ready"])
+
+
 class Discoverer1(Discoverer):
     use_decodebin2 = True
     timeout_scheduled = False
@@ -19,6 +19,8 @@
 # Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
 # Boston, MA 02110-1301, USA.
 
+import os
+import tempfile
 from unittest import TestCase
 import gst
 from xml.etree.ElementTree import Element, SubElement
@@ -433,6 +435,15 @@ class TestFormatterLoad(TestCase):
         self.failUnlessEqual(str(stream.caps), str(caps))
         self.failUnlessEqual(stream, self.formatter._context.streams["1"])
 
+    def testLoadImageStream(self):
+        stream = VideoStream(gst.Caps("video/x-raw-rgb"), "src0", True)
+        stream.thumbnail = "/tmp/thumbnail.png"
+        element = self.formatter._saveStream(stream)
+
+        loaded = self.formatter._loadStream(element)
+        self.failUnless(loaded.is_image)
+        self.failUnlessEqual(loaded.thumbnail, "/tmp/thumbnail.png")
+
     def testLoadTrackEffect(self):
         # create fake document tree
         element = Element("track-object",\
@@ -758,6 +769,42 @@ class TestFormatterLoad(TestCase):
         f.write(tostring(element))
         f.close()
 
+    def testLoadProjectFromStreams(self):
+        fd, path = tempfile.mkstemp(suffix=".ogg")
+        os.close(fd)
+        fd, project_path = tempfile.mkstemp(suffix=".xptv")
+        os.close(fd)
+        try:
+            uri = "file://" + path
+            video_stream = VideoStream(gst.Caps("video/x-raw-yuv"), "src0")
+            source = FileSourceFactory(uri)
+            source.duration = 10 * gst.SECOND
+            source.addOutputStream(video_stream)
+            project = Project()
+            project.sources.addFactory(source)
+            self.formatter._saveProject(project, "file://" + project_path)
+
+            formatter = FakeElementTreeFormatter(EffectsHandler())
+            loaded = []
+
+            def loadedCb(formatter, project):
+                loaded.append(project)
+
+            formatter.connect("new-project-loaded", loadedCb)
+            formatter.loadProject("file://" + project_path)
+
+            # the project is loaded without waiting for the discoverer
+            self.failUnlessEqual(len(loaded), 1)
+            source, = loaded[0].sources.getSources()
+            self.failUnlessEqual(source.uri, uri)
+            self.failUnlessEqual(source.duration, 10 * gst.SECOND)
+            stream, = source.getOutputStreams()
+            self.failUnlessEqual(stream.caps, video_stream.caps)
+            self.failUnless(uri in loaded[0].sources._validating)
+        finally:
+            os.unlink(path)
+            os.unlink(project_path)
+
     ## following test is disabled until I figure out a better way of
     ## testing the mapping system.
 #     def testDirectoryMapping(self):
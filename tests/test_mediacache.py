@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+
+import gst
+
+from common import TestCase
+from pitivi.mediacache import MediaInfoCache
+from pitivi.factories.file import FileSourceFactory, PictureFileSourceFactory
+from pitivi.stream import AudioStream, VideoStream
+from pitivi.discoverer import Discoverer
+
+
+class StubDiscoverer(Discoverer):
+    def _scheduleAnalysis(self):
+        pass
+
+
+class TestMediaInfoCache(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "clip.ogg")
+        self.uri = "file://" + self.path
+        self._writeClip("clip data")
+        self.cache = MediaInfoCache(os.path.join(self.directory, "media"))
+
+    def tearDown(self):
+        del self.cache
+        shutil.rmtree(self.directory)
+        TestCase.tearDown(self)
+
+    def _writeClip(self, data, mtime=1000):
+        clip = open(self.path, "wb")
+        clip.write(data)
+        clip.close()
+        os.utime(self.path, (mtime, mtime))
+
+    def _makeFactory(self):
+        factory = FileSourceFactory(self.uri)
+        factory.duration = 10 * gst.SECOND
+        factory.addOutputStream(AudioStream(
+                gst.Caps("audio/x-raw-int, rate=(int)44100"), "src0"))
+        video = VideoStream(gst.Caps("video/x-raw-yuv, width=(int)320"),
+                "src1")
+        video.thumbnail = self.path
+        factory.addOutputStream(video)
+        return factory
+
+    def testPutGet(self):
+        self.failUnlessEqual(self.cache.get(self.uri), None)
+        self.cache.put(self._makeFactory())
+
+        factory = self.cache.getFactory(self.uri)
+        self.failUnlessEqual(factory.__class__, FileSourceFactory)
+        self.failUnlessEqual(factory.uri, self.uri)
+        self.failUnlessEqual(factory.duration, 10 * gst.SECOND)
+        audio, video = factory.getOutputStreams()
+        self.failUnless(isinstance(audio, AudioStream))
+        self.failUnlessEqual(audio.pad_name, "src0")
+        self.failUnlessEqual(audio.caps,
+                gst.Caps("audio/x-raw-int, rate=(int)44100"))
+        self.failUnless(isinstance(video, VideoStream))
+        self.failIf(video.is_image)
+        self.failUnlessEqual(video.thumbnail, self.path)
+
+    def testImage(self):
+        factory = PictureFileSourceFactory(self.uri)
+        factory.addOutputStream(VideoStream(gst.Caps("video/x-raw-rgb"),
+                is_image=True))
+        self.cache.put(factory)
+
+        factory = self.cache.getFactory(self.uri)
+        self.failUnlessEqual(factory.__class__, PictureFileSourceFactory)
+        stream, = factory.getOutputStreams()
+        self.failUnless(stream.is_image)
+        self.failUnlessEqual(stream.pad_name, None)
+        self.failUnlessEqual(stream.thumbnail, None)
+
+    def testStale(self):
+        self.cache.put(self._makeFactory())
+        filename = self.cache.getFilename(self.uri)
+
+        # a modified file is discovered again
+        self._writeClip("clip data", mtime=2000)
+        self.failUnlessEqual(self.cache.get(self.uri), None)
+        self.failIf(os.path.exists(filename))
+
+        self.cache.put(self._makeFactory())
+        self._writeClip("other clip data", mtime=2000)
+        self.failUnlessEqual(self.cache.get(self.uri), None)
+
+        self.cache.put(self._makeFactory())
+        os.unlink(self.path)
+        self.failUnlessEqual(self.cache.get(self.uri), None)
+
+    def testCorrupted(self):
+        self.cache.put(self._makeFactory())
+        filename = self.cache.getFilename(self.uri)
+        mediafile = open(filename, "w")
+        mediafile.write("<media")
+        mediafile.close()
+        self.failUnlessEqual(self.cache.get(self.uri), None)
+        self.failIf(os.path.exists(filename))
+
+    def testInvalidTypes(self):
+        filename = self.cache.getFilename(self.uri)
+        for old, new in [
+                ("pitivi.factories.file.FileSourceFactory", "os.sep"),
+                ("pitivi.factories.file.FileSourceFactory",
+                    "pitivi.stream.VideoStream"),
+                ("pitivi.factories.file.FileSourceFactory",
+                    "pitivi.nonexistent.Factory"),
+                ("pitivi.stream.AudioStream", "os.path.join"),
+                ("pitivi.stream.AudioStream", "pitivi.stream.MultimediaStream")]:
+            self.cache.put(self._makeFactory())
+            mediafile = open(filename)
+            data = mediafile.read()
+            mediafile.close()
+            self.failUnless(old in data)
+            mediafile = open(filename, "w")
+            mediafile.write(data.replace(old, new))
+            mediafile.close()
+
+            # the entry is dropped without reaching the discovery
+            self.failUnlessEqual(self.cache.get(self.uri), None)
+            self.failIf(os.path.exists(filename))
+
+    def testInvalidate(self):
+        other = os.path.join(self.directory, "other.ogg")
+        shutil.copy(self.path, other)
+        self.cache.put(self._makeFactory())
+        self.cache.put(FileSourceFactory("file://" + other))
+
+        self.cache.invalidate(self.uri)
+        self.failUnlessEqual(self.cache.get(self.uri), None)
+        self.failIfEqual(self.cache.get("file://" + other), None)
+
+        self.cache.invalidate()
+        self.failUnlessEqual(self.cache.get("file://" + other), None)
+        self.failUnlessEqual(os.listdir(self.cache.directory), [])
+
+    def testDiscoverer(self):
+        self.cache.put(self._makeFactory())
+        discoverer = StubDiscoverer(media_cache=self.cache)
+        results = []
+
+        def doneCb(discoverer, uri, factory):
+            results.append(factory)
+
+        discoverer.connect("discovery-done", doneCb)
+        discoverer.addUri(self.uri)
+        # the file isn't analyzed
+        discoverer._analyze()
+        self.failUnlessEqual(discoverer.pipeline, None)
+        self.failIf(discoverer.queue)
+        self.failIf(discoverer.working)
+        self.failUnlessEqual(len(results), 1)
+        self.failUnlessEqual(len(results[0].getOutputStreams()), 2)
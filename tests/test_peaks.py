@@ -0,0 +1,187 @@
+import array
+import os
+import shutil
+import tempfile
+import threading
+
+from common import TestCase
+import pitivi.peaks
+from pitivi.peaks import PeakBuilder, Peaks, PeakStore, quantize, \
+        quantize_all, extrema
+
+
+def make_samples(count, channels):
+    samples = array.array("f")
+    for i in xrange(count):
+        for chan in xrange(channels):
+            samples.append(((i * 7 + chan * 13) % 200 - 100) / 100.0)
+    return samples
+
+
+class TestExtrema(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.have_numpy = pitivi.peaks.HAVE_NUMPY
+
+    def tearDown(self):
+        pitivi.peaks.HAVE_NUMPY = self.have_numpy
+        TestCase.tearDown(self)
+
+    def _reference(self, samples, channels, spp):
+        mins = []
+        maxs = []
+        end = len(samples) - len(samples) % channels
+        for i in xrange(0, end, spp * channels):
+            for chan in xrange(channels):
+                hunk = samples[i + chan:min(i + spp * channels, end):channels]
+                mins.append(min(hunk))
+                maxs.append(max(hunk))
+        return mins, maxs
+
+    def _checkExtrema(self):
+        for channels in (1, 2, 3):
+            for count, spp in ((0, 4), (1, 4), (100, 1), (100, 7),
+                    (1000, 64), (1000, 1000), (1000, 2000)):
+                samples = make_samples(count, channels)
+                # a trailing incomplete frame is ignored
+                samples.append(0.5)
+                mins, maxs = extrema(samples, channels, spp)
+                self.failUnlessEqual(mins.typecode, "f")
+                self.failUnlessEqual((list(mins), list(maxs)),
+                        self._reference(samples, channels, spp))
+
+        values = array.array("f", [-1.5, -1.0, -0.5, -0.004, 0.0, 0.5,
+                0.25, 1.0, 2.0])
+        self.failUnlessEqual(quantize_all(values),
+                array.array("b", map(quantize, values)))
+
+    def testExtrema(self):
+        self._checkExtrema()
+
+    def testExtremaWithoutNumpy(self):
+        pitivi.peaks.HAVE_NUMPY = False
+        self._checkExtrema()
+
+
+class TestPeakBuilder(TestCase):
+
+    def _reference(self, samples, channels, spp):
+        mins = array.array("b")
+        maxs = array.array("b")
+        block = spp * channels
+        for i in xrange(0, len(samples), block):
+            for chan in xrange(channels):
+                hunk = samples[i + chan:i + block:channels]
+                mins.append(quantize(min(hunk)))
+                maxs.append(quantize(max(hunk)))
+        return mins, maxs
+
+    def testLevels(self):
+        channels = 2
+        samples = make_samples(1000, channels)
+        builder = PeakBuilder(44100, channels, levels=(4, 16, 64))
+        builder.addSamples(samples)
+        peaks = builder.finish()
+
+        self.failUnlessEqual(peaks.rate, 44100)
+        self.failUnlessEqual(peaks.channels, channels)
+        self.failUnlessEqual([level.spp for level in peaks.levels],
+                [4, 16, 64])
+        for level in peaks.levels:
+            mins, maxs = self._reference(samples, channels, level.spp)
+            self.failUnlessEqual(level.mins, mins)
+            self.failUnlessEqual(level.maxs, maxs)
+        self.failUnlessEqual(peaks.getCount(peaks.levels[0]), 250)
+        # the last block is incomplete
+        self.failUnlessEqual(peaks.getCount(peaks.levels[2]), 16)
+
+    def testChunks(self):
+        samples = make_samples(1001, 1)
+        builder = PeakBuilder(44100, 1, levels=(8, 32))
+        builder.addSamples(samples)
+        whole = builder.finish()
+
+        builder = PeakBuilder(44100, 1, levels=(8, 32))
+        for i in xrange(0, len(samples), 5):
+            builder.addSamples(samples[i:i + 5])
+        chunked = builder.finish()
+
+        for level, other in zip(whole.levels, chunked.levels):
+            self.failUnlessEqual(level.mins, other.mins)
+            self.failUnlessEqual(level.maxs, other.maxs)
+
+    def testGetLevel(self):
+        builder = PeakBuilder(44100, 1, levels=(256, 1024, 4096))
+        builder.addSamples(make_samples(10000, 1))
+        peaks = builder.finish()
+
+        self.failUnlessEqual(peaks.getLevel(100), None)
+        self.failUnlessEqual(peaks.getLevel(200).spp, 256)
+        self.failUnlessEqual(peaks.getLevel(600).spp, 1024)
+        self.failUnlessEqual(peaks.getLevel(3000).spp, 4096)
+        self.failUnlessEqual(peaks.getLevel(1000000).spp, 4096)
+
+
+class TestPeakStore(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "clip.ogg")
+        self.uri = "file://" + self.path
+        clip = open(self.path, "wb")
+        clip.write("clip data")
+        clip.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        TestCase.tearDown(self)
+
+    def testSaveLoad(self):
+        builder = PeakBuilder(48000, 2, levels=(4, 16))
+        builder.addSamples(make_samples(100, 2))
+        peaks = builder.finish()
+
+        store = PeakStore(os.path.join(self.directory, "peaks"))
+        self.failUnlessEqual(store.load(self.uri, self.path), None)
+        store._save(peaks, store.getFilename(self.uri, self.path))
+
+        loaded = store.load(self.uri, self.path)
+        self.failUnlessEqual(loaded.rate, 48000)
+        self.failUnlessEqual(loaded.channels, 2)
+        self.failUnlessEqual(len(loaded.levels), 2)
+        for level, other in zip(peaks.levels, loaded.levels):
+            self.failUnlessEqual(level.spp, other.spp)
+            self.failUnlessEqual(level.mins, other.mins)
+            self.failUnlessEqual(level.maxs, other.maxs)
+
+        # a truncated file is ignored
+        filename = store.getFilename(self.uri, self.path)
+        peakfile = open(filename, "r+b")
+        peakfile.truncate(os.path.getsize(filename) - 1)
+        peakfile.close()
+        self.failUnlessEqual(Peaks.load(filename), None)
+
+        # the peaks of a modified file are not used
+        os.utime(self.path, (1000, 1000))
+        self.failIfEqual(store.getFilename(self.uri, self.path), filename)
+        self.failUnlessEqual(store.load(self.uri, self.path), None)
+
+    def testRead(self):
+        builder = PeakBuilder(48000, 1, levels=(4,))
+        builder.addSamples(make_samples(100, 1))
+        store = PeakStore(os.path.join(self.directory, "peaks"))
+        store._save(builder.finish(), store.getFilename(self.uri, self.path))
+
+        loaded = []
+        done = threading.Event()
+
+        def callback(peaks):
+            loaded.append(peaks)
+            done.set()
+
+        store.read(self.uri, self.path, callback)
+        done.wait(10)
+        self.failUnlessEqual(len(loaded), 1)
+        self.failUnlessEqual(loaded[0].levels[0].spp, 4)
@@ -191,6 +191,86 @@ class TestSignalisation(unittest.TestCase):
         self.assertFalse(self.called)
         del self.called
 
+    def test_connect_while_handling(self):
+        # Handlers connected while emitting are called on the next emission,
+        # all handlers are called in connection order.
+        calls = []
+
+        def firstCb(unused_object):
+            calls.append("first")
+            self.object.connect("signal-noargs", thirdCb)
+
+        def secondCb(unused_object):
+            calls.append("second")
+
+        def thirdCb(unused_object):
+            calls.append("third")
+
+        first_id = self.object.connect("signal-noargs", firstCb)
+        self.object.connect("signal-noargs", secondCb)
+        self.object.emit_signal_no_args()
+        self.assertEquals(calls, ["first", "second"])
+
+        self.object.disconnect(first_id)
+        del calls[:]
+        self.object.emit_signal_no_args()
+        self.assertEquals(calls, ["second", "third"])
+
+    def test_disconnect_many(self):
+        # the remaining handlers are called in connection order, also when
+        # all of them were disconnected and new ones connected
+        calls = []
+
+        def cb(unused_object, index):
+            calls.append(index)
+
+        ids = [self.object.connect("signal-noargs", cb, index)
+                for index in xrange(10)]
+        for sigid in ids[::2]:
+            self.object.disconnect(sigid)
+        self.object.emit_signal_no_args()
+        self.assertEquals(calls, [1, 3, 5, 7, 9])
+
+        for sigid in ids[1::2]:
+            self.object.disconnect(sigid)
+        self.assertRaises(Exception, self.object.disconnect, ids[1])
+        del calls[:]
+        self.object.emit_signal_no_args()
+        self.assertEquals(calls, [])
+
+        self.object.connect("signal-noargs", cb, 10)
+        self.object.emit_signal_no_args()
+        self.assertEquals(calls, [10])
+
+    def test_emit_while_handling(self):
+        # a nested emission of the same signal sees the handlers connected
+        # and disconnected by the outer one
+        calls = []
+        nested = [True]
+
+        def firstCb(unused_object):
+            calls.append("first")
+            if nested:
+                nested.pop()
+                self.object.disconnect(second_id)
+                self.object.connect("signal-noargs", thirdCb)
+                self.object.emit_signal_no_args()
+
+        def secondCb(unused_object):
+            calls.append("second")
+
+        def thirdCb(unused_object):
+            calls.append("third")
+
+        self.object.connect("signal-noargs", firstCb)
+        second_id = self.object.connect("signal-noargs", secondCb)
+        self.object.emit_signal_no_args()
+        self.assertEquals(calls, ["first", "first", "third"])
+
+        del calls[:]
+        self.object.emit_signal_no_args()
+        self.assertEquals(calls, ["first", "third"])
+
     def test04_emit01(self):
         # signal: no arguments
         # connect: no arguments
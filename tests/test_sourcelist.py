@@ -19,10 +19,12 @@
 # Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
 # Boston, MA 02110-1301, USA.
 
+import gst
 from unittest import TestCase
 from pitivi.sourcelist import SourceList, SourceListError
 from pitivi.discoverer import Discoverer
 from pitivi.factories.file import FileSourceFactory
+from pitivi.stream import AudioStream
 
 
 class FakeDiscoverer(Discoverer):
@@ -99,3 +101,46 @@ class TestSourceList(TestCase):
 
         # there was an error, the factory wasn't added so this should raise
         self.failUnlessRaises(SourceListError, self.sourcelist.getUri, uri)
+
+    def _makeFactory(self, uri, duration, caps="audio/x-raw-int"):
+        factory = FileSourceFactory(uri)
+        factory.duration = duration
+        factory.addOutputStream(AudioStream(gst.Caps(caps), "src0"))
+        return factory
+
+    def testValidateFactories(self):
+        errors = []
+
+        def errorCb(sourcelist, uri, reason, extra):
+            errors.append(uri)
+
+        self.sourcelist.connect("source-changed", errorCb)
+        validator = self.sourcelist.validator
+        factories = [self._makeFactory("file:///%d" % i, 10) for i in xrange(4)]
+        for factory in factories:
+            self.sourcelist.addFactory(factory)
+        self.sourcelist.validateFactories(factories)
+
+        # unchanged
+        validator.emit("discovery-done", "file:///0",
+                self._makeFactory("file:///0", 10))
+        # longer, the duration is updated
+        validator.emit("discovery-done", "file:///1",
+                self._makeFactory("file:///1", 20))
+        # shorter, the file is flagged and the factory kept unchanged
+        validator.emit("discovery-done", "file:///2",
+                self._makeFactory("file:///2", 5))
+        # different streams
+        validator.emit("discovery-done", "file:///3",
+                self._makeFactory("file:///3", 10, "video/x-raw-yuv"))
+
+        self.failUnlessEqual(errors, ["file:///2", "file:///3"])
+        self.failUnlessEqual([factory.duration for factory in factories],
+                [10, 20, 10, 10])
+        self.failUnlessEqual(self.sourcelist.getSources(), factories)
+
+        # a missing file is flagged and kept
+        self.sourcelist.validateFactories(factories[:1])
+        validator.emit("discovery-error", "file:///0", "error", None)
+        self.failUnlessEqual(errors, ["file:///2", "file:///3", "file:///0"])
+        self.failUnlessEqual(self.sourcelist.getUri("file:///0"), factories[0])
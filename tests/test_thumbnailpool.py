@@ -0,0 +1,189 @@
+from common import TestCase
+from pitivi.thumbnailscheduler import ThumbnailScheduler
+from pitivi.thumbnailpool import ThumbnailWorkerPool
+
+
+class StubWorker(object):
+    def __init__(self, owner):
+        self.owner = owner
+        self.segment = None
+        self.destroyed = False
+        self.broken = False
+
+    def start(self, segment):
+        self.segment = segment
+        return not self.broken and segment not in self.owner.broken
+
+    def destroy(self):
+        self.destroyed = True
+
+    def finish(self, pool):
+        self.owner.done.append(self.segment)
+        self.segment = None
+        pool.release(self)
+
+
+class StubOwner(object):
+    def __init__(self, worker_bytes=10):
+        self.worker_bytes = worker_bytes
+        self.workers = []
+        self.done = []
+        self.broken = set()
+
+    def makeWorker(self):
+        worker = StubWorker(self)
+        self.workers.append(worker)
+        return worker
+
+
+class TestThumbnailWorkerPool(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.scheduler = ThumbnailScheduler()
+        self.scheduler.setViewport(0, 1000)
+
+    def tearDown(self):
+        del self.scheduler
+        TestCase.tearDown(self)
+
+    def _request(self, owner, *segments):
+        for segment in segments:
+            self.scheduler.request(owner, segment, segment, segment + 10)
+
+    def _busy(self, pool):
+        return sorted([worker.segment for worker in pool.busy])
+
+    def testParallel(self):
+        pool = ThumbnailWorkerPool(self.scheduler, max_workers=4,
+                max_workers_per_owner=2)
+        owners = [StubOwner() for i in xrange(3)]
+        for owner in owners:
+            pool.addOwner(owner)
+        self._request(owners[0], 0, 10, 20)
+        self._request(owners[1], 100, 110)
+        self._request(owners[2], 200)
+        pool.dispatch()
+
+        # two segments of the first two files, the third one waits
+        self.failUnlessEqual(self._busy(pool), [0, 10, 100, 110])
+        self.failUnlessEqual(pool.getWorkerCount(), 4)
+        self.failUnlessEqual(pool.getWorkerCount(owners[0]), 2)
+
+        # a worker is reused for the next segment of its file
+        worker = owners[0].workers[0]
+        worker.finish(pool)
+        self.failUnlessEqual(owners[0].done, [0])
+        self.failUnlessEqual(worker.segment, 20)
+        self.failUnlessEqual(len(owners[0].workers), 2)
+
+        # an idle worker of another file is replaced when the pool is full
+        owners[1].workers[0].finish(pool)
+        self.failUnless(owners[1].workers[0].destroyed)
+        self.failUnlessEqual(self._busy(pool), [10, 20, 110, 200])
+        self.failUnlessEqual(pool.getWorkerCount(owners[1]), 1)
+
+    def testUnregisteredOwner(self):
+        pool = ThumbnailWorkerPool(self.scheduler, max_workers=4)
+        owner = StubOwner()
+        self._request(owner, 0)
+        pool.dispatch()
+        self.failUnlessEqual(pool.getWorkerCount(), 0)
+        self.failUnless(self.scheduler.hasRequests(owner))
+
+    def testMemoryLimit(self):
+        pool = ThumbnailWorkerPool(self.scheduler, max_workers=10,
+                max_workers_per_owner=10, max_bytes=25)
+        owner = StubOwner(worker_bytes=10)
+        big = StubOwner(worker_bytes=100)
+        pool.addOwner(owner)
+        pool.addOwner(big)
+        self._request(owner, 0, 10, 20)
+        pool.dispatch()
+        self.failUnlessEqual(self._busy(pool), [0, 10])
+        self.failUnlessEqual(pool.bytes, 20)
+
+        # a worker over the limit on its own can run alone
+        self._request(big, 500)
+        owners_workers = list(owner.workers)
+        for worker in owners_workers:
+            worker.finish(pool)
+        self.failUnlessEqual(owner.done, [0, 10])
+        self.failUnlessEqual(self._busy(pool), [20])
+        self.failIf(big.workers)
+
+        owner.workers[0].finish(pool)
+        self.failUnlessEqual(self._busy(pool), [500])
+        self.failUnlessEqual(pool.bytes, 100)
+        self.failUnless(owner.workers[0].destroyed)
+
+    def testStartFailure(self):
+        pool = ThumbnailWorkerPool(self.scheduler, max_workers=1)
+        owner = StubOwner()
+        owner.broken.add(0)
+        pool.addOwner(owner)
+        self._request(owner, 0, 10)
+        pool.dispatch()
+        # the segment is dropped when a new worker can't start it
+        self.failUnlessEqual(self._busy(pool), [10])
+        first, second = owner.workers
+        self.failUnless(first.destroyed)
+        self.failIf(second.destroyed)
+        self.failUnlessEqual(pool.getWorkerCount(owner), 1)
+        self.failUnlessEqual(pool.bytes, 10)
+        self.failIf(self.scheduler.hasRequests(owner))
+
+    def testBrokenWorker(self):
+        pool = ThumbnailWorkerPool(self.scheduler, max_workers=1)
+        owner = StubOwner()
+        pool.addOwner(owner)
+        self._request(owner, 0)
+        pool.dispatch()
+        first = owner.workers[0]
+        first.broken = True
+        self._request(owner, 10, 20)
+        first.finish(pool)
+
+        # the broken worker is destroyed and its segment given to a new one
+        self.failUnless(first.destroyed)
+        self.failUnlessEqual(self._busy(pool), [10])
+        self.failUnlessEqual(pool.getWorkerCount(owner), 1)
+        self.failUnlessEqual(self.scheduler.getPending(owner), [20])
+
+    def testRemoveOwner(self):
+        pool = ThumbnailWorkerPool(self.scheduler, max_workers=4)
+        owner = StubOwner()
+        pool.addOwner(owner)
+        self._request(owner, 0, 10)
+        pool.dispatch()
+        pool.removeOwner(owner)
+        self.failUnlessEqual(pool.getWorkerCount(), 0)
+        self.failUnlessEqual(pool.bytes, 0)
+        self.failUnless(owner.workers[0].destroyed)
+        self.failIf(pool.busy)
+
+    def testCollect(self):
+        now = [0]
+        pool = ThumbnailWorkerPool(self.scheduler, max_workers=4,
+                clock=lambda: now[0])
+        owner = StubOwner()
+        pool.addOwner(owner)
+        self._request(owner, 0, 10)
+        pool.dispatch()
+        first, second = owner.workers
+        first.finish(pool)
+        now[0] = 10
+        second.finish(pool)
+
+        now[0] = 25
+        self.failUnlessEqual(pool.collect(20), 1)
+        self.failUnless(first.destroyed)
+        self.failIf(second.destroyed)
+        self.failUnlessEqual(pool.getWorkerCount(owner), 1)
+        self.failUnlessEqual(pool.bytes, 10)
+
+        # the workers are created again when needed
+        self._request(owner, 20, 30)
+        pool.dispatch()
+        self.failUnlessEqual(self._busy(pool), [20, 30])
+        self.failUnlessEqual(pool.collect(0), 0)
@@ -0,0 +1,133 @@
+from common import TestCase
+from pitivi.thumbnailscheduler import ThumbnailScheduler
+
+
+class TestThumbnailScheduler(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.scheduler = ThumbnailScheduler()
+
+    def tearDown(self):
+        del self.scheduler
+        TestCase.tearDown(self)
+
+    def testOrder(self):
+        scheduler = self.scheduler
+        requester = object()
+        scheduler.setViewport(100, 200)
+        scheduler.request(requester, "far", 500, 510)
+        scheduler.request(requester, "left", 50, 60)
+        scheduler.request(requester, "visible", 180, 190)
+        scheduler.request(requester, "overlapping", 95, 105)
+
+        # visible requests first, then the closest to the view
+        self.failUnlessEqual(scheduler.pop(requester), "overlapping")
+        self.failUnlessEqual(scheduler.pop(requester), "visible")
+        self.failUnlessEqual(scheduler.pop(requester), "left")
+        self.failUnlessEqual(scheduler.pop(requester), "far")
+        self.failUnlessEqual(scheduler.pop(requester), None)
+        self.failIf(scheduler.hasRequests(requester))
+
+    def testPlayhead(self):
+        scheduler = self.scheduler
+        requester = object()
+        scheduler.setViewport(0, 1000)
+        scheduler.setPlayhead(600)
+        scheduler.request(requester, 1, 100, 110)
+        scheduler.request(requester, 2, 500, 510)
+        scheduler.request(requester, 3, 900, 910)
+        self.failUnlessEqual(scheduler.pop(requester), 2)
+        self.failUnlessEqual(scheduler.pop(requester), 3)
+        self.failUnlessEqual(scheduler.pop(requester), 1)
+
+    def testDeduplicate(self):
+        scheduler = self.scheduler
+        requester = object()
+        other = object()
+        scheduler.setViewport(100, 200)
+        # the same segment drawn by two clips keeps its best position
+        scheduler.request(requester, 0, 1000, 1010)
+        scheduler.request(requester, 0, 150, 160)
+        scheduler.request(requester, 0, 2000, 2010)
+        self.failUnlessEqual(scheduler.pending[requester], {0: (150, 160)})
+
+        scheduler.request(other, 0, 150, 160)
+        self.failUnlessEqual(scheduler.pop(requester), 0)
+        self.failUnlessEqual(scheduler.pop(requester), None)
+        self.failUnlessEqual(scheduler.pop(other), 0)
+
+    def testCancel(self):
+        scheduler = self.scheduler
+        requester = object()
+        scheduler.setViewport(0, 100)
+        for i in xrange(10):
+            scheduler.request(requester, i, i * 20, i * 20 + 10)
+
+        # scrolling cancels the requests which aren't visible anymore
+        scheduler.setViewport(100, 200)
+        self.failUnlessEqual(sorted(scheduler.pending[requester]),
+                [5, 6, 7, 8, 9])
+        self.failUnlessEqual(scheduler.cancelled, 5)
+
+        scheduler.cancel(requester, 5)
+        self.failUnlessEqual(scheduler.pop(requester), 6)
+        scheduler.cancel(requester)
+        self.failIf(scheduler.hasRequests(requester))
+
+        scheduler.setViewport(1000, 1100)
+        self.failUnlessEqual(scheduler.pending, {})
+
+    def testMaxRequests(self):
+        scheduler = self.scheduler
+        requester = object()
+        scheduler.setViewport(0, 100)
+        for i in xrange(10):
+            scheduler.request(requester, i, 1000 - i * 100,
+                    1010 - i * 100, max_requests=3)
+
+        # the visible requests are kept, the furthest ones are dropped
+        self.failUnlessEqual(sorted(scheduler.pending[requester]), [7, 8, 9])
+        self.failUnlessEqual(scheduler.pop(requester), 9)
+
+    def testGetPending(self):
+        scheduler = self.scheduler
+        requester = object()
+        scheduler.setViewport(0, 100)
+        self.failUnlessEqual(scheduler.getPending(requester), [])
+        for i in xrange(5):
+            scheduler.request(requester, i, i * 20, i * 20 + 10)
+
+        pending = scheduler.getPending(requester)
+        pending.sort()
+        self.failUnlessEqual(pending, [0, 1, 2, 3, 4])
+        # the returned list is a copy
+        pending.remove(0)
+        scheduler.cancel(requester, 1)
+        self.failUnlessEqual(sorted(scheduler.getPending(requester)),
+                [0, 2, 3, 4])
+
+    def testBackground(self):
+        scheduler = self.scheduler
+        requester = object()
+        other = object()
+        scheduler.setViewport(0, 100)
+        scheduler.request(requester, 1, 10, 20, background=True)
+        scheduler.request(requester, 2, 500, 510)
+        scheduler.request(other, 3, 1000, 1010)
+
+        # background requests come after the others, even further ones
+        self.failUnlessEqual(scheduler.getRequesters(), [requester, other])
+        self.failUnlessEqual(scheduler.pop(requester), 2)
+        self.failUnlessEqual(scheduler.getRequesters(), [other, requester])
+
+        # a normal request replaces a background one
+        scheduler.request(requester, 1, 10, 20)
+        self.failUnlessEqual(scheduler.background, {})
+        self.failUnlessEqual(scheduler.getRequesters(), [requester, other])
+
+        scheduler.request(other, 4, 0, 10, background=True)
+        scheduler.setViewport(0, 10)
+        self.failUnlessEqual(scheduler.background, {other: set([4])})
+        self.failUnlessEqual(scheduler.pop(other), 4)
+        self.failUnlessEqual(scheduler.background, {})
@@ -0,0 +1,86 @@
+import gst
+
+from common import TestCase
+from pitivi.elements.thumbnailsink import CairoSurfaceThumbnailSink
+
+
+class TestCairoSurfaceThumbnailSink(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.sink = CairoSurfaceThumbnailSink(pool_size=2)
+        self._setSize(4, 2)
+        self.thumbnails = []
+        self.sink.connect("thumbnail", self._thumbnailCb)
+
+    def tearDown(self):
+        del self.thumbnails
+        del self.sink
+        TestCase.tearDown(self)
+
+    def _setSize(self, width, height):
+        caps = gst.Caps("video/x-raw-rgb,width=(int)%d,height=(int)%d" %
+                (width, height))
+        self.failUnless(self.sink.do_set_caps(caps))
+
+    def _thumbnailCb(self, sink, surface, timestamp):
+        self.thumbnails.append((surface, timestamp))
+
+    def _render(self, timestamp):
+        buf = gst.Buffer("\x00" * self.sink.width * self.sink.height * 4)
+        buf.timestamp = timestamp
+        self.failUnlessEqual(self.sink.do_render(buf), gst.FLOW_OK)
+        return self.thumbnails[-1][0]
+
+    def testRender(self):
+        surface = self._render(0)
+        self.failUnlessEqual(self.thumbnails, [(surface, 0)])
+        self.failUnlessEqual(surface.get_width(), 4)
+        self.failUnlessEqual(surface.get_height(), 2)
+
+    def testReleaseRecycles(self):
+        surface = self._render(0)
+        self.sink.releaseSurface(surface)
+        self.failUnless(self._render(1) is surface)
+
+    def testKeptSurfaceNotReused(self):
+        # the surface isn't given back, it's still cached by the receiver
+        kept = self._render(0)
+        released = self._render(1)
+        self.failIf(released is kept)
+        self.sink.releaseSurface(released)
+
+        self.failUnless(self._render(2) is released)
+        self.failIf(self._render(3) in (kept, released))
+
+    def testReleaseTwice(self):
+        surface = self._render(0)
+        self.sink.releaseSurface(surface)
+        self.sink.releaseSurface(surface)
+
+        self.failUnless(self._render(1) is surface)
+        self.failIf(self._render(2) is surface)
+
+    def testPoolSize(self):
+        surfaces = [self._render(i) for i in xrange(3)]
+        for surface in surfaces:
+            self.sink.releaseSurface(surface)
+
+        reused = [self._render(i) for i in xrange(3, 6)]
+        # only pool_size surfaces are kept for the next frames
+        self.failUnlessEqual(len([surface for surface in reused
+                if surface in surfaces]), 2)
+
+    def testSizeChange(self):
+        surface = self._render(0)
+        self._setSize(8, 4)
+        self.sink.releaseSurface(surface)
+
+        other = self._render(1)
+        self.failIf(other is surface)
+        self.failUnlessEqual(other.get_width(), 8)
+
+        # the surfaces kept before the change aren't reused either
+        self.sink.releaseSurface(other)
+        self._setSize(4, 2)
+        self.failIf(self._render(2) is other)
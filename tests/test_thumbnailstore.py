@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+
+from common import TestCase
+from pitivi.thumbnailstore import ThumbnailStore, PACK_MAGIC, RECORD_HEADER
+
+
+class TestThumbnailStore(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.store_directory = os.path.join(self.directory, "thumbnails")
+        self.path = os.path.join(self.directory, "clip.ogg")
+        self.uri = "file://" + self.path
+        self._writeClip("clip data")
+        self.store = ThumbnailStore(self.store_directory)
+
+    def tearDown(self):
+        self.store.close()
+        del self.store
+        shutil.rmtree(self.directory)
+        TestCase.tearDown(self)
+
+    def _writeClip(self, data, mtime=1000):
+        clip = open(self.path, "wb")
+        clip.write(data)
+        clip.close()
+        os.utime(self.path, (mtime, mtime))
+
+    def _thumbnail(self, value, width=4, height=3):
+        return width, height, width * 4, chr(value) * (width * 4 * height)
+
+    def testPutGet(self):
+        pack = self.store.getPack(self.uri, self.path, 50)
+        self.failUnlessEqual(pack.get(0), None)
+
+        pack.put(0, *self._thumbnail(1))
+        pack.put(40, *self._thumbnail(2, width=2))
+        self.store.flush()
+
+        self.failUnlessEqual(pack.get(0), self._thumbnail(1))
+        self.failUnlessEqual(pack.get(40), self._thumbnail(2, width=2))
+        self.failUnlessEqual(pack.get(80), None)
+        self.failUnless(self.store.getPack(self.uri, self.path, 50) is pack)
+
+        # the packs persist across stores
+        self.store.close()
+        self.store = ThumbnailStore(self.store_directory)
+        pack = self.store.getPack(self.uri, self.path, 50)
+        self.failUnlessEqual(pack.get(0), self._thumbnail(1))
+        self.failUnlessEqual(pack.get(40), self._thumbnail(2, width=2))
+
+    def testLoad(self):
+        pack = self.store.getPack(self.uri, self.path, 50)
+        pack.put(0, *self._thumbnail(1))
+
+        loaded = []
+
+        def callback(timestamp, thumbnail):
+            loaded.append((timestamp, thumbnail))
+
+        # the lookups are queued after the writes
+        pack.load(0, callback)
+        pack.load(40, callback)
+        self.store.flush()
+        self.failUnlessEqual(loaded,
+                [(0, self._thumbnail(1)), (40, None)])
+
+    def testKey(self):
+        pack = self.store.getPack(self.uri, self.path, 50)
+        pack.put(0, *self._thumbnail(1))
+        self.store.flush()
+
+        # other heights and modified files have their own packs
+        other = self.store.getPack(self.uri, self.path, 100)
+        self.failIfEqual(other.filename, pack.filename)
+        self.failUnlessEqual(other.get(0), None)
+
+        self._writeClip("clip data", mtime=2000)
+        other = self.store.getPack(self.uri, self.path, 50)
+        self.failIfEqual(other.filename, pack.filename)
+        self.failUnlessEqual(other.get(0), None)
+
+        self.failUnlessEqual(self.store.getPack(self.uri,
+                self.path + ".missing", 50), None)
+
+    def testTruncatedRecord(self):
+        pack = self.store.getPack(self.uri, self.path, 50)
+        pack.put(0, *self._thumbnail(1))
+        pack.put(40, *self._thumbnail(2))
+        self.store.close()
+
+        # simulate a write interrupted in the middle of the last record
+        size = os.path.getsize(pack.filename)
+        packfile = open(pack.filename, "r+b")
+        packfile.truncate(size - 5)
+        packfile.close()
+
+        self.store = ThumbnailStore(self.store_directory)
+        pack = self.store.getPack(self.uri, self.path, 50)
+        self.failUnlessEqual(pack.get(0), self._thumbnail(1))
+        self.failUnlessEqual(pack.get(40), None)
+
+        # the truncated record is overwritten
+        pack.put(80, *self._thumbnail(3))
+        self.store.flush()
+        self.store.close()
+        self.store = ThumbnailStore(self.store_directory)
+        pack = self.store.getPack(self.uri, self.path, 50)
+        self.failUnlessEqual(pack.get(0), self._thumbnail(1))
+        self.failUnlessEqual(pack.get(80), self._thumbnail(3))
+
+    def testPrune(self):
+        pack_size = len(PACK_MAGIC) + RECORD_HEADER.size
+        self.store.max_bytes = 3 * (pack_size + 20)
+
+        packs = []
+        for height in xrange(10):
+            pack = self.store.getPack(self.uri, self.path, height)
+            pack.put(0, *self._thumbnail(height))
+            self.store.flush()
+            # make the pack order explicit, mtimes have a coarse resolution
+            os.utime(pack.filename, (height, height))
+            packs.append(pack)
+
+        self.failUnless(self.store.bytes <= self.store.max_bytes)
+        self.failUnless(os.path.exists(packs[-1].filename))
+        self.failIf(os.path.exists(packs[0].filename))
+        self.failUnlessEqual(packs[0].get(0), None)
+        self.failUnlessEqual(packs[-1].get(0), self._thumbnail(9))
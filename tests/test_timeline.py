@@ -25,7 +25,7 @@ from pitivi.factories.test import AudioTestSourceFactory
 from pitivi.stream import AudioStream, VideoStream
 from pitivi.timeline.timeline import Timeline, TimelineObject, TimelineError, \
         Link, TimelineEdges, MoveContext, TrimStartContext, \
-        TrimEndContext
+        TrimEndContext, RippleSet
 from pitivi.timeline.track import Track, SourceTrackObject, TrackEffect
 from pitivi.utils import UNKNOWN_DURATION
 
@@ -318,6 +318,62 @@ class TestTimelineAddRemoveTimelineObjects(TestCase):
 
         timeline.removeTimelineObject(timeline_object2)
 
+    def testAddRemoveManyTimelineObjects(self):
+        source_factory = StubFactory()
+        stream = AudioStream(gst.Caps('audio/x-raw-int'))
+        source_factory.addOutputStream(stream)
+        timeline = Timeline()
+        track = Track(stream)
+        timeline.addTrack(track)
+
+        timeline_objects = []
+        for start in (10, 0):
+            track_object = SourceTrackObject(source_factory, stream)
+            track.addTrackObject(track_object)
+            timeline_object = TimelineObject(source_factory)
+            timeline_object.addTrackObject(track_object)
+            timeline_object.start = start * gst.SECOND
+            timeline_object.duration = 10 * gst.SECOND
+            timeline_objects.append(timeline_object)
+
+        # objects without track objects are rejected before adding anything
+        self.failUnlessRaises(TimelineError, timeline.addTimelineObjects,
+                timeline_objects + [TimelineObject(source_factory)])
+        self.failUnlessEqual(timeline.timeline_objects, [])
+
+        timeline.addTimelineObjects(timeline_objects)
+        self.failUnlessEqual(timeline.timeline_objects,
+                [timeline_objects[1], timeline_objects[0]])
+        self.failUnlessEqual(list(timeline.edges.edges),
+                [0, 10 * gst.SECOND, 20 * gst.SECOND])
+        self.failUnlessRaises(TimelineError, timeline.addTimelineObjects,
+                timeline_objects[:1])
+
+        timeline.removeTimelineObjects(timeline_objects, deep=True)
+        self.failUnlessEqual(timeline.timeline_objects, [])
+        self.failUnlessEqual(list(timeline.edges.edges), [])
+        self.failUnlessEqual(track.track_objects, [])
+        self.failUnlessRaises(TimelineError, timeline.removeTimelineObjects,
+                timeline_objects[:1])
+
+    def testAddSourceFactories(self):
+        source_factory = StubFactory()
+        stream = AudioStream(gst.Caps('audio/x-raw-int'))
+        source_factory.addOutputStream(stream)
+        timeline = Timeline()
+        track = Track(stream)
+        timeline.addTrack(track)
+
+        timeline_objects = timeline.addSourceFactories(
+                [source_factory, source_factory])
+        self.failUnlessEqual([obj.start for obj in timeline_objects],
+                [0, source_factory.duration])
+
+        timeline_objects = timeline.addSourceFactories([source_factory],
+                start=100 * gst.SECOND)
+        self.failUnlessEqual(timeline_objects[0].start, 100 * gst.SECOND)
+        self.failUnlessEqual(len(track.track_objects), 3)
+
     def testRemoveFactory(self):
         source_factory = StubFactory()
         stream = AudioStream(gst.Caps("audio/x-raw-int"))
@@ -720,6 +776,30 @@ class TestTimeline(TestCase):
             min_priority=3, max_priority=4)
         self.failUnlessEqual(result, tmp_obj_list)
 
+    def testGetObjsAtTimeWithPriority(self):
+        obj1 = self.makeTimelineObject()
+        obj2 = self.makeTimelineObject()
+
+        obj1.start = 0
+        obj1.duration = 10 * gst.SECOND
+        obj2.start = 5 * gst.SECOND
+        obj2.duration = 10 * gst.SECOND
+
+        time = 7 * gst.SECOND
+        self.failUnlessEqual(self.timeline.getObjsAtTime(time), [obj1, obj2])
+        self.failUnlessEqual(self.timeline.getObjsAtTime(time, 1, 1), [])
+
+        obj2.priority = 1
+        self.failUnlessEqual(self.timeline.getObjsAtTime(time, 1, 1), [obj2])
+        self.failUnlessEqual(self.timeline.getObjsToAddEffectTo(time, 0),
+                [obj1])
+
+        obj1.start = 6 * gst.SECOND
+        self.failUnlessEqual(self.timeline.getObjsAtTime(time), [obj2, obj1])
+
+        self.timeline.removeTimelineObject(obj2, deep=True)
+        self.failUnlessEqual(self.timeline.getObjsAtTime(time), [obj1])
+
     def testGetKeyframe(self):
         timeline_object0 = self.makeTimelineObject()
         timeline_object1 = self.makeTimelineObject()
@@ -804,10 +884,193 @@ class TestTimeline(TestCase):
 
         position = 8.5 * gst.SECOND
         interpolator = other_object2.track_objects[0].getInterpolator("volume")
-        interpolator.newKeyframe(position)
+        keyframe = interpolator.newKeyframe(position)
         result = timeline.getNextKeyframe(time2)
         self.failUnlessEqual(result, 10.5 * gst.SECOND)
 
+        keyframe.time = 9 * gst.SECOND
+        result = timeline.getNextKeyframe(time2)
+        self.failUnlessEqual(result, 11 * gst.SECOND)
+
+        interpolator.removeKeyframe(keyframe)
+        result = timeline.getNextKeyframe(time2)
+        self.failUnlessEqual(result, 12 * gst.SECOND)
+
+        timeline.removeTimelineObject(other_object2, deep=True)
+        result = timeline.getNextKeyframe(time2)
+        self.failUnlessEqual(result, 15 * gst.SECOND)
+
+    def testTransaction(self):
+        timeline_object1 = self.makeTimelineObject()
+        timeline_object2 = self.makeTimelineObject()
+        timeline_object1.start = 0
+        timeline_object2.start = 10 * gst.SECOND
+        track_object1 = timeline_object1.track_objects[0]
+
+        monitor = SignalMonitor(timeline_object1, 'start-changed',
+                'priority-changed')
+        track_monitor = SignalMonitor(track_object1, 'start-changed')
+
+        self.timeline.beginTransaction()
+        # nested transactions are committed by the outermost one
+        self.timeline.beginTransaction()
+        timeline_object1.start = 20 * gst.SECOND
+        timeline_object1.priority = 1
+        self.timeline.commitTransaction()
+        timeline_object1.start = 30 * gst.SECOND
+        self.failUnlessEqual(monitor.start_changed_count, 0)
+        self.failUnlessEqual(monitor.priority_changed_count, 0)
+        self.failUnlessEqual(track_monitor.start_changed_count, 0)
+        self.timeline.commitTransaction()
+
+        self.failUnlessEqual(monitor.start_changed_collect,
+                [(30 * gst.SECOND,)])
+        self.failUnlessEqual(monitor.priority_changed_collect, [(1,)])
+        self.failUnlessEqual(track_monitor.start_changed_collect,
+                [(30 * gst.SECOND,)])
+        self.failUnlessEqual(self.timeline.timeline_objects,
+                [timeline_object2, timeline_object1])
+        self.failUnlessEqual(self.timeline.getObjsAtTime(35 * gst.SECOND),
+                [timeline_object1])
+
+        self.failUnlessRaises(TimelineError, self.timeline.commitTransaction)
+
+        # outside of transactions notifications are emitted right away
+        timeline_object1.start = 0
+        self.failUnlessEqual(monitor.start_changed_count, 2)
+
+        monitor.disconnectFromObj(timeline_object1)
+        track_monitor.disconnectFromObj(track_object1)
+
+    def _moveEach(self, timeline_objects, starts, priorities=None):
+        # move the objects one by one within a transaction
+        self.timeline.beginTransaction()
+        try:
+            for timeline_object, start in zip(timeline_objects, starts):
+                if timeline_object.start != start:
+                    timeline_object.setStart(start)
+
+            if priorities is not None:
+                for timeline_object, priority in \
+                        zip(timeline_objects, priorities):
+                    if timeline_object.priority != priority:
+                        timeline_object.setPriority(priority)
+        finally:
+            self.timeline.commitTransaction()
+
+    def _recordMoves(self, timeline_objects, move, *args):
+        # the position signals of the objects and of their track objects, in
+        # emission order
+        emitted = []
+
+        def signalCb(obj, value, signame):
+            emitted.append((obj, signame, value))
+
+        objs = list(timeline_objects)
+        for timeline_object in timeline_objects:
+            objs.extend(timeline_object.track_objects)
+        for obj in objs:
+            obj.connect('start-changed', signalCb, 'start-changed')
+            obj.connect('priority-changed', signalCb, 'priority-changed')
+        move(*args)
+        for obj in objs:
+            obj.disconnect_by_func(signalCb)
+
+        return emitted
+
+    def _makeRow(self, count):
+        timeline_objects = []
+        for index in xrange(count):
+            timeline_object = self.makeTimelineObject()
+            timeline_object.start = index * 10 * gst.SECOND
+            timeline_object.duration = 10 * gst.SECOND
+            timeline_objects.append(timeline_object)
+
+        return timeline_objects
+
+    def testMoveTimelineObjects(self):
+        timeline_objects = self._makeRow(4)
+        original_starts = [timeline_object.start
+                for timeline_object in timeline_objects]
+        original_priorities = [0, 0, 0, 0]
+        # the first object doesn't move, the last two swap
+        starts = [0, 15 * gst.SECOND, 50 * gst.SECOND, 40 * gst.SECOND]
+        priorities = [0, 1, 0, 2]
+
+        expected = self._recordMoves(timeline_objects, self._moveEach,
+                timeline_objects, starts, priorities)
+        expected_order = list(self.timeline.timeline_objects)
+        self._moveEach(timeline_objects, original_starts,
+                original_priorities)
+
+        emitted = self._recordMoves(timeline_objects,
+                self.timeline.moveTimelineObjects, timeline_objects, starts,
+                priorities)
+        self.failUnlessEqual(emitted, expected)
+        self.failUnlessEqual([timeline_object.start
+                for timeline_object in timeline_objects], starts)
+        self.failUnlessEqual([timeline_object.priority
+                for timeline_object in timeline_objects], priorities)
+        self.failUnlessEqual(self.timeline.timeline_objects, expected_order)
+        self.failUnlessEqual(self.track1.track_objects,
+                [timeline_object.track_objects[0]
+                for timeline_object in expected_order])
+        self.failUnlessEqual(self.timeline.getObjsAtTime(45 * gst.SECOND),
+                [timeline_objects[3]])
+        self.failUnlessEqual(self.timeline.getObjsAtTime(20 * gst.SECOND,
+                1, 1), [timeline_objects[1]])
+
+        # objects that don't move aren't notified
+        emitted = self._recordMoves(timeline_objects,
+                self.timeline.moveTimelineObjects, timeline_objects, starts,
+                priorities)
+        self.failUnlessEqual(emitted, [])
+
+    def testRippleSet(self):
+        timeline_objects = self._makeRow(3)
+        timeline_objects[1].priority = 1
+        original_starts = [0, 10 * gst.SECOND, 20 * gst.SECOND]
+        original_priorities = [0, 1, 0]
+        ripple = RippleSet(self.timeline, timeline_objects, 10 * gst.SECOND,
+                1)
+        self.failUnlessEqual(len(ripple), 3)
+        self.failUnlessEqual(ripple.getMinimumOffset(), -10 * gst.SECOND)
+        self.failUnlessEqual(ripple.getEnd(), 30 * gst.SECOND)
+
+        starts = [5 * gst.SECOND, 15 * gst.SECOND, 25 * gst.SECOND]
+        priorities = [1, 2, 1]
+        expected_move = self._recordMoves(timeline_objects, self._moveEach,
+                timeline_objects, starts, priorities)
+        expected_restore = self._recordMoves(timeline_objects,
+                self._moveEach, timeline_objects, original_starts,
+                original_priorities)
+
+        emitted = self._recordMoves(timeline_objects, ripple.moveTo,
+                15 * gst.SECOND, 2)
+        self.failUnlessEqual(emitted, expected_move)
+        self.failUnlessEqual([timeline_object.start
+                for timeline_object in timeline_objects], starts)
+        self.failUnlessEqual([timeline_object.priority
+                for timeline_object in timeline_objects], priorities)
+
+        emitted = self._recordMoves(timeline_objects, ripple.restore)
+        self.failUnlessEqual(emitted, expected_restore)
+        self.failUnlessEqual([timeline_object.start
+                for timeline_object in timeline_objects], original_starts)
+        self.failUnlessEqual([timeline_object.priority
+                for timeline_object in timeline_objects],
+                original_priorities)
+
+        # without a priority only the starts change
+        ripple.moveTo(10 * gst.SECOND + 1)
+        self.failUnlessEqual([timeline_object.start
+                for timeline_object in timeline_objects],
+                [1, 10 * gst.SECOND + 1, 20 * gst.SECOND + 1])
+        self.failUnlessEqual([timeline_object.priority
+                for timeline_object in timeline_objects],
+                original_priorities)
+        self.failUnlessEqual(self.timeline.timeline_objects, timeline_objects)
+
 
 class TestLink(TestCase):
 
@@ -1104,6 +1367,41 @@ class TestTimelineEdges(TestCase):
         track_object2.release()
         del source_factory
 
+    def testRebuild(self):
+        source_factory = StubFactory()
+        stream = AudioStream(gst.Caps("meh"))
+        source_factory.addOutputStream(stream)
+        timeline_objects = []
+        for start in (0, 1000, 1000, 3000):
+            track_object = SourceTrackObject(source_factory, stream)
+            track_object.start = start
+            track_object.duration = 1000
+            timeline_object = TimelineObject(source_factory)
+            timeline_object.addTrackObject(track_object)
+            timeline_objects.append(timeline_object)
+
+        self.timeline_edges.addTimelineObject(timeline_objects[0])
+        self.timeline_edges.rebuild(timeline_objects[1:])
+        self.failUnlessEqual(list(self.timeline_edges.edges),
+                [1000, 2000, 3000, 4000])
+        self.failUnlessEqual(self.timeline_edges.edges.count(2000), 2)
+        self.failUnlessEqual(self.timeline_edges.getObjsIncidentOnTime(0), [])
+
+        # the objects we dropped are no longer tracked
+        timeline_objects[0].start = 5000
+        self.failIf(5000 in self.timeline_edges.edges)
+
+        timeline_objects[3].start = 5000
+        self.failUnlessEqual(list(self.timeline_edges.edges),
+                [1000, 2000, 5000, 6000])
+
+        for timeline_object in timeline_objects:
+            if timeline_object in self.timeline_edges.timeline_objects:
+                self.timeline_edges.removeTimelineObject(timeline_object)
+            for track_object in list(timeline_object.track_objects):
+                track_object.release()
+        self.failUnlessEqual(len(self.timeline_edges.edges), 0)
+
 
 class TestTimelineAddFactory(TestCase):
     def setUp(self):
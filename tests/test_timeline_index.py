@@ -0,0 +1,215 @@
+# PiTiVi , Non-linear video editor
+#
+#       tests/test_timeline_index.py
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+from unittest import TestCase
+import random
+
+from pitivi.timeline.index import TimelineIndex, TimelineIndexError, \
+        SortedTimes
+
+
+class FakeObject(object):
+    def __init__(self, start, duration, priority=0):
+        self.start = start
+        self.duration = duration
+        self.priority = priority
+
+    def __repr__(self):
+        return "<FakeObject %s+%s @%s>" % (self.start, self.duration,
+                self.priority)
+
+
+class TestTimelineIndex(TestCase):
+    def setUp(self):
+        self.index = TimelineIndex()
+        self.objects = []
+
+    def add(self, start, duration, priority=0):
+        obj = FakeObject(start, duration, priority)
+        self.index.addObject(obj)
+        self.objects.append(obj)
+        return obj
+
+    def sortedObjects(self, predicate):
+        # the index keeps objects with the same start in insertion order
+        objs = [obj for obj in self.objects if predicate(obj)]
+        objs.sort(key=lambda obj: obj.start)
+        return objs
+
+    def testAddRemove(self):
+        obj = self.add(0, 10)
+        self.failUnlessRaises(TimelineIndexError, self.index.addObject, obj)
+        self.failUnlessEqual(len(self.index), 1)
+
+        self.index.removeObject(obj)
+        self.failUnlessEqual(len(self.index), 0)
+        self.failUnlessEqual(self.index.layers, {})
+        self.failUnlessRaises(TimelineIndexError,
+                self.index.removeObject, obj)
+
+    def testAtTime(self):
+        obj1 = self.add(20, 50)
+        obj2 = self.add(10, 40)
+        obj3 = self.add(25, 50, priority=1)
+        obj4 = self.add(100, 40)
+
+        self.failUnlessEqual(self.index.getObjsAtTime(0), [])
+        self.failUnlessEqual(self.index.getObjsAtTime(30), [obj2, obj1, obj3])
+        self.failUnlessEqual(self.index.getObjsAtTime(60), [obj1, obj3])
+        self.failUnlessEqual(self.index.getObjsAtTime(100), [])
+        self.failUnlessEqual(self.index.getObjsAtTime(100, closed=True),
+                [obj4])
+        self.failUnlessEqual(self.index.getObjsAtTime(30, 1, 1), [obj3])
+
+    def testStartingBetween(self):
+        obj1 = self.add(0, 50, priority=1)
+        obj2 = self.add(50, 50, priority=2)
+        obj3 = self.add(80, 50, priority=3)
+        obj4 = self.add(150, 50, priority=4)
+
+        index = self.index
+        self.failUnlessEqual(index.getObjsStartingBetween(low=50),
+                [obj2, obj3, obj4])
+        self.failUnlessEqual(index.getObjsStartingBetween(high=90,
+                max_end=90), [obj1])
+        self.failUnlessEqual(index.getObjsStartingBetween(0, 140, 140,
+                min_priority=3, max_priority=4), [obj3])
+
+    def testUpdate(self):
+        obj1 = self.add(0, 10)
+        obj2 = self.add(0, 10)
+
+        self.failUnlessEqual(self.index.getObjsAtTime(5), [obj1, obj2])
+
+        # moving an object puts it after the objects with the same start
+        self.index.updateObject(obj1, reorder=True)
+        self.failUnlessEqual(self.index.getObjsAtTime(5), [obj2, obj1])
+
+        obj2.start = 20
+        self.index.updateObject(obj2)
+        self.failUnlessEqual(self.index.getObjsAtTime(5), [obj1])
+        self.failUnlessEqual(self.index.getObjsAtTime(25), [obj2])
+
+        obj1.duration = 30
+        obj1.priority = 2
+        self.index.updateObject(obj1)
+        self.failUnlessEqual(self.index.getObjsAtTime(25), [obj1, obj2])
+        self.failUnlessEqual(self.index.getObjsAtTime(25, 2, 2), [obj1])
+        self.failUnlessEqual(sorted(self.index.layers.keys()), [0, 2])
+
+    def testRandom(self):
+        rand = random.Random(42)
+        for i in xrange(500):
+            self.add(rand.randint(0, 1000), rand.randint(0, 100),
+                    rand.randint(0, 3))
+
+        for i in xrange(200):
+            obj = rand.choice(self.objects)
+            obj.start = rand.randint(0, 1000)
+            obj.duration = rand.randint(0, 100)
+            self.index.updateObject(obj)
+
+        for i in xrange(100):
+            obj = self.objects.pop(rand.randrange(len(self.objects)))
+            self.index.removeObject(obj)
+
+        for i in xrange(50):
+            time = rand.randint(0, 1100)
+            other = rand.randint(time, 1100)
+
+            self.failUnlessEqual(
+                    set(self.index.getObjsAtTime(time)),
+                    set(self.sortedObjects(lambda obj: obj.start < time and
+                            obj.start + obj.duration > time)))
+            self.failUnlessEqual(
+                    set(self.index.getObjsStartingBetween(low=time)),
+                    set(self.sortedObjects(lambda obj: obj.start >= time)))
+            self.failUnlessEqual(
+                    set(self.index.getObjsStartingBetween(time, other, other,
+                            1, 2)),
+                    set(self.sortedObjects(lambda obj: obj.start >= time and
+                            obj.start + obj.duration <= other and
+                            1 <= obj.priority <= 2)))
+
+            starts = [obj.start for obj in self.index.getObjsAtTime(time)]
+            self.failUnlessEqual(starts, sorted(starts))
+
+
+class TestSortedTimes(TestCase):
+    def setUp(self):
+        self.times = SortedTimes()
+        # make sure we exercise block splitting
+        self.times.BLOCK_SIZE = 4
+
+    def testAddRemove(self):
+        self.times.add(10)
+        self.times.add(10)
+        self.times.add(5)
+        self.failUnlessEqual(list(self.times), [5, 10])
+        self.failUnlessEqual(self.times.count(10), 2)
+
+        self.times.remove(10)
+        self.failUnlessEqual(list(self.times), [5, 10])
+        self.times.remove(10)
+        self.failUnlessEqual(list(self.times), [5])
+        self.failUnlessRaises(KeyError, self.times.remove, 10)
+
+    def testClosest(self):
+        self.failUnlessRaises(ValueError, self.times.closest, 0)
+
+        self.times.update([1000, 2000])
+        self.failUnlessEqual(self.times.closest(900), (1000, 100))
+        self.failUnlessEqual(self.times.closest(1000), (1000, 0))
+        self.failUnlessEqual(self.times.closest(1400), (1000, 400))
+        self.failUnlessEqual(self.times.closest(1500), (2000, 500))
+        self.failUnlessEqual(self.times.closest(3000), (2000, 1000))
+
+        self.failUnlessEqual(self.times.before(1000), None)
+        self.failUnlessEqual(self.times.before(1001), 1000)
+        self.failUnlessEqual(self.times.after(1000), 2000)
+        self.failUnlessEqual(self.times.after(2000), None)
+
+    def testRandom(self):
+        rand = random.Random(42)
+        reference = {}
+        for i in xrange(2000):
+            time = rand.randint(0, 300)
+            if reference.get(time) and rand.random() < 0.5:
+                self.times.remove(time)
+                reference[time] -= 1
+                if not reference[time]:
+                    del reference[time]
+            else:
+                self.times.add(time)
+                reference[time] = reference.get(time, 0) + 1
+
+        expected = sorted(reference)
+        self.failUnlessEqual(list(self.times), expected)
+        self.failUnlessEqual(len(self.times), len(expected))
+        for i, time in enumerate(expected):
+            self.failUnlessEqual(self.times[i], time)
+            self.failUnlessEqual(self.times.index(time), i)
+
+        bulk = SortedTimes()
+        bulk.BLOCK_SIZE = 4
+        for time, count in reference.iteritems():
+            bulk.update([time] * count)
+        self.failUnlessEqual(list(bulk), expected)
+        for time in expected:
+            self.failUnlessEqual(bulk.count(time), reference[time])
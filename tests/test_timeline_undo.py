@@ -26,7 +26,8 @@ gobject.threads_init()
 import gst
 
 from pitivi.pipeline import Pipeline
-from pitivi.timeline.timeline import Timeline, TimelineObject, SELECT_ADD
+from pitivi.timeline.timeline import Timeline, TimelineObject, SELECT_ADD, \
+        RippleSet
 from pitivi.timeline.track import Track, SourceTrackObject, TrackEffect
 from pitivi.factories.test import VideoTestSourceFactory, TestEffectFactory
 from pitivi.stream import VideoStream
@@ -259,6 +260,41 @@ class  TestTimelineUndo(TestCase):
         self.action_log.redo()
         self.failUnlessEqual(self.timeline_object1.priority, 20)
 
+    def testRippleSet(self):
+        stacks = []
+
+        def commitCb(action_log, stack, nested):
+            stacks.append(stack)
+        self.action_log.connect("commit", commitCb)
+
+        self.timeline_object1.start = 5 * gst.SECOND
+        self.timeline_object1.duration = 20 * gst.SECOND
+        self.timeline_object1.priority = 1
+        self.timeline.addTimelineObject(self.timeline_object1)
+        ripple = RippleSet(self.timeline, [self.timeline_object1], 0, 0)
+        self.action_log.begin("ripple")
+        ripple.moveTo(10 * gst.SECOND, 2)
+        self.action_log.commit()
+
+        # the same actions as when setting the properties one by one
+        self.failUnlessEqual(len(stacks), 1)
+        stack = stacks[0]
+        self.failUnlessEqual([(action.property_name, action.old_value,
+                action.new_value) for action in stack.done_actions],
+                [("start", 5 * gst.SECOND, 15 * gst.SECOND),
+                ("priority", 1, 3)])
+
+        self.action_log.undo()
+        self.failUnlessEqual(self.timeline_object1.start, 5 * gst.SECOND)
+        self.failUnlessEqual(self.timeline_object1.priority, 1)
+        self.failUnlessEqual(self.track_object2.start, 5 * gst.SECOND)
+        self.failUnlessEqual(self.track_object2.priority, 1)
+        self.action_log.redo()
+        self.failUnlessEqual(self.timeline_object1.start, 15 * gst.SECOND)
+        self.failUnlessEqual(self.timeline_object1.priority, 3)
+        self.failUnlessEqual(self.track_object2.start, 15 * gst.SECOND)
+        self.failUnlessEqual(self.track_object2.priority, 3)
+
     def testUngroup(self):
         self.timeline_object1.start = 5 * gst.SECOND
         self.timeline_object1.duration = 20 * gst.SECOND
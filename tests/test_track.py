@@ -414,6 +414,50 @@ class TestTrack(TestCase):
         track1.removeTrackObject(obj2)
         self.failUnlessEqual(obj2.track, None)
 
+    def testAddRemoveManyObjects(self):
+        track1 = self.track1
+        track2 = self.track2
+
+        objs = []
+        for start in (20, 0, 10):
+            obj = SourceTrackObject(self.factory, self.stream)
+            obj.start = start * gst.SECOND
+            obj.duration = 10 * gst.SECOND
+            objs.append(obj)
+
+        added = []
+        track1.connect('track-object-added',
+                lambda track, obj: added.append(obj))
+        track1.addTrackObjects(objs)
+        self.failUnlessEqual(added, objs)
+        self.failUnlessEqual(track1.track_objects,
+                [objs[1], objs[2], objs[0]])
+        for obj in objs:
+            self.failUnlessEqual(obj.track, track1)
+
+        # can't add twice, neither to the same track nor to another one
+        self.failUnlessRaises(TrackError, track1.addTrackObjects, objs[:1])
+        self.failUnlessRaises(TrackError, track2.addTrackObjects, objs[:1])
+
+        # the objects added one by one and in a batch are kept sorted
+        obj4 = SourceTrackObject(self.factory, self.stream)
+        obj4.start = 5 * gst.SECOND
+        track1.addTrackObject(obj4)
+        self.failUnlessEqual(track1.track_objects,
+                [objs[1], obj4, objs[2], objs[0]])
+
+        track1.removeTrackObjects([objs[0], obj4])
+        self.failUnlessEqual(track1.track_objects, [objs[1], objs[2]])
+        self.failUnlessEqual(objs[0].track, None)
+        self.failUnlessEqual(obj4.track, None)
+
+        # can't remove twice
+        self.failUnlessRaises(TrackError, track1.removeTrackObjects,
+                [objs[0]])
+
+        track1.removeTrackObjects([objs[1], objs[2]])
+        self.failUnlessEqual(track1.track_objects, [])
+
     def testRemoveAllTrackObjects(self):
         track = self.track1
         factory = self.factory
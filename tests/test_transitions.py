@@ -702,3 +702,58 @@ class TestTransitions(TestCase):
         track1.enableUpdates()
         expected = ["abcmdifghjkl", [0, 1, 2, 0, 3, 0, 5, 2, 3, 4, 5, 0]]
         verify_result(expected)
+
+    def testUpdateOnlyChangedLayers(self):
+        factory = self.factory
+        stream = self.stream
+        track1 = self.track1
+
+        test_data = [
+            ("a", 0, 10, 0),
+            ("b", 5, 15, 0),
+            ("c", 0, 10, 1),
+            ("d", 5, 15, 1),
+            ("e", 30, 40, 1),
+        ]
+
+        objs = {}
+        names = {}
+        for name, start, end, priority in test_data:
+            obj = SourceTrackObject(factory, stream)
+            obj.start = start * gst.SECOND
+            obj.in_point = 0
+            obj.duration = end * gst.SECOND - obj.start
+            obj.media_duration = obj.duration
+            obj.priority = priority
+            names[obj] = name
+            objs[name] = obj
+            track1.addTrackObject(obj)
+
+        self.failUnlessEqual(set((names[a], names[b])
+                for a, b in track1.transitions), set([("a", "b"), ("c", "d")]))
+
+        evaluated = []
+        getSegmentSlots = track1._getSegmentSlots
+
+        def getSegmentSlotsCb(objs, index):
+            evaluated.append(names[objs[index]])
+            return getSegmentSlots(objs, index)
+
+        track1._getSegmentSlots = getSegmentSlotsCb
+
+        # moving e only re-evaluates its own overlap group in layer 1
+        objs["e"].start = 12 * gst.SECOND
+        track1.updateTransitions()
+        self.failUnlessEqual(evaluated, ["c"])
+        self.failUnlessEqual(set((names[a], names[b])
+                for a, b in track1.transitions),
+                set([("a", "b"), ("c", "d"), ("d", "e")]))
+
+        del track1._getSegmentSlots
+        self.failUnlessEqual(track1.max_priority, 1)
+        objs["e"].priority = 3
+        self.failUnlessEqual(track1.max_priority, 3)
+        track1.removeTrackObject(objs["e"])
+        self.failUnlessEqual(track1.max_priority, 1)
+        self.failUnlessEqual(set((names[a], names[b])
+                for a, b in track1.transitions), set([("a", "b"), ("c", "d")]))
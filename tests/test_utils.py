@@ -25,7 +25,7 @@ from unittest import TestCase
 import gobject
 gobject.threads_init()
 import gst
-from pitivi.utils import beautify_length
+from pitivi.utils import beautify_length, start_reinsort_right
 
 second = gst.SECOND
 minute = second * 60
@@ -52,3 +52,35 @@ class TestBeautifyLength(TestCase):
     def testBeautifyHoursAndMinutes(self):
         self.failUnlessEqual(beautify_length(hour + minute + second),
                 "1 hour, 1 minute")
+
+
+class StartObject(object):
+    def __init__(self, start):
+        self.start = start
+
+
+class TestStartReinsortRight(TestCase):
+    def testInOrder(self):
+        objs = [StartObject(start) for start in (0, 10, 10, 20)]
+        expected = list(objs)
+
+        start_reinsort_right(objs, objs[0])
+        self.failUnlessEqual(objs, expected)
+
+        # an object goes after the other objects with the same start
+        obj = objs[1]
+        start_reinsort_right(objs, obj)
+        self.failUnlessEqual(objs,
+                [expected[0], expected[2], expected[1], expected[3]])
+
+    def testOutOfOrder(self):
+        objs = [StartObject(start) for start in (0, 10, 20, 30)]
+        obj1, obj2, obj3, obj4 = objs
+
+        obj1.start = 25
+        start_reinsort_right(objs, obj1)
+        self.failUnlessEqual(objs, [obj2, obj3, obj1, obj4])
+
+        obj4.start = 10
+        start_reinsort_right(objs, obj4)
+        self.failUnlessEqual(objs, [obj2, obj4, obj3, obj1])